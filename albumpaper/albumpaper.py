@@ -1,42 +1,83 @@
 import contextlib
-import ctypes
 import functools
+import json
 import logging
 import logging.handlers
-import os
 import sys
 import threading
-import time
+from collections.abc import Callable
+from concurrent.futures import Future
 from pathlib import Path
-import winreg
 
 import imagegen
 import misc
+import platforms
 import requests
 import spotipy
-import winapi
 import xxhash
-from configuration import AppPaths, ConfigManager
+from analysis import AnalysisWorker
+from configuration import AppPaths, ConfigKey, ConfigManager, ConfigSnapshot
 from misc import GenerateNew, SetDefault, SetPrevious, Unchanged, WallpaperAction
+from nowplaying import NowPlaying, NowPlayingSource
 from PIL import Image
+from pipeline import RenderPipeline
+from power import PowerGovernor
+from preview import Previews
 from PySide6 import QtCore, QtGui, QtWidgets
 from spotifyauth import SpotifyAuth
 from ui import SystemTrayIcon
-from wallpaper import GenerateWallpaper, WindowsWallpaper
+from wallpaper import (
+    DesktopWallpaper,
+    GenerateWallpaper,
+    configure_render_pool,
+    screen_geometry,
+)
+
+
+SPOTIFY_CODE_MAX_WIDTH = 2000  # largest width scannables.scdn.co serves
+# Last.fm serves any of these by replacing the size in the URL
+LASTFM_IMAGE_SIZES = {34: "34s", 64: "64s", 174: "174s", 300: "300x300", 600: "600x600"}
+# Image id of Last.fm's grey star placeholder for tracks without artwork
+LASTFM_MISSING_ART_ID = "2a96cbd8b46e442fc41c2b86b821562f"
 
 
 class CurrentArt:
-    def __init__(self, service: int) -> None:
+    def __init__(self, service: int, on_push: Callable[[], None] | None = None) -> None:
+        """
+        `on_push` is called when a pushed service has a new track
+        """
+        # Pushed services aren't polled, see local_track
+        self.pushed = service == 2  # noqa: PLR2004
+        self.now_playing: NowPlayingSource | None = None
+
         if service == 1:  # using lastfm
             self.current_track = self.lastfm_track
+        elif self.pushed:  # pushed by a local player or tool
+            self.current_track = self.local_track
+            port = ConfigManager.settings["service"]["local_port"]
+            try:
+                self.now_playing = NowPlayingSource(
+                    port,
+                    ConfigManager.settings["service"]["local_token"],
+                    on_push or (lambda: None),
+                )
+            except OSError:
+                app_log.exception("Now playing listener error")
+                tray_icon.showMessage(f"Port {port} is in use, choose another", "")
         else:
             self.current_track = self.spotify_track
             self.spotify = SpotifyAuth(tray_icon.showMessage)
 
-        self.host_device_name = os.environ["COMPUTERNAME"]
+        self.host_device_name = platforms.current().host_name()
 
         self.previous_playback_state = None
         self.previously_generated_track = None
+        # Track.identity of the wallpaper rendered before a restart
+        self.restored_track: str | None = None
+        # See GenerateWallpaper.required_artwork_size
+        self.artwork_size: int | None = None
+        # See PowerPolicy.prefetch
+        self.prefetch = True
 
     def spotify_track(self) -> GenerateNew | SetDefault | None:
         try:
@@ -47,7 +88,8 @@ class CurrentArt:
                 not ConfigManager.settings["service"]["is_device_specific"]
                 or current["device"]["name"] == self.host_device_name
             ):
-                return GenerateNew(SpotifyTrack(current))
+                track = SpotifyTrack(current, artwork_size=self.artwork_size)
+                return GenerateNew(track)
 
         except spotipy.client.SpotifyException:  # Token expired
             self.spotify.refresh_token()
@@ -92,7 +134,9 @@ class CurrentArt:
 
         try:
             if current["@attr"]["nowplaying"].lower() == "true":
-                return GenerateNew(LastfmTrack(lastfm_response))
+                return GenerateNew(
+                    LastfmTrack(lastfm_response, artwork_size=self.artwork_size),
+                )
 
             # when track is not playing
             return SetDefault()
@@ -101,7 +145,20 @@ class CurrentArt:
 
         return Unchanged()
 
-    def current_wallpaper_action(self) -> WallpaperAction:
+    def local_track(self) -> Unchanged | SetDefault | GenerateNew:
+        now_playing = None if self.now_playing is None else self.now_playing.latest()
+        # Nothing pushed since starting, the wallpaper shown before is kept
+        if now_playing is None:
+            return Unchanged()
+        if not now_playing.playing:
+            return SetDefault()
+        return GenerateNew(LocalTrack(now_playing, artwork_size=self.artwork_size))
+
+    def close(self) -> None:
+        if self.now_playing is not None:
+            self.now_playing.close()
+
+    def current_wallpaper_action(self) -> WallpaperAction:  # noqa: PLR0911
         wallpaper_action: GenerateNew | SetDefault | Unchanged = self.current_track()
 
         if wallpaper_action == self.previous_playback_state:
@@ -120,11 +177,21 @@ class CurrentArt:
         if track == self.previously_generated_track:
             return SetPrevious()
 
+        if self.restored_track is not None and track.identity == self.restored_track:
+            # Already rendered with the same settings before the restart
+            self.restored_track = None
+            self.previously_generated_track = track
+            return SetPrevious()
+
+        if self.prefetch:
+            track.prefetch()
         artwork = track.artwork
         if artwork is None:
             return SetDefault()
 
         self.previously_generated_track = track
+        # The new render replaces the restored wallpaper
+        self.restored_track = None
 
         wallpaper_action: GenerateNew
 
@@ -132,32 +199,146 @@ class CurrentArt:
 
 
 class Track:
+    # Artwork width in px: URL
+    image_urls: dict[int, str]
+
+    def __init__(self, artwork_size: int | None) -> None:
+        # Smallest artwork width the render needs, None for the largest available
+        self.artwork_size = artwork_size
+        # Decoded width (None for the largest available): artwork
+        self._pyramid: dict[int | None, Image.Image] = {}
+        # Requested widths with no artwork
+        self._missing: set[int | None] = set()
+        # Widths being decoded, so a width requested by the prefetch, worker and
+        # preview threads at once is decoded once
+        self._loading: dict[int | None, Future[Image.Image | None]] = {}
+        self._artwork_lock = threading.Lock()
+        self._palette: Future[list[misc.Color] | None] | None = None
+
+    def artwork_url(self, width: int | None) -> str | None:
+        """
+        Output: URL of the smallest artwork at least `width` px wide, or the
+        largest if none are
+        """
+        if not self.image_urls:
+            return None
+
+        widths = sorted(self.image_urls)
+        if width is not None:
+            for available_width in widths:
+                if available_width >= width:
+                    return self.image_urls[available_width]
+        return self.image_urls[widths[-1]]
+
+    def prefetch(self) -> None:
+        """
+        Start downloads the render will need besides the artwork, so they run
+        in parallel with it
+        """
+        self._prefetch_palette()
+
+    def _prefetch_palette(self) -> Future[list[misc.Color] | None]:
+        # The palette only needs a thumbnail, so is ready before the full artwork
+        if self._palette is None:
+            self._palette = misc.in_background(self._palette_colors)
+        return self._palette
+
+    def _palette_colors(self) -> list[misc.Color] | None:
+        image = self.artwork_at(imagegen.PALETTE_SIZE)
+        return None if image is None else imagegen.dominant_colors(image)
+
+    def artwork_at(self, width: int | None) -> Image.Image | None:
+        """
+        Output: The artwork at least `width` px wide where available, None for
+        the largest. JPEGs are decoded at a reduced scale and each decode is
+        kept to serve later requests for the same or a smaller width.
+        """
+        # Drafting to a width of 0 would decode at the smallest scale
+        if width is not None and width <= 0:
+            width = None
+
+        with self._artwork_lock:
+            if None in self._pyramid:
+                # The largest available serves every width
+                return self._pyramid[None]
+            if width in self._missing:
+                return None
+            if width is not None:
+                reusable = [size for size in self._pyramid if size >= width]
+                if reusable:
+                    return self._pyramid[min(reusable)]
+
+            loading = self._loading.get(width)
+            if loading is not None:
+                decoding = False
+            else:
+                loading = self._loading[width] = Future()
+                decoding = True
+        if not decoding:
+            return loading.result()
+
+        try:
+            image = self._load_artwork(width)
+        except BaseException as e:
+            with self._artwork_lock:
+                del self._loading[width]
+            loading.set_exception(e)
+            raise
+
+        with self._artwork_lock:
+            del self._loading[width]
+            self._store_artwork(width, image)
+        loading.set_result(image)
+        return image
+
+    def _store_artwork(self, width: int | None, image: Image.Image | None) -> None:
+        if image is None:
+            self._missing.add(width)
+        elif width is None or image.width < width:
+            # Smaller than requested only when nothing larger is available
+            self._pyramid[None] = image
+        else:
+            self._pyramid[image.width] = image
+
+    def _load_artwork(self, width: int | None) -> Image.Image | None:
+        url = self.artwork_url(width)
+        return None if url is None else misc.download_image(url, draft_size=width)
+
     @property  # image cached via misc.download_image
     def artwork(self) -> Image.Image | None:
-        return misc.download_image(self.image_url)
+        return self.artwork_at(self.artwork_size)
 
     @property
     def dominant_colors(self) -> list[misc.Color]:
-        return imagegen.dominant_colors(self.artwork)
+        colors = self._prefetch_palette().result()
+        if colors is None:
+            return imagegen.dominant_colors(self.artwork)
+        return colors
 
 
 class LastfmTrack(Track):  # noqa: PLW1641
-    def __init__(self, response: dict) -> None:
+    def __init__(self, response: dict, artwork_size: int | None = None) -> None:
         recent_track = response["recenttracks"]["track"][0]
 
         self.track_name: str | None = recent_track.get("name")
         self.album_name: str | None = recent_track.get("album", {}).get("#text")
         self.artist_names: str | None = [recent_track.get("artist", {}).get("#text")]
-        self.image_url: str = recent_track["image"][0]["#text"].replace(
-            "/i/u/34s/",
-            "/i/u/600x600/",
-        )  # find 600px version
+
+        thumbnail_url: str = recent_track["image"][0]["#text"]
+        self.image_urls = {
+            width: thumbnail_url.replace("/i/u/34s/", f"/i/u/{size}/")
+            for width, size in LASTFM_IMAGE_SIZES.items()
+        }
+        super().__init__(artwork_size)
 
     @property
     def artwork(self) -> Image.Image | None:
+        if LASTFM_MISSING_ART_ID in self.image_urls[34]:
+            return None
+
         artwork = super().artwork
 
-        missing_art_hash = 3202077406
+        missing_art_hash = 3202077406  # the 600x600 placeholder
 
         if (
             artwork is None
@@ -171,6 +352,10 @@ class LastfmTrack(Track):  # noqa: PLW1641
     def spotify_code_image(self) -> None:
         return None
 
+    @property
+    def identity(self) -> str:
+        return json.dumps(["last.fm", self.track_name, self.album_name])
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, LastfmTrack):
             return NotImplemented
@@ -180,7 +365,7 @@ class LastfmTrack(Track):  # noqa: PLW1641
 
 
 class SpotifyTrack(Track):  # noqa: PLW1641
-    def __init__(self, response: dict) -> None:
+    def __init__(self, response: dict, artwork_size: int | None = None) -> None:
         item = response["item"]
 
         self.track_name: str | None = item.get("name")
@@ -193,36 +378,62 @@ class SpotifyTrack(Track):  # noqa: PLW1641
         self.artist_ids: list[str] = [
             artist.get("id") for artist in item.get("artists", [])
         ]
-        self.image_url: str = item.get("album", {}).get("images", [{}])[0].get("url")
+        self.image_urls = {
+            image.get("width") or 0: image["url"]
+            for image in item.get("album", {}).get("images", [])
+        }
+        super().__init__(artwork_size)
 
-    @functools.cached_property
-    def spotify_code_url(self) -> str | None:
-        dominant_color = self.dominant_colors[0]
+        self._spotify_code: Future[Image.Image | None] | None = None
+
+    @property
+    def spotify_code_url(self) -> str:
+        """
+        The code in a neutral color at the largest size, it only depends on the
+        track so is downloaded and cached once then recolored locally
+        """
         uri = f"spotify:track:{self.track_id}"
+        return f"https://scannables.scdn.co/uri/plain/png/000000/white/{SPOTIFY_CODE_MAX_WIDTH}/{uri}"
 
-        Y = imagegen.luminance(*dominant_color)  # noqa: N806
-        L_star = imagegen.perceived_lightness(Y)  # noqa: N806
+    def prefetch(self) -> None:
+        super().prefetch()
+        if ConfigManager.settings["foreground"]["spotify_code"]:
+            self._prefetch_spotify_code()
 
-        code_color = "white" if L_star < 50 else "black"  # noqa: PLR2004
+    def _prefetch_spotify_code(self) -> Future[Image.Image | None]:
+        if self._spotify_code is None:
+            self._spotify_code = misc.prefetch_image(self.spotify_code_url)
+        return self._spotify_code
 
-        r, g, b = dominant_color
+    @property
+    def identity(self) -> str:
+        return f"spotify:track:{self.track_id}"
 
+    @functools.cached_property
+    def spotify_code_image(self) -> Image.Image | None:
         width = ConfigManager.settings["foreground"]["size"]
 
         min_width = 300
         if width < min_width:
             return None
 
-        width = min(width, 2000)
+        neutral_code = self._prefetch_spotify_code().result()
+        if neutral_code is None:
+            return None
 
-        return f"https://scannables.scdn.co/uri/plain/png/{r:02x}{g:02x}{b:02x}/{code_color}/{width}/{uri}"
+        dominant_color = self.dominant_colors[0]
 
-    @property
-    def spotify_code_image(self) -> Image.Image | None:
-        spotify_code_url = self.spotify_code_url
-        if spotify_code_url is None:
-            return None
-        return misc.download_image(self.spotify_code_url)
+        Y = imagegen.luminance(*dominant_color)  # noqa: N806
+        L_star = imagegen.perceived_lightness(Y)  # noqa: N806
+
+        code_color = (255, 255, 255) if L_star < 50 else (0, 0, 0)  # noqa: PLR2004
+
+        return imagegen.recolor_spotify_code(
+            neutral_code,
+            background=dominant_color,
+            bars=code_color,
+            width=min(width, SPOTIFY_CODE_MAX_WIDTH),
+        )
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, SpotifyTrack):
@@ -230,49 +441,187 @@ class SpotifyTrack(Track):  # noqa: PLW1641
         return self.track_id == other.track_id
 
 
-class BatterySaverCheckThread(QtCore.QThread):
+class LocalTrack(Track):  # noqa: PLW1641
+    def __init__(
+        self,
+        now_playing: NowPlaying,
+        artwork_size: int | None = None,
+    ) -> None:
+        self.now_playing = now_playing
+
+        self.track_name: str | None = now_playing.track_name
+        self.album_name: str | None = now_playing.album_name
+        self.artist_names: list[str] = list(now_playing.artist_names)
+        # The size of pushed artwork isn't known
+        self.image_urls = (
+            {} if now_playing.artwork_url is None else {0: now_playing.artwork_url}
+        )
+        super().__init__(artwork_size)
+
+    def _load_artwork(self, width: int | None) -> Image.Image | None:
+        if self.now_playing.artwork is None:
+            return super()._load_artwork(width)
+        try:
+            return misc.decode_image(self.now_playing.artwork, draft_size=width)
+        except OSError:
+            print("[ERROR] Failed to decode pushed artwork")
+            return None
+
+    @property
+    def spotify_code_image(self) -> None:
+        return None
+
+    @property
+    def identity(self) -> str:
+        return json.dumps([
+            "local",
+            self.now_playing.track_id,
+            self.track_name,
+            self.album_name,
+            self.now_playing.artwork_key,
+        ])
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, LocalTrack):
+            return NotImplemented
+        return self.identity == other.identity
+
+
+class PowerCheckThread(QtCore.QThread):
     # https://stackoverflow.com/a/33150936
     def __init__(self, pause_state_manager) -> None:  # noqa: ANN001
         QtCore.QThread.__init__(self, parent=None)
         self.pause_state_manager = pause_state_manager
+        # Woken when the power policy changes, a pushed service doesn't poll
+        self.worker_thread: WorkerThread | None = None
 
     def run(self) -> None:
         try:
-            # if disable_on_battery_saver disabled then kill this thread
-            if not ConfigManager.settings["power"]["disable_on_battery_saver"]:
-                return
-
             self.sleep = threading.Event()
             battery_saver_enabled_previous = None
             while True:
-                battery_saver_enabled = winapi.battery_saver_enabled()
+                # Read every loop so the settings can be changed without a restart
+                power_settings = ConfigManager.snapshot().settings["power"]
+                battery_saver_enabled = (
+                    power_settings["disable_on_battery_saver"]
+                    and platforms.current().battery_saver_enabled()
+                )
                 # To prevent constantly setting desktop to default/generated
                 # TODO implement a more elegant solution
                 if battery_saver_enabled_previous is not battery_saver_enabled:
-                    self.pause_state_manager.set_battery_saver(battery_saver_enabled)
+                    self.pause_state_manager.set_battery_saver(
+                        enabled=battery_saver_enabled,
+                    )
 
                 battery_saver_enabled_previous = battery_saver_enabled
+
+                power_status = platforms.current().power_status()
+                if PowerGovernor.update(power_status, power_settings):
+                    print(f"POWER POLICY: {PowerGovernor.policy().name}")
+                    if self.worker_thread is not None:
+                        self.worker_thread.wake()
+
                 self.sleep.wait(1)
         except Exception:
-            app_log.exception("BatterySaverCheck Error")
+            app_log.exception("PowerCheck Error")
             if __debug__:
                 raise
 
 
 class WorkerThread(QtCore.QThread):
+    # Changing any of these needs a new CurrentArt e.g. to sign in to Spotify again
+    SERVICE_KEYS = frozenset({
+        ("settings", "service", "option"),
+        ("settings", "service", "redirect_uri"),
+        ("settings", "service", "local_port"),
+        ("settings", "service", "local_token"),
+    })
+    # Changing any of these sections changes the generated wallpaper
+    RENDER_SECTIONS = frozenset({
+        ("settings", "foreground"),
+        ("settings", "performance"),
+        ("settings", "cache"),
+    })
+
     def __init__(self, parent: QtWidgets.QWidget = None) -> None:
         super().__init__(parent)
         self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._config_lock = threading.Lock()
+        self._changed_keys: set[ConfigKey] = set()
         self.sleep = threading.Event()
         self.disabled = False
 
+    def config_changed(self, _config: ConfigSnapshot, changed: set[ConfigKey]) -> None:
+        """
+        Called on the thread that saved the settings, the changes are applied by
+        the worker loop between polls
+        """
+        with self._config_lock:
+            self._changed_keys |= changed
+        self._wakeup.set()
+
+    def apply_config_changes(self, wallpaper_generator: GenerateWallpaper) -> None:
+        with self._config_lock:
+            changed, self._changed_keys = self._changed_keys, set()
+        if not changed:
+            return
+
+        config = ConfigManager.snapshot()
+
+        if any(key in self.SERVICE_KEYS or key[0] == "services" for key in changed):
+            # Frees the port before a new listener binds it
+            self.get_art.close()
+            self.get_art = CurrentArt(
+                service=config.settings["service"]["option"],
+                on_push=self._wakeup.set,
+            )
+
+        if any(
+            key[0] == "background" or key[:2] in self.RENDER_SECTIONS
+            for key in changed
+        ):
+            self.pipeline.update_generator(
+                lambda generator: generator.apply_config(config),
+            )
+            # Render the current track again with the new settings
+            self.get_art.previous_playback_state = None
+            self.get_art.previously_generated_track = None
+            self.get_art.restored_track = None
+
+        self.get_art.artwork_size = wallpaper_generator.required_artwork_size()
+
+    def apply_power_policy(self, wallpaper_generator: GenerateWallpaper) -> float:
+        """
+        Output: Multiplier of the request interval
+        """
+        policy = PowerGovernor.policy()
+        if policy != wallpaper_generator.power_policy:
+            if policy.full_quality:
+                # Render the current track again at full quality
+                self.get_art.previous_playback_state = None
+                self.get_art.previously_generated_track = None
+            self.pipeline.update_generator(
+                lambda generator: setattr(generator, "power_policy", policy),
+            )
+            self.get_art.prefetch = policy.prefetch
+        return policy.interval_multiplier
+
+    def forget_abandoned_renders(self) -> None:
+        # A track that was never set as the wallpaper can't be set again
+        for track in self.pipeline.take_abandoned():
+            if track == self.get_art.previously_generated_track:
+                self.get_art.previous_playback_state = None
+                self.get_art.previously_generated_track = None
+
     def run(self) -> None:
+        ConfigManager.subscribe(self.config_changed)
         try:
             self._stop_event.clear()
 
             self._pause_request = ConfigManager.settings["miscellaneous"]["paused"]
             self._battery_saver = (
-                winapi.battery_saver_enabled()
+                platforms.current().battery_saver_enabled()
                 and not ConfigManager.settings["power"]["disable_on_battery_saver"]
             )
 
@@ -280,51 +629,88 @@ class WorkerThread(QtCore.QThread):
 
             self.get_art = CurrentArt(
                 service=ConfigManager.settings["service"]["option"],
+                on_push=self._wakeup.set,
             )
 
-            request_interval = ConfigManager.settings["service"]["request_interval"]
-
-            wallaper_generator = GenerateWallpaper(app)
+            wallaper_generator = GenerateWallpaper(*screen_geometry(app))
+            self.get_art.restored_track = wallaper_generator.restored_track()
+            self.get_art.artwork_size = wallaper_generator.required_artwork_size()
+            self.pipeline = RenderPipeline(
+                wallaper_generator,
+                on_abandoned=self._wakeup.set,
+            )
 
             while not self._stop_event.is_set():
                 if self.disabled:
                     self.sleep.wait(1)
                     continue
 
-                start = time.time()
+                self.apply_config_changes(wallaper_generator)
+                config = ConfigManager.snapshot()
+                request_interval = config.settings["service"][
+                    "request_interval"
+                ] * self.apply_power_policy(wallaper_generator)
+                performance = config.settings["performance"]
+                self.pipeline.debounce = performance["render_debounce"]
+                self.forget_abandoned_renders()
+
                 wallpaper_action: GenerateNew | SetDefault | Unchanged | SetPrevious = (
                     self.get_art.current_wallpaper_action()
                 )
-                wallaper_generator.generate(wallpaper_action)
-
-                if isinstance(wallpaper_action, Image.Image):
-                    print(f"TOTAL TIME = {(time.time() - start) * 1000:.4g} ms")
+                # Rendered on the pipeline's thread, polling carries on meanwhile
+                self.pipeline.submit(wallpaper_action)
+                Previews.set_current(
+                    self.get_art.previously_generated_track,
+                    wallaper_generator.display_geometry,
+                    wallaper_generator.available_geometry,
+                )
 
-                if self._stop_event.wait(request_interval):
-                    break
+                # Woken early by stop(), a settings change or a pushed track
+                self._wakeup.wait(None if self.get_art.pushed else request_interval)
+                self._wakeup.clear()
 
         except Exception:
             app_log.exception("Worker Error")
             if __debug__:
                 raise
+        finally:
+            ConfigManager.unsubscribe(self.config_changed)
+            with contextlib.suppress(AttributeError):
+                self.pipeline.stop()
+            with contextlib.suppress(AttributeError):
+                self.get_art.close()
 
     def _wait_for_wakeup(self, timeout: float | None = None) -> bool:
         self.sleep.wait(timeout)
         return not self._stop_event.is_set()
 
+    def wake(self) -> None:
+        """
+        Runs the loop now instead of after the request interval
+        """
+        self._wakeup.set()
+
     def stop(self) -> None:
         self._stop_event.set()
+        self._wakeup.set()
         self.sleep.set()
 
     def check_state(self) -> None:
         if self.disabled:
             self.sleep.clear()
-            WindowsWallpaper.set_default_wallpaper()
+            try:
+                # Replaces a render in progress, which would set its wallpaper
+                # over the default one if it finished first
+                self.pipeline.submit(SetDefault())
+            except AttributeError:  # not running yet
+                DesktopWallpaper.set_default_wallpaper()
         else:
             with contextlib.suppress(Exception):
                 self.sleep.set()
             with contextlib.suppress(AttributeError):
                 self.get_art.previous_playback_state = None
+            # A pushed service waits for the next track otherwise
+            self._wakeup.set()
 
             # self.get_art.previously_generated_track = None
 
@@ -402,7 +788,7 @@ class OnStartup:
 
     @staticmethod
     def start_QApplication() -> QtWidgets.QApplication:
-        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("AlbumPaper")
+        platforms.current().set_app_user_model_id("AlbumPaper")
         try:
             app = QtWidgets.QApplication(sys.argv)
         except RuntimeError:  # occurs on restart
@@ -421,35 +807,44 @@ class OnStartup:
         if not cache_images_dir.exists():
             cache_images_dir.mkdir(parents=True, exist_ok=True)
         if not Path(AppPaths.DEFAULT_WALLPAPER).exists():
-            WindowsWallpaper.cache_current()
+            DesktopWallpaper.cache_current()
 
     @staticmethod
-    def check_run_on_startup_registry() -> None:
+    def check_run_on_startup() -> None:
         if __debug__:
             return
 
-        name = "AlbumPaper"
-
-        key = winreg.OpenKey(
-            winreg.HKEY_CURRENT_USER,
-            r"SOFTWARE\Microsoft\Windows\CurrentVersion\Run",
-            0,
-            winreg.KEY_SET_VALUE,
+        platforms.current().set_run_at_startup(
+            "AlbumPaper",
+            (AppPaths.PROJECT_ROOT / "albumpaper.exe").absolute(),
+            enabled=ConfigManager.settings["miscellaneous"]["run_at_startup"],
         )
 
-        exe_path = str((AppPaths.PROJECT_ROOT / "albumpaper.exe").absolute())
 
-        if ConfigManager.settings["miscellaneous"]["run_at_startup"]:
-            winreg.SetValueEx(key, name, 0, winreg.REG_SZ, exe_path)
+RESTART_EXIT_CODE = 1
 
-        else:
-            with contextlib.suppress(FileNotFoundError):
-                winreg.DeleteValue(key, name)
 
-        winreg.CloseKey(key)
+def run_at_startup_changed(_config: ConfigSnapshot, changed: set[ConfigKey]) -> None:
+    if ("settings", "miscellaneous", "run_at_startup") in changed:
+        OnStartup.check_run_on_startup()
 
 
-RESTART_EXIT_CODE = 1
+def render_pool_changed(config: ConfigSnapshot, changed: set[ConfigKey]) -> None:
+    if any(key[:2] == ("settings", "performance") for key in changed):
+        configure_render_pool(config)
+
+
+def restart_when_configured(_config: ConfigSnapshot, _changed: set[ConfigKey]) -> None:
+    """
+    The worker isn't started until the service is valid, restart once it is
+    """
+    if not ConfigManager.validate_service():
+        # Delay so the settings window's close event completes first
+        QtCore.QTimer.singleShot(
+            100,
+            lambda: QtWidgets.QApplication.exit(RESTART_EXIT_CODE),
+        )
+
 
 if __name__ in "__main__":
     exit_code = RESTART_EXIT_CODE
@@ -459,7 +854,7 @@ if __name__ in "__main__":
         exit_code = 0
         try:
             OnStartup.check_cache_exists()
-            OnStartup.check_run_on_startup_registry()
+            OnStartup.check_run_on_startup()
 
             app = OnStartup.start_QApplication()
 
@@ -483,9 +878,9 @@ if __name__ in "__main__":
             )
 
             try:
-                name = b"AlbumPaper-dev" if __debug__ else b"AlbumPaper"
-                mutex = winapi.NamedMutex(name)
-            except winapi.MutexNotAquiredError:
+                name = "AlbumPaper-dev" if __debug__ else "AlbumPaper"
+                mutex = platforms.current().single_instance_lock(name)
+            except platforms.AlreadyRunningError:
                 tray_icon.showMessage("App already open", "")
                 sys.exit()
 
@@ -497,13 +892,17 @@ if __name__ in "__main__":
                 tray_icon.showMessage(err_message, "")
                 tray_icon.settings_window.show()
 
-            battery_saver_check_thread = BatterySaverCheckThread(
-                pause_state_manager,
-            )
-            battery_saver_check_thread.start(priority=QtCore.QThread.LowestPriority)
+            power_check_thread = PowerCheckThread(pause_state_manager)
+            power_check_thread.start(priority=QtCore.QThread.LowestPriority)
 
-            if not err_message:
+            configure_render_pool(ConfigManager.snapshot())
+            ConfigManager.subscribe(render_pool_changed)
+            ConfigManager.subscribe(run_at_startup_changed)
+            if err_message:
+                ConfigManager.subscribe(restart_when_configured)
+            else:
                 worker_thread = WorkerThread()
+                power_check_thread.worker_thread = worker_thread
                 pause_state_signals.pause_state.connect(worker_thread.pause_state)
                 pause_state_signals.pause_state.connect(tray_icon.pause_state)
 
@@ -513,9 +912,13 @@ if __name__ in "__main__":
 
             exit_code = app.exec()
 
+            ConfigManager.unsubscribe(render_pool_changed)
+            ConfigManager.unsubscribe(run_at_startup_changed)
+            ConfigManager.unsubscribe(restart_when_configured)
             if not err_message:
                 worker_thread.stop()
                 worker_thread.wait()
+            AnalysisWorker.stop()
 
         except Exception:
             app_log.exception("main error")
@@ -1,3 +1,23 @@
-from .albumpaper_rs import generate_save_wallpaper
+from .albumpaper_rs import (
+    BufferPoolStats,
+    CancelToken,
+    RenderInfo,
+    buffer_pool_stats,
+    clear_layer_caches,
+    configure_render_pool,
+    generate_save_wallpaper,
+    generate_wallpaper_rgba,
+    release_render_buffers,
+)
 
-__all__ = ["generate_save_wallpaper"]
+__all__ = [
+    "BufferPoolStats",
+    "CancelToken",
+    "RenderInfo",
+    "buffer_pool_stats",
+    "clear_layer_caches",
+    "configure_render_pool",
+    "generate_save_wallpaper",
+    "generate_wallpaper_rgba",
+    "release_render_buffers",
+]
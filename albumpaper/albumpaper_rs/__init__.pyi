@@ -1,3 +1,53 @@
 import structs
 
-def generate_save_wallpaper(config: structs.GenerationConfig) -> None: ...
+class RenderInfo:
+    # The background came from a layer cache
+    background_cached: bool
+    # (stage, milliseconds, bytes allocated) in the order the stages ran, a
+    # stage may appear more than once. Stages are convert, background, resize,
+    # blur, composite, foreground, drop_shadow and encode
+    stages: list[tuple[str, float, int]]
+
+# Display sized image buffers reused between renders instead of allocated
+class BufferPoolStats:
+    hits: int
+    misses: int
+    # Held by free buffers now
+    pooled_bytes: int
+    # The most held by free buffers at once
+    peak_bytes: int
+    hit_rate: float
+
+# Cancels a render from another thread, checked between stages so the stage in
+# progress runs to completion
+class CancelToken:
+    cancelled: bool
+    def cancel(self) -> None: ...
+
+# Output: None if `cancel` was cancelled before the wallpaper was saved.
+# Releases the GIL while rendering
+def generate_save_wallpaper(
+    config: structs.GenerationConfig,
+    cancel: CancelToken | None = None,
+) -> RenderInfo | None: ...
+
+# Output: The [width, height] and RGBA pixels of the wallpaper, which isn't
+# saved. Releases the GIL while rendering
+def generate_wallpaper_rgba(
+    config: structs.GenerationConfig,
+) -> tuple[list[int], bytes]: ...
+def clear_layer_caches(project_root: str) -> None: ...
+def buffer_pool_stats() -> BufferPoolStats: ...
+
+# Frees the buffers kept for the next render, they are allocated again by the
+# render after
+def release_render_buffers() -> None: ...
+
+# Renders run on a pool of at most `max_threads` threads (0 for one per core)
+# and `cpu_share` of the cores, at low OS priority if `low_priority`.
+# Output: The number of threads renders will use
+def configure_render_pool(
+    max_threads: int = 0,
+    low_priority: bool = True,
+    cpu_share: float = 1.0,
+) -> int: ...
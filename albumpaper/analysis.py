@@ -0,0 +1,161 @@
+"""
+Palette extraction in a worker process of its own. scikit-learn and SciPy add
+well over 100 MB to the process that imports them, so the tray process starts
+the worker when it needs a palette and the worker exits once it is idle.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from multiprocessing.process import BaseProcess
+
+    from misc import Color
+
+# Seconds the worker is given to exit once its connection is closed
+STOP_TIMEOUT = 2
+# Seconds to wait for a palette, including starting the worker which imports the
+# app's modules again
+PALETTE_TIMEOUT = 60
+
+
+def kmeans_palette(pixels: np.ndarray) -> list[Color]:
+    """
+    Input: (pixels, 3) RGB array
+    Output: A list of 10 colors in the pixels from most dominant to least dominant
+    Adaptation of https://stackoverflow.com/a/3244061/7274182
+    """
+    # Only imported by the process that extracts palettes
+    import scipy.cluster.vq  # noqa: PLC0415
+    import sklearn.cluster  # noqa: PLC0415
+
+    ar = pixels.astype(float)
+
+    kmeans = sklearn.cluster.MiniBatchKMeans(
+        n_clusters=10,
+        init="k-means++",
+        max_iter=20,
+        random_state=1000,  # fixed seed for consistent colors
+    ).fit(ar)
+    codes = kmeans.cluster_centers_
+
+    vecs, _dist = scipy.cluster.vq.vq(ar, codes)  # assign codes
+    counts, _bins = np.histogram(vecs, len(codes))  # count occurrences
+
+    return [tuple(row) for row in codes[np.argsort(counts)[::-1]].astype(int)]
+
+
+def _serve(connection: Connection) -> None:
+    """
+    Runs in the worker, replies to each array of pixels with its palette until
+    the tray process closes the connection
+    """
+    while True:
+        try:
+            pixels = connection.recv()
+        except EOFError:
+            return
+        connection.send(kmeans_palette(pixels))
+
+
+class AnalysisWorker:
+    """
+    The worker process, started for the first palette and stopped after
+    `idle_timeout` seconds without one
+    """
+
+    _lock = threading.Lock()
+    _process: BaseProcess | None = None
+    _connection: Connection | None = None
+    _idle_timer: threading.Timer | None = None
+    _idle_deadline = 0.0  # time.monotonic()
+
+    @classmethod
+    def palette(cls, pixels: np.ndarray, idle_timeout: float) -> list[Color]:
+        """
+        Output: kmeans_palette(pixels) from the worker, extracted in this
+        process if the worker fails or doesn't reply within PALETTE_TIMEOUT
+        """
+        with cls._lock:
+            try:
+                connection = cls._start()
+                connection.send(pixels)
+                if not connection.poll(PALETTE_TIMEOUT):
+                    msg = "no reply"
+                    raise TimeoutError(msg)
+                colors = connection.recv()
+            except (OSError, EOFError):  # TimeoutError is an OSError
+                print("[ERROR] Analysis worker failed, extracting palette in process")
+                cls._kill()
+                return kmeans_palette(pixels)
+
+            cls._idle_deadline = time.monotonic() + idle_timeout
+            if cls._idle_timer is not None:
+                cls._idle_timer.cancel()
+            cls._idle_timer = threading.Timer(idle_timeout, cls._stop_if_idle)
+            cls._idle_timer.daemon = True
+            cls._idle_timer.start()
+            return colors
+
+    @classmethod
+    def stop(cls) -> None:
+        with cls._lock:
+            if cls._idle_timer is not None:
+                cls._idle_timer.cancel()
+                cls._idle_timer = None
+            cls._stop()
+
+    @classmethod
+    def _stop_if_idle(cls) -> None:
+        with cls._lock:
+            # A palette may have been requested while this waited for the lock
+            if time.monotonic() >= cls._idle_deadline:
+                cls._stop()
+
+    @classmethod
+    def _start(cls) -> Connection:
+        if cls._process is not None and cls._process.is_alive():
+            return cls._connection
+        cls._stop()
+
+        # Not forked, the tray process has Qt and render threads running
+        context = multiprocessing.get_context("spawn")
+        cls._connection, child_connection = context.Pipe()
+        cls._process = context.Process(
+            target=_serve,
+            args=(child_connection,),
+            name="albumpaper-analysis",
+            daemon=True,
+        )
+        cls._process.start()
+        child_connection.close()
+        print("Started analysis worker")
+        return cls._connection
+
+    @classmethod
+    def _kill(cls) -> None:
+        # A worker that hangs would otherwise be waited on for STOP_TIMEOUT
+        if cls._process is not None and cls._process.is_alive():
+            cls._process.kill()
+        cls._stop()
+
+    @classmethod
+    def _stop(cls) -> None:
+        if cls._connection is not None:
+            # The worker exits when it sees the connection close
+            cls._connection.close()
+            cls._connection = None
+        if cls._process is not None:
+            cls._process.join(STOP_TIMEOUT)
+            if cls._process.is_alive():
+                cls._process.kill()
+                cls._process.join()
+            cls._process = None
+            print("Stopped analysis worker")
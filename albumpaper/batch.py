@@ -0,0 +1,393 @@
+"""
+Renders wallpapers without the tray app, to pre-warm the render and palette
+caches for a whole library or as a load benchmark.
+
+    python batch.py --artwork-dir ~/Music/covers
+    python batch.py --urls urls.txt --workers 4
+    python batch.py --history Streaming_History_Audio_2024.json
+
+Progress is checkpointed, running the same command again resumes the job.
+Renders that show a Spotify code can't be pre-warmed, the code belongs to the
+track and only artwork is known here.
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import imagegen
+import misc
+import spotipy
+import xxhash
+from configuration import AppPaths, ConfigManager
+from governor import RenderGovernor
+from PIL import Image
+from wallpaper import BackgroundType, GenerateWallpaper, Geometry, screen_geometry
+
+BATCH_DIR = AppPaths.PROJECT_ROOT / "cache" / "batch"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+SPOTIFY_TRACKS_LIMIT = 50  # max ids per Spotify "Get Several Tracks" request
+
+
+@dataclass(frozen=True)
+class Item:
+    source: str  # file path or URL
+    is_url: bool
+
+    def artwork(self) -> Image.Image | None:
+        if self.is_url:
+            return misc.download_image(self.source)
+        with Image.open(self.source) as image:
+            return image.convert("RGB")
+
+
+class ArtworkTrack:
+    def __init__(self, artwork: Image.Image) -> None:
+        self.artwork = artwork
+        self.spotify_code_image = None
+
+    @property
+    def dominant_colors(self) -> list[misc.Color]:
+        return imagegen.dominant_colors(self.artwork)
+
+
+def directory_items(directory: Path) -> list[Item]:
+    return [
+        Item(str(path), is_url=False)
+        for path in sorted(directory.rglob("*"))
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+
+def url_items(path: Path) -> list[Item]:
+    lines = path.read_text(encoding="utf-8").splitlines()
+    return [
+        Item(line.strip(), is_url=True)
+        for line in lines
+        if line.strip() and not line.startswith("#")
+    ]
+
+
+def history_items(path: Path) -> list[Item]:
+    """
+    Spotify extended streaming history export, artwork URLs are looked up with
+    the Spotify API using the client credentials from the settings
+    """
+    entries = json.loads(path.read_text(encoding="utf-8"))
+    track_ids = list(
+        dict.fromkeys(
+            entry["spotify_track_uri"].rsplit(":", 1)[-1]
+            for entry in entries
+            if entry.get("spotify_track_uri")
+        ),
+    )
+
+    api = spotipy.Spotify(
+        auth_manager=spotipy.SpotifyClientCredentials(
+            client_id=ConfigManager.services["spotify"]["client_id"],
+            client_secret=ConfigManager.services["spotify"]["client_secret"],
+        ),
+    )
+
+    image_urls = {}
+    for start in range(0, len(track_ids), SPOTIFY_TRACKS_LIMIT):
+        tracks = api.tracks(track_ids[start : start + SPOTIFY_TRACKS_LIMIT])["tracks"]
+        for track in tracks:
+            images = (track or {}).get("album", {}).get("images")
+            if images:
+                image_urls.setdefault(images[0]["url"])
+
+    return [Item(url, is_url=True) for url in image_urls]
+
+
+class Checkpoint:
+    """
+    Append-only log of completed items, so an interrupted job loses at most the
+    renders that were in progress
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.done: set[str] = set()
+        with contextlib.suppress(FileNotFoundError):
+            self.done.update(path.read_text(encoding="utf-8").splitlines())
+        self._file = path.open("a", encoding="utf-8")
+
+    def mark_done(self, source: str) -> None:
+        self.done.add(source)
+        self._file.write(source + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# Per worker process state, set by init_worker
+_generator: GenerateWallpaper | None = None
+_background_types: list[BackgroundType] = []
+
+
+def init_worker(
+    display_geometry: Geometry,
+    available_geometry: Geometry,
+    background_types: list[BackgroundType],
+    workers_dir: Path,
+) -> None:
+    global _generator, _background_types  # noqa: PLW0603
+
+    # Each worker renders into its own directory, renders are then copied into
+    # the shared render cache
+    root = workers_dir / str(os.getpid())
+    images_dir = root / "cache" / "images"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    with contextlib.suppress(FileNotFoundError):
+        shutil.copy2(AppPaths.DEFAULT_WALLPAPER, images_dir / "default_wallpaper.jpg")
+
+    _generator = GenerateWallpaper(display_geometry, available_geometry)
+    _generator.project_root = root
+    # Render at the configured quality rather than what the app's governor picks
+    _generator.governor = RenderGovernor(
+        geometry=display_geometry[:2],
+        deadline=0,
+        path=root / "render_costs.json",
+    )
+    _background_types = background_types
+
+
+def render_item(item: Item) -> tuple[str, int, str | None]:
+    """
+    Output: (item source, number of wallpapers rendered, error message)
+    """
+    try:
+        artwork = item.artwork()
+        if artwork is None:
+            return item.source, 0, "no artwork"
+
+        track = ArtworkTrack(artwork)
+        # Fills the palette cache even if no background uses it
+        track.dominant_colors  # noqa: B018
+
+        for background_type in _background_types:
+            _generator.render(
+                track,
+                _generator.background_config(background_type, track),
+            )
+    except Exception as e:  # noqa: BLE001
+        return item.source, 0, repr(e)
+
+    return item.source, len(_background_types), None
+
+
+def parse_resolution(text: str) -> tuple[int, int]:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Render wallpapers headless")
+    parser.add_argument(
+        "--artwork-dir",
+        type=Path,
+        action="append",
+        default=[],
+        help="Directory of artwork images, searched recursively",
+    )
+    parser.add_argument(
+        "--urls",
+        type=Path,
+        action="append",
+        default=[],
+        help="Text file with one artwork URL per line",
+    )
+    parser.add_argument(
+        "--history",
+        type=Path,
+        action="append",
+        default=[],
+        help="Spotify extended streaming history JSON export",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+    )
+    parser.add_argument(
+        "--resolution",
+        type=parse_resolution,
+        help="WIDTHxHEIGHT to render at (default: the primary screen)",
+    )
+    parser.add_argument(
+        "--taskbar-height",
+        type=int,
+        help=(
+            "Height of a taskbar at the bottom of --resolution, which then needs "
+            "no screen (default: the primary screen's taskbar)"
+        ),
+    )
+    parser.add_argument(
+        "--background",
+        action="append",
+        type=BackgroundType,
+        choices=list(BackgroundType),
+        help="Background types to render (default: those enabled in settings)",
+    )
+    parser.add_argument("--job", help="Job name used for the checkpoint")
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore any checkpoint and render everything again",
+    )
+    return parser.parse_args()
+
+
+def geometry(
+    resolution: tuple[int, int] | None,
+    taskbar_height: int | None,
+) -> tuple[Geometry, Geometry]:
+    """
+    Output: The display and available geometry the app would render at, the
+    taskbar must match for the app to use the pre-warmed renders
+    """
+    if resolution is not None and taskbar_height is not None:
+        width, height = resolution
+        return (width, height, 0, 0), (width, height - taskbar_height, 0, 0)
+
+    from PySide6 import QtGui  # noqa: PLC0415 not needed for a given geometry
+
+    app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication(sys.argv[:1])
+    display_geometry, available_geometry = screen_geometry(app)
+    if resolution is None:
+        return display_geometry, available_geometry
+
+    # The primary screen's taskbar at the same edge of the given resolution
+    screen_width, screen_height, _, _ = display_geometry
+    available_width, available_height, left, top = available_geometry
+    width, height = resolution
+    return (width, height, 0, 0), (
+        width - (screen_width - available_width),
+        height - (screen_height - available_height),
+        left,
+        top,
+    )
+
+
+def load_items(args: argparse.Namespace, manifest_path: Path) -> list[Item]:
+    # The item list is stored so a resumed job doesn't rescan or query Spotify
+    if manifest_path.exists():
+        return [Item(**item) for item in json.loads(manifest_path.read_text())]
+
+    items = []
+    for directory in args.artwork_dir:
+        items.extend(directory_items(directory))
+    for path in args.urls:
+        items.extend(url_items(path))
+    for path in args.history:
+        items.extend(history_items(path))
+    items = list(dict.fromkeys(items))
+
+    manifest_path.write_text(json.dumps([asdict(item) for item in items]))
+    return items
+
+
+def throughput(completed: int, rendered: int, elapsed: float) -> str:
+    elapsed = max(elapsed, 1e-9)
+    return f"{completed / elapsed:.2f} images/s, {rendered / elapsed:.2f} renders/s"
+
+
+def main() -> int:
+    args = parse_args()
+
+    display_geometry, available_geometry = geometry(
+        args.resolution,
+        args.taskbar_height,
+    )
+    background_types = args.background or [
+        background_type
+        for background_type in BackgroundType
+        if ConfigManager.background[background_type]["enabled"]
+    ]
+    if (
+        BackgroundType.DEFAULT_WALLPAPER in background_types
+        and not AppPaths.DEFAULT_WALLPAPER.exists()
+    ):
+        print("[WARNING] No default wallpaper cached, skipping that background")
+        background_types.remove(BackgroundType.DEFAULT_WALLPAPER)
+
+    sources = {
+        "artwork_dir": sorted(str(p.resolve()) for p in args.artwork_dir),
+        "urls": sorted(str(p.resolve()) for p in args.urls),
+        "history": sorted(str(p.resolve()) for p in args.history),
+        "geometry": [display_geometry, available_geometry],
+        "backgrounds": sorted(background_types),
+    }
+    job = args.job or xxhash.xxh32(json.dumps(sources).encode()).hexdigest()
+
+    BATCH_DIR.mkdir(parents=True, exist_ok=True)
+    manifest_path = BATCH_DIR / f"{job}.items.json"
+    checkpoint_path = BATCH_DIR / f"{job}.done"
+    if args.restart:
+        manifest_path.unlink(missing_ok=True)
+        checkpoint_path.unlink(missing_ok=True)
+
+    items = load_items(args, manifest_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    pending = [item for item in items if item.source not in checkpoint.done]
+    print(
+        f"Job {job}: {len(items)} images, {len(items) - len(pending)} already done, "
+        f"rendering {len(background_types)} backgrounds each "
+        f"at {display_geometry[0]}x{display_geometry[1]} with {args.workers} workers",
+    )
+
+    workers_dir = BATCH_DIR / "workers"
+    completed = rendered = failed = 0
+    start = time.perf_counter()
+
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(display_geometry, available_geometry, background_types, workers_dir),
+    )
+    try:
+        futures = [executor.submit(render_item, item) for item in pending]
+        for future in concurrent.futures.as_completed(futures):
+            source, n_rendered, error = future.result()
+            if error is None:
+                checkpoint.mark_done(source)
+                completed += 1
+                rendered += n_rendered
+            else:
+                failed += 1
+                print(f"[ERROR] {source}: {error}")
+
+            elapsed = time.perf_counter() - start
+            print(
+                f"[{completed + failed}/{len(pending)}] "
+                f"{throughput(completed, rendered, elapsed)}",
+            )
+    except KeyboardInterrupt:
+        print("Interrupted, run the same command again to resume")
+        return 130
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        checkpoint.close()
+        shutil.rmtree(workers_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Done: {completed} images, {rendered} renders, {failed} failed "
+        f"in {elapsed:.1f} s ({throughput(completed, rendered, elapsed)})",
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
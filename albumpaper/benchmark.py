@@ -0,0 +1,601 @@
+"""
+Benchmarks the rendering pipeline for every background type at 1080p, 1440p
+and 4K, through both albumpaper_rs directly with its layer caches cleared and
+GenerateWallpaper with every cache warm, and times palette extraction.
+
+Results are written as JSON and compared against a stored baseline. Rendered
+wallpapers are compared against golden thumbnails so optimisations can be
+checked for changes in output.
+
+    python benchmark.py --filter lowpoly --resolution 4k
+    python benchmark.py --save-baseline --update-golden
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import albumpaper_rs
+import imagegen
+import misc
+import numpy as np
+import structs
+from configuration import AppPaths, ConfigManager
+from governor import RenderGovernor
+from PIL import Image
+from rendercache import RenderCache
+from wallpaper import (
+    BLURRABLE_BACKGROUNDS,
+    DETAIL_LEVEL_SAMPLES,
+    GEOMETRIZE_BACKGROUNDS,
+    BackgroundType,
+    GenerateWallpaper,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+RESULTS_VERSION = 1
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+TASKBAR_HEIGHT = 48
+ARTWORK_SIZE = 400
+THUMBNAIL_WIDTH = 256
+
+BENCHMARK_DIR = AppPaths.PROJECT_ROOT / "benchmarks"
+
+# Case name: (blur, blur quality)
+BLUR_VARIANTS = {
+    "noblur": (False, "exact"),
+    "blur": (True, "exact"),
+    "blur-fast": (True, "fast"),
+}
+
+
+@dataclass(kw_only=True)
+class ForegroundOptions:
+    enabled: bool = True
+    drop_shadow: bool = False
+    rounded_corners: bool = False
+    spotify_code: bool = False
+
+
+FOREGROUND_VARIANTS = {
+    "none": ForegroundOptions(enabled=False),
+    "plain": ForegroundOptions(),
+    "rounded": ForegroundOptions(rounded_corners=True),
+    "shadow": ForegroundOptions(drop_shadow=True),
+    "rounded-shadow": ForegroundOptions(drop_shadow=True, rounded_corners=True),
+    "rounded-shadow-code": ForegroundOptions(
+        drop_shadow=True,
+        rounded_corners=True,
+        spotify_code=True,
+    ),
+}
+
+
+@dataclass(kw_only=True)
+class Case:
+    name: str
+    resolution: str
+    background_type: BackgroundType
+    detail_level: int = max(DETAIL_LEVEL_SAMPLES)
+    blur: bool = False
+    blur_quality: str = "exact"
+    # Output is compared with this case's, e.g. the exact blur for a fast one
+    reference: str | None = None
+    foreground: ForegroundOptions = field(
+        default_factory=lambda: FOREGROUND_VARIANTS["none"],
+    )
+
+
+class FixtureTrack:
+    def __init__(self, artwork: Image.Image) -> None:
+        self.artwork = artwork
+        self.spotify_code_image = Image.new(
+            "RGB",
+            (ARTWORK_SIZE, ARTWORK_SIZE // 4),
+            (255, 255, 255),
+        )
+
+    @property
+    def dominant_colors(self) -> list:
+        return imagegen.dominant_colors(self.artwork)
+
+
+def fixture_artwork() -> Image.Image:
+    # Deterministic stand-in for album art with a few distinct colour regions
+    y, x = np.mgrid[0:640, 0:640]
+    band = (x // 80 + y // 160) % 4
+    shade = (x + y) // 5 % 64
+    palette = np.array([[200, 40, 60], [30, 90, 160], [240, 200, 80], [20, 20, 30]])
+    pixels = palette[band] + shade[..., None] * np.array([0.5, 1, 0.5])
+    return Image.fromarray(pixels.clip(0, 255).astype(np.uint8), "RGB")
+
+
+def fixture_default_wallpaper() -> Image.Image:
+    y, x = np.mgrid[0:2160, 0:3840]
+    pixels = np.stack([x // 15, y // 9, (x + y) // 24], axis=-1)
+    return Image.fromarray(pixels.clip(0, 255).astype(np.uint8), "RGB")
+
+
+def all_cases(resolutions: list[str]) -> list[Case]:
+    cases = []
+    for resolution in resolutions:
+        for background_type in BackgroundType:
+            if background_type in GEOMETRIZE_BACKGROUNDS:
+                cases.extend(
+                    Case(
+                        name=f"{background_type}/detail-{level}/{resolution}",
+                        resolution=resolution,
+                        background_type=background_type,
+                        detail_level=level,
+                    )
+                    for level in DETAIL_LEVEL_SAMPLES
+                )
+            elif background_type in BLURRABLE_BACKGROUNDS:
+                cases.extend(
+                    Case(
+                        name=f"{background_type}/{variant}/{resolution}",
+                        resolution=resolution,
+                        background_type=background_type,
+                        blur=blur,
+                        blur_quality=blur_quality,
+                        reference=f"{background_type}/blur/{resolution}"
+                        if blur_quality != "exact"
+                        else None,
+                    )
+                    for variant, (blur, blur_quality) in BLUR_VARIANTS.items()
+                )
+            else:
+                cases.append(
+                    Case(
+                        name=f"{background_type}/{resolution}",
+                        resolution=resolution,
+                        background_type=background_type,
+                    ),
+                )
+
+        # Foreground cost measured over the cheapest background
+        cases.extend(
+            Case(
+                name=f"foreground/{variant}/{resolution}",
+                resolution=resolution,
+                background_type=BackgroundType.SOLID_COLOR,
+                foreground=foreground,
+            )
+            for variant, foreground in FOREGROUND_VARIANTS.items()
+        )
+
+    return cases
+
+
+def summarise(times: list[float]) -> dict[str, float | list[float]]:
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "runs": times,
+    }
+
+
+def summarise_stages(
+    render_infos: list[albumpaper_rs.RenderInfo],
+) -> dict[str, dict]:
+    """
+    Output: {stage: {"ms": summary, "allocated_mb": median}} over the renders
+    """
+    totals = [misc.stage_totals(info.stages) for info in render_infos]
+    return {
+        stage: {
+            "ms": summarise([total[stage][0] for total in totals]),
+            "allocated_mb": statistics.median(
+                total[stage][1] / 1024**2 for total in totals
+            ),
+        }
+        for stage in totals[0]
+    }
+
+
+def time_ms(
+    function: Callable[[], object],
+    repeat: int,
+    setup: Callable[[], object] | None = None,
+) -> list[float]:
+    """
+    `setup` runs untimed before each call
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+class Benchmark:
+    def __init__(self, artwork: Image.Image, repeat: int, root: Path) -> None:
+        self.track = FixtureTrack(artwork)
+        self.repeat = repeat
+        self.root = root
+        self.images_dir = root / "cache" / "images"
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+
+        self.default_wallpaper = root / "default_wallpaper.jpg"
+        fixture_default_wallpaper().save(self.default_wallpaper, quality=95)
+
+    @property
+    def output_path(self) -> Path:
+        return self.images_dir / "generated_wallpaper.png"
+
+    def reset_fixture_files(self) -> None:
+        # The renderer replaces the default wallpaper with a copy resized to the
+        # display and caches the drop shadow for the previous geometry
+        shutil.copy(self.default_wallpaper, self.images_dir / "default_wallpaper.jpg")
+        (self.images_dir / "drop_shadow.png").unlink(missing_ok=True)
+
+    def generator(self, case: Case) -> GenerateWallpaper:
+        ConfigManager.background["global"]["detail_level"] = case.detail_level
+        if case.background_type in BLURRABLE_BACKGROUNDS:
+            ConfigManager.background[case.background_type]["blur"] = case.blur
+        # GenerateWallpaper reads the settings from the latest snapshot
+        ConfigManager.publish()
+
+        width, height = RESOLUTIONS[case.resolution]
+        generator = GenerateWallpaper(
+            display_geometry=(width, height, 0, 0),
+            available_geometry=(width, height - TASKBAR_HEIGHT, 0, 0),
+        )
+        generator.project_root = self.root
+        generator.render_cache = RenderCache(self.root / "renders", size=0)
+        # Fixed settings, without polluting the app's learnt render costs
+        generator.governor = RenderGovernor(
+            geometry=generator.display_geometry[:2],
+            deadline=0,
+            path=self.root / "render_costs.json",
+        )
+        generator.artwork_size = ARTWORK_SIZE
+        generator.blur_quality = case.blur_quality
+        generator.foreground_enabled = case.foreground.enabled
+        generator.drop_shadow = case.foreground.drop_shadow
+        generator.rounded_corners = case.foreground.rounded_corners
+        generator.spotify_code = case.foreground.spotify_code
+        return generator
+
+    def run_case(self, case: Case) -> tuple[dict, Image.Image]:
+        generator = self.generator(case)
+        background_config = generator.background_config(
+            case.background_type,
+            self.track,
+        )
+
+        def python_path() -> None:
+            generator.render(
+                self.track,
+                generator.background_config(case.background_type, self.track),
+            )
+
+        native_config = structs.GenerationConfig(
+            project_root=str(self.root),
+            artwork=structs.PythonImageBuffer(self.track.artwork),
+            background=background_config,
+            foreground=structs.ForegroundConfig(
+                show_artwork=case.foreground.enabled,
+                artwork_size=ARTWORK_SIZE,
+                drop_shadow=case.foreground.drop_shadow,
+                rounded_corners=case.foreground.rounded_corners,
+                spotify_code=structs.PythonImageBuffer(self.track.spotify_code_image)
+                if case.foreground.spotify_code
+                else None,
+            ),
+            display_geometry=generator.display_geometry[:2],
+            available_geometry=generator.available_geometry,
+        )
+
+        self.reset_fixture_files()
+        python_path()  # warm up caches the app keeps between renders
+
+        render_infos: list[albumpaper_rs.RenderInfo] = []
+        result = {
+            "python_ms": summarise(time_ms(python_path, self.repeat)),
+            # Without the layer caches, the cost of a track never rendered before
+            "native_ms": summarise(
+                time_ms(
+                    lambda: render_infos.append(
+                        albumpaper_rs.generate_save_wallpaper(native_config),
+                    ),
+                    self.repeat,
+                    setup=lambda: albumpaper_rs.clear_layer_caches(str(self.root)),
+                ),
+            ),
+            "native_stages": summarise_stages(render_infos),
+        }
+
+        with Image.open(self.output_path) as output:
+            return result, thumbnail(output)
+
+    def run_palette(self) -> dict:
+        artwork = self.track.artwork
+        # Starts the analysis worker if it is enabled, so it isn't timed
+        imagegen._dominant_colors_cached.func(artwork, 0)  # noqa: SLF001
+        # Bypass the joblib cache to measure the k-means itself
+        uncached = time_ms(
+            lambda: imagegen._dominant_colors_cached.func(artwork, 0),  # noqa: SLF001
+            self.repeat,
+        )
+        imagegen.dominant_colors(artwork)
+        cached = time_ms(lambda: imagegen.dominant_colors(artwork), self.repeat)
+        return {
+            "palette/uncached": {"python_ms": summarise(uncached)},
+            "palette/cached": {"python_ms": summarise(cached)},
+        }
+
+
+def thumbnail(image: Image.Image) -> Image.Image:
+    width, height = image.size
+    return image.convert("RGB").resize(
+        (THUMBNAIL_WIDTH, round(height * THUMBNAIL_WIDTH / width)),
+        Image.Resampling.BOX,
+    )
+
+
+def golden_path(golden_dir: Path, case_name: str) -> Path:
+    return golden_dir / f"{case_name.replace('/', '_')}.png"
+
+
+def mean_difference(image: Image.Image, expected: Image.Image) -> float:
+    """
+    Mean absolute difference (0-255), inf if the sizes differ
+    """
+    if image.size != expected.size:
+        return float("inf")
+    return float(
+        np.abs(
+            np.asarray(image.convert("RGB"), dtype=np.int16)
+            - np.asarray(expected.convert("RGB"), dtype=np.int16),
+        ).mean(),
+    )
+
+
+def golden_difference(
+    golden_dir: Path,
+    case_name: str,
+    image: Image.Image,
+) -> float | None:
+    """
+    Mean absolute difference (0-255) from the golden thumbnail, inf if the sizes
+    differ and None if there is no golden image for this case
+    """
+    path = golden_path(golden_dir, case_name)
+    if not path.exists():
+        return None
+
+    with Image.open(path) as golden:
+        return mean_difference(image, golden)
+
+
+def check_golden(
+    args: argparse.Namespace,
+    case_name: str,
+    image: Image.Image,
+    result: dict,
+) -> str | None:
+    """
+    Records the difference of `image` from the golden image in `result`
+    Output: A failure message if it is over the tolerance, None when
+    --update-golden saves `image` as the golden image instead
+    """
+    if args.update_golden:
+        args.golden_dir.mkdir(parents=True, exist_ok=True)
+        image.save(golden_path(args.golden_dir, case_name))
+        return None
+
+    difference = golden_difference(args.golden_dir, case_name, image)
+    result["golden_difference"] = difference
+    if difference is not None and difference > args.golden_tolerance:
+        return f"{case_name}: {difference:.2f}"
+    return None
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    messages = []
+    for case_name, metrics in results["cases"].items():
+        baseline_metrics = baseline["cases"].get(case_name, {})
+        medians = [
+            (metric, baseline_metrics[metric]["median"], summary["median"])
+            for metric, summary in metrics.items()
+            if metric in baseline_metrics and metric.endswith("_ms")
+        ]
+        baseline_stages = baseline_metrics.get("native_stages", {})
+        medians.extend(
+            (
+                f"{stage} stage",
+                baseline_stages[stage]["ms"]["median"],
+                summary["ms"]["median"],
+            )
+            for stage, summary in metrics.get("native_stages", {}).items()
+            if stage in baseline_stages
+        )
+
+        for metric, before, after in medians:
+            if before > 0 and after > before * (1 + threshold):
+                messages.append(
+                    f"{case_name} {metric}: {before:.1f} ms -> {after:.1f} ms "
+                    f"(+{(after / before - 1) * 100:.0f}%)",
+                )
+    return messages
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark wallpaper rendering")
+    parser.add_argument(
+        "--resolution",
+        action="append",
+        choices=list(RESOLUTIONS),
+        help="Only run these resolutions (default: all)",
+    )
+    parser.add_argument(
+        "--filter",
+        action="append",
+        default=[],
+        help="Only run cases whose name contains this text",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--artwork", type=Path, help="Use this image as artwork")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=AppPaths.PROJECT_ROOT / "cache" / "benchmark" / "results.json",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BENCHMARK_DIR / "baseline.json",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="Relative slowdown of the median that counts as a regression",
+    )
+    parser.add_argument("--golden-dir", type=Path, default=BENCHMARK_DIR / "golden")
+    parser.add_argument(
+        "--update-golden",
+        action="store_true",
+        help="Store these outputs as the new golden images",
+    )
+    parser.add_argument(
+        "--golden-tolerance",
+        type=float,
+        default=2.0,
+        help="Maximum mean absolute difference (0-255) from the golden image",
+    )
+    return parser.parse_args()
+
+
+def compare_baseline(args: argparse.Namespace, results: dict) -> list[str]:
+    """
+    Output: Regressions from the saved baseline, none when --save-baseline
+    saves `results` as the baseline instead
+    """
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+        print(f"Baseline saved to {args.baseline}")
+        return []
+    if not args.baseline.exists():
+        return []
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("version") != RESULTS_VERSION:
+        print("[WARNING] Baseline was written by a different version, skipping")
+        return []
+    return regressions(results, baseline, args.threshold)
+
+
+def main() -> int:
+    args = parse_args()
+
+    if args.artwork is not None:
+        with Image.open(args.artwork) as image:
+            artwork = image.convert("RGB")
+    else:
+        artwork = fixture_artwork()
+
+    cases = [
+        case
+        for case in all_cases(args.resolution or list(RESOLUTIONS))
+        if all(text in case.name for text in args.filter)
+    ]
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": dt.datetime.now(dt.UTC).isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "cases": {},
+    }
+    golden_failures = []
+    outputs: dict[str, Image.Image] = {}
+
+    with tempfile.TemporaryDirectory(prefix="albumpaper-bench-") as root:
+        benchmark = Benchmark(artwork, args.repeat, Path(root))
+
+        # Palette extraction doesn't depend on the case, run it unless filtered out
+        if all("palette" in text for text in args.filter):
+            results["cases"].update(benchmark.run_palette())
+
+        for case in cases:
+            result, output = benchmark.run_case(case)
+            results["cases"][case.name] = result
+            outputs[case.name] = output
+            if case.reference in outputs:
+                result["reference_difference"] = mean_difference(
+                    output,
+                    outputs[case.reference],
+                )
+
+            golden_failure = check_golden(args, case.name, output, result)
+            if golden_failure is not None:
+                golden_failures.append(golden_failure)
+
+            print(
+                f"{case.name:<40} native {result['native_ms']['median']:>9.1f} ms"
+                f"  python {result['python_ms']['median']:>9.1f} ms"
+                + (
+                    f"  {result['reference_difference']:.2f} from {case.reference}"
+                    if "reference_difference" in result
+                    else ""
+                ),
+            )
+
+    pool = albumpaper_rs.buffer_pool_stats()
+    results["buffer_pool"] = {
+        "hits": pool.hits,
+        "misses": pool.misses,
+        "hit_rate": pool.hit_rate,
+        "peak_mb": pool.peak_bytes / 1024**2,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2, sort_keys=True))
+    print(f"Results written to {args.output}")
+
+    regression_messages = compare_baseline(args, results)
+    for message in regression_messages:
+        print(f"[REGRESSION] {message}")
+    for message in golden_failures:
+        print(f"[GOLDEN MISMATCH] {message}")
+
+    return 1 if regression_messages or golden_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,21 @@
+from __future__ import annotations
+
 import sys
+import types
+from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
 import configobj
 import configobj.validate
 from PySide6 import QtWidgets
 
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping
+
+type ConfigKey = tuple[str, str, str]
+type ConfigListener = Callable[[ConfigSnapshot, set[ConfigKey]], None]
+
 
 class AppPaths:
     PROJECT_ROOT = Path(sys.argv[0]).resolve().parent
@@ -12,6 +23,16 @@ class AppPaths:
     DEFAULT_WALLPAPER = PROJECT_ROOT / "./cache/images/default_wallpaper.jpg"
     GENERATED_WALLPAPER = PROJECT_ROOT / "./cache/images/generated_wallpaper.png"
     DROP_SHADOW = PROJECT_ROOT / "./cache/images/drop_shadow.png"
+    RENDER_COSTS = PROJECT_ROOT / "./cache/render_costs.json"
+    RENDER_CACHE = PROJECT_ROOT / "./cache/renders/"
+    SESSION = PROJECT_ROOT / "./cache/session.json"
+    RELEASE_CHECK = PROJECT_ROOT / "./cache/release_check.json"
+    # Perceptual hashes and palettes of artworks seen before
+    ARTWORK_INDEX = PROJECT_ROOT / "./cache/artwork_index.json"
+    # Project root of the settings window's thumbnail renders
+    PREVIEW_ROOT = PROJECT_ROOT / "./cache/preview/"
+    # Written by the headless platform in place of setting the wallpaper
+    CURRENT_WALLPAPER = PROJECT_ROOT / "./cache/current_wallpaper.txt"
 
     CONFIG_DIR = PROJECT_ROOT / "./config/"
     DEV_CONFIG_DIR = PROJECT_ROOT / "./config-dev/"
@@ -41,6 +62,41 @@ class AppPaths:
         return str(path.absolute())
 
 
+def _freeze(section: Mapping) -> Mapping:
+    return types.MappingProxyType({
+        key: _freeze(value) if isinstance(value, dict) else value
+        for key, value in section.items()
+    })
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Read-only copy of the validated settings at one point in time, keys are
+    looked up the same way as ConfigManager e.g. snapshot.settings["cache"]["size"]
+    """
+
+    settings: Mapping[str, Mapping[str, Any]]
+    services: Mapping[str, Mapping[str, Any]]
+    background: Mapping[str, Mapping[str, Any]]
+
+    def items(self) -> dict[ConfigKey, Any]:
+        return {
+            (file, section, key): value
+            for file in ("settings", "services", "background")
+            for section, values in getattr(self, file).items()
+            for key, value in values.items()
+        }
+
+    def changed_keys(self, other: ConfigSnapshot) -> set[ConfigKey]:
+        items, other_items = self.items(), other.items()
+        return {
+            key
+            for key in items.keys() | other_items.keys()
+            if items.get(key) != other_items.get(key)
+        }
+
+
 class ConfigManager:
     services = configobj.ConfigObj(AppPaths.get_config(AppPaths.SECRETS))
 
@@ -59,9 +115,92 @@ class ConfigManager:
     background.validate(_validator)
 
     _widgets: dict[tuple[str, ...], QtWidgets.QWidget] = {}  # noqa: RUF012
+    _listeners: list[ConfigListener] = []  # noqa: RUF012
+    _snapshot: ConfigSnapshot | None = None
+
+    @classmethod
+    def snapshot(cls) -> ConfigSnapshot:
+        if cls._snapshot is None:
+            cls._snapshot = cls._take_snapshot()
+        return cls._snapshot
+
+    @classmethod
+    def _take_snapshot(cls) -> ConfigSnapshot:
+        return ConfigSnapshot(
+            settings=_freeze(cls.settings),
+            services=_freeze(cls.services),
+            background=_freeze(cls.background),
+        )
+
+    @classmethod
+    def widget_snapshot(cls) -> ConfigSnapshot:
+        """
+        The settings as currently shown in the settings window, before they are
+        saved
+        """
+        files = {
+            "settings": cls.settings.dict(),
+            "services": cls.services.dict(),
+            "background": cls.background.dict(),
+        }
+        for (file, section, key), widget in cls._widgets.items():
+            files[file][section][key] = cls.get_widget_state(widget)
+
+        return ConfigSnapshot(
+            **{file: _freeze(values) for file, values in files.items()},
+        )
+
+    @classmethod
+    def connect_widgets(cls, file: str, slot: Callable[[], None]) -> None:
+        """
+        Calls `slot` whenever a registered widget of `file` is edited
+        """
+
+        def changed(*_args: object) -> None:
+            slot()
+
+        for key, widget in cls._widgets.items():
+            if key[0] != file:
+                continue
+
+            if isinstance(widget, (QtWidgets.QCheckBox, QtWidgets.QGroupBox)):
+                widget.toggled.connect(changed)
+
+            if isinstance(widget, QtWidgets.QSpinBox):
+                widget.valueChanged.connect(changed)
+
+            if isinstance(widget, QtWidgets.QLineEdit):
+                widget.textChanged.connect(changed)
+
+            if isinstance(widget, QtWidgets.QComboBox):
+                widget.currentIndexChanged.connect(changed)
 
     @classmethod
-    def validate_service(cls) -> bool | str:
+    def subscribe(cls, listener: ConfigListener) -> None:
+        """
+        `listener` is called with the new snapshot and the keys that changed each
+        time the settings are saved, on the thread that saved them
+        """
+        cls._listeners.append(listener)
+
+    @classmethod
+    def unsubscribe(cls, listener: ConfigListener) -> None:
+        if listener in cls._listeners:
+            cls._listeners.remove(listener)
+
+    @classmethod
+    def publish(cls) -> None:
+        previous = cls.snapshot()
+        cls._snapshot = cls._take_snapshot()
+        changed = cls._snapshot.changed_keys(previous)
+        if not changed:
+            return
+
+        for listener in list(cls._listeners):
+            listener(cls._snapshot, changed)
+
+    @classmethod
+    def validate_service(cls) -> bool | str:  # noqa: PLR0911
 
         api_key_length = 32
 
@@ -88,6 +227,17 @@ class ConfigManager:
             ):
                 return "Set valid Last.fm API key"
 
+        # pushed by a local player or tool
+        elif service_option == 2:  # noqa: PLR2004
+            port = cls.value_from_key("settings", "service", "local_port")
+            if not 1024 <= port <= 65535:  # noqa: PLR2004
+                return "Set a valid port"
+
+            min_token_length = 16
+            token = cls.value_from_key("settings", "service", "local_token")
+            if len(token) < min_token_length:
+                return "Set a token of at least 16 characters"
+
         else:
             return "Set a valid service"
 
@@ -107,6 +257,7 @@ class ConfigManager:
         cls.settings.write()
         cls.services.write()
         cls.background.write()
+        cls.publish()
 
     @classmethod
     def register(cls, key: tuple[str], widget: QtWidgets.QWidget) -> QtWidgets.QWidget:
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import collections
+import json
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import structs
+
+# Number of timings kept per background type and geometry
+HISTORY_LENGTH = 20
+
+
+class RenderGovernor:
+    """
+    Learns how long each background type takes to render on this machine at a
+    given display geometry and picks the most detailed settings that are
+    predicted to finish within `deadline` ms.
+
+    Render cost is modelled as linear in the "work" of a background, the
+    n_samples for geometrize backgrounds and the blur radius for blurred ones,
+    which is never lowered as a smaller radius isn't faster.
+    A deadline of 0 disables the governor and configured values are used as is.
+    """
+
+    def __init__(
+        self,
+        geometry: tuple[int, int],
+        deadline: float,
+        path: Path,
+    ) -> None:
+        self.geometry = geometry
+        self.deadline = deadline
+        self.path = path
+
+        self.history: dict[str, collections.deque[tuple[int, float]]] = {}
+        try:
+            saved = json.loads(path.read_text())
+        except (OSError, ValueError):
+            saved = {}
+
+        for key, timings in saved.items():
+            self.history[key] = collections.deque(
+                (tuple(timing) for timing in timings),
+                maxlen=HISTORY_LENGTH,
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.deadline > 0
+
+    def _key(self, background_type: str) -> str:
+        width, height = self.geometry
+        return f"{background_type}@{width}x{height}"
+
+    @staticmethod
+    def work(background_config: structs.BackgroundConfig) -> int:
+        if background_config.n_samples is not None:
+            return background_config.n_samples
+        return background_config.blur_radius or 0
+
+    def predict(self, background_type: str, work: int) -> float | None:
+        """
+        Predicted render time in ms, None if this background type hasn't been
+        rendered at the current geometry yet
+        """
+        timings = self.history.get(self._key(background_type))
+        if not timings:
+            return None
+
+        works = [w for w, _ in timings]
+        times = [t for _, t in timings]
+        mean_work = sum(works) / len(works)
+        mean_time = sum(times) / len(times)
+
+        variance = sum((w - mean_work) ** 2 for w in works)
+        if variance == 0:
+            # Only one distinct work value seen, assume time is proportional to work
+            if mean_work == 0:
+                return mean_time
+            return mean_time * work / mean_work
+
+        slope = (
+            sum((w - mean_work) * (t - mean_time) for w, t in timings) / variance
+        )
+        slope = max(slope, 0)
+        intercept = mean_time - slope * mean_work
+        return max(intercept + slope * work, 0)
+
+    def fit(self, background_type: str, candidates: list[int]) -> int:
+        """
+        Input: ascending list of work values, the last being the configured one
+        Output: The largest candidate predicted to render within the deadline
+        """
+        if not self.enabled:
+            return candidates[-1]
+
+        for work in reversed(candidates):
+            predicted = self.predict(background_type, work)
+            # Unknown cost, render at configured quality to learn it
+            if predicted is None or predicted <= self.deadline:
+                return work
+
+        return candidates[0]
+
+    def weights(self, cheapest: dict[str, int]) -> list[float]:
+        """
+        Input: background type -> its cheapest work value
+        Output: Random choice weights, backgrounds that can't fit the deadline
+        even at their lowest quality are picked less often
+        """
+        weights = []
+        for background_type, work in cheapest.items():
+            predicted = self.predict(background_type, work)
+            if not self.enabled or predicted is None or predicted <= self.deadline:
+                weights.append(1.0)
+            else:
+                weights.append(max(self.deadline / predicted, 0.05))
+        return weights
+
+    def record(
+        self,
+        background_config: structs.BackgroundConfig,
+        elapsed: float,
+    ) -> None:
+        key = self._key(background_config.background_type)
+        timings = self.history.setdefault(
+            key,
+            collections.deque(maxlen=HISTORY_LENGTH),
+        )
+        timings.append((self.work(background_config), elapsed))
+
+        try:
+            self.path.write_text(
+                json.dumps({k: list(v) for k, v in self.history.items()}),
+            )
+        except OSError:
+            print("[ERROR] Failed to save render timings")
@@ -1,12 +1,12 @@
 import joblib
 import numpy as np
-import scipy
-import sklearn
 import xxhash
+from analysis import AnalysisWorker, kmeans_palette
 from configuration import AppPaths, ConfigManager
 from misc import Color  # noqa: TC002
-from PIL import Image  # noqa: TC002
+from PIL import Image
 from misc import timer
+from similarity import ArtworkIndex, ArtworkSignature
 
 
 def srgb_to_lin(color_channel: float) -> float:
@@ -37,10 +37,54 @@ def perceived_lightness(Y: float) -> float:  # noqa: N803
 
     return Y ** (1 / 3) * 116 - 16
 
+
+def recolor_spotify_code(
+    code: Image.Image,
+    background: Color,
+    bars: Color,
+    width: int,
+) -> Image.Image:
+    """
+    Input: Spotify code with white bars on black, the new colors and width
+    Output: The resized code in the new colors, the brightness of the original
+    is used as bar coverage so the antialiased edges are kept
+    """
+    height = round(code.height * width / code.width)
+    coverage = np.asarray(
+        code.convert("L").resize((width, height), Image.Resampling.LANCZOS),
+        dtype=np.float32,
+    )[..., np.newaxis] / 255
+
+    recolored = (
+        np.asarray(background, dtype=np.float32) * (1 - coverage)
+        + np.asarray(bars, dtype=np.float32) * coverage
+    )
+    return Image.fromarray(np.rint(recolored).astype(np.uint8), "RGB")
+
+# Images are analysed at PALETTE_SIZE x PALETTE_SIZE
+PALETTE_SIZE = 150
+
+
 @timer(min_time=50)
 def dominant_colors(image: Image.Image) -> list[Color]:
+    # From the snapshot like GenerateWallpaper.similar_artwork_id, so palettes
+    # and renders are matched at the same distance
+    config = ConfigManager.snapshot()
+    max_distance = config.settings["cache"]["similar_artwork_distance"]
+    if max_distance < 0:
+        image_hash = xxhash.xxh32(image.tobytes("raw")).intdigest()
+        return _dominant_colors_cached(image, image_hash)
+
+    # The same artwork from another release has different pixels
+    signature = ArtworkSignature.of(image)
+    similar_palette = ArtworkIndex.palette(signature, max_distance)
+    if similar_palette is not None:
+        return similar_palette
+
     image_hash = xxhash.xxh32(image.tobytes("raw")).intdigest()
-    return _dominant_colors_cached(image, image_hash)
+    colors = _dominant_colors_cached(image, image_hash)
+    ArtworkIndex.add_palette(signature, colors)
+    return colors
 
 
 mem = joblib.Memory(AppPaths.PROJECT_ROOT / "cache" / "dominant_colors", verbose=0)
@@ -51,25 +95,17 @@ def _dominant_colors_cached(image: Image.Image, _image_hash: int) -> list[Color]
     """
     Input: PIL image
     Output: A list of 10 colors in the image from most dominant to least dominant
-    Adaptation of https://stackoverflow.com/a/3244061/7274182
     """
-    ar = np.asarray(image.resize((150, 150), 0))
+    ar = np.asarray(image.resize((PALETTE_SIZE, PALETTE_SIZE), 0))
     shape = ar.shape
-    ar = ar.reshape(np.prod(shape[:2]), shape[2]).astype(
-        float,
-    )  # flatten to shape (width*height, 3)
-
-    kmeans = sklearn.cluster.MiniBatchKMeans(
-        n_clusters=10,
-        init="k-means++",
-        max_iter=20,
-        random_state=1000,  # fixed seed for consistent colors
-    ).fit(ar)
-    codes = kmeans.cluster_centers_
+    ar = ar.reshape(np.prod(shape[:2]), shape[2])  # flatten to shape (width*height, 3)
 
-    vecs, _dist = scipy.cluster.vq.vq(ar, codes)  # assign codes
-    counts, _bins = np.histogram(vecs, len(codes))  # count occurrences
+    performance = ConfigManager.settings["performance"]
+    if performance["analysis_worker"]:
+        colors = AnalysisWorker.palette(ar, performance["analysis_worker_idle"])
+    else:
+        colors = kmeans_palette(ar)
 
     mem.reduce_size(bytes_limit=f"{int(ConfigManager.settings['cache']['size']) / 2}M")
 
-    return [tuple(row) for row in codes[np.argsort(counts)[::-1]].astype(int)]
+    return colors
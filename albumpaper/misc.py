@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import concurrent.futures
 import functools
 import inspect
 import time
@@ -55,14 +56,67 @@ class timer[R]:
         return False
 
 
+def stage_totals(stages: list[tuple[str, float, int]]) -> dict[str, tuple[float, int]]:
+    """
+    Output: {stage: (milliseconds, bytes allocated)} of a native render, in the
+    order the stages first ran
+    """
+    totals = {}
+    for name, elapsed, allocated in stages:
+        total_elapsed, total_allocated = totals.get(name, (0.0, 0))
+        totals[name] = (total_elapsed + elapsed, total_allocated + allocated)
+    return totals
+
+
+def format_stages(stages: list[tuple[str, float, int]]) -> str:
+    return ", ".join(
+        f"{name} {elapsed:.1f} ms / {allocated / 1024**2:.1f} MB"
+        for name, (elapsed, allocated) in stage_totals(stages).items()
+    )
+
+
 @timer(min_time = 100)
-def download_image(url: str) -> Image.Image | None:
+def download_image(url: str, draft_size: int | None = None) -> Image.Image | None:
+    return _open_image(url, draft_size)
+
+
+def _open_image(url: str, draft_size: int | None = None) -> Image.Image | None:
     try:
-        response_content = _download_image_cached(url)
-        return Image.open(BytesIO(response_content)).convert("RGB")
+        return decode_image(_download_image_cached(url), draft_size)
     except requests.exceptions.MissingSchema:
         return None
 
+
+def decode_image(content: bytes, draft_size: int | None = None) -> Image.Image:
+    image = Image.open(BytesIO(content))
+    if draft_size is not None:
+        # JPEGs are decoded straight to 1/2, 1/4 or 1/8 scale as long as
+        # both sides stay at least draft_size, other formats ignore this
+        image.draft("RGB", (draft_size, draft_size))
+    return image.convert("RGB")
+
+
+_prefetch_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=4,
+    thread_name_prefix="prefetch",
+)
+
+
+def in_background[**P, R](
+    func: Callable[P, R],
+    *args: P.args,
+    **kwargs: P.kwargs,
+) -> concurrent.futures.Future[R]:
+    return _prefetch_pool.submit(func, *args, **kwargs)
+
+
+def prefetch_image(url: str) -> concurrent.futures.Future[Image.Image | None]:
+    """
+    Start downloading an image in the background, the future's result is the
+    same as download_image(url)
+    """
+    return in_background(_open_image, url)
+
 def clamp(num: float | int, min_: float | int, max_: float | int) -> float | int:
     return max(min_, min(max_, num))
 
@@ -0,0 +1,209 @@
+"""
+Now playing events pushed by a local player plugin or tool, so the wallpaper
+changes as soon as the track does and nothing is polled while idle.
+
+Clients connect to 127.0.0.1 on [service] local_port and send one JSON object
+per line, every key but "token" and "playing" is optional:
+
+    {"token": "...", "playing": true, "id": "...", "track": "...",
+     "album": "...", "artists": ["..."], "artwork_url": "https://...",
+     "artwork": "<base64>"}
+
+"token" is the token set in the service settings, so web pages and other
+users' programs that can reach the port can't push tracks. "artwork" is the
+image file's bytes and is used over "artwork_url". {"playing": false} sets the
+default wallpaper. Each line is answered with {"ok": true} or
+{"ok": false, "error": "..."}. Connections that start with an HTTP request
+line are closed.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import contextlib
+import hmac
+import json
+import re
+import socket
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+from typing import TYPE_CHECKING
+
+import xxhash
+from PIL import Image
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from typing import BinaryIO
+
+HOST = "127.0.0.1"
+# Longest line accepted, enough for base64 artwork of a few MB
+MAX_EVENT_BYTES = 16 * 1024 * 1024
+# e.g. "POST / HTTP/1.1", a browser can send a request here with a JSON body
+HTTP_REQUEST_LINE = re.compile(rb"^[A-Z]+ \S+ HTTP/\d")
+
+
+@dataclass(frozen=True)
+class NowPlaying:
+    playing: bool
+    track_id: str | None = None
+    track_name: str | None = None
+    album_name: str | None = None
+    artist_names: tuple[str, ...] = ()
+    artwork_url: str | None = None
+    artwork: bytes | None = None
+
+    @classmethod
+    def from_event(cls, event: object) -> NowPlaying:
+        """
+        Raises ValueError describing what is wrong with `event`
+        """
+        if not isinstance(event, dict):
+            msg = "event must be a JSON object"
+            raise ValueError(msg)  # noqa: TRY004
+        if not isinstance(event.get("playing"), bool):
+            msg = '"playing" must be true or false'
+            raise ValueError(msg)  # noqa: TRY004
+
+        for key in ("id", "track", "album", "artwork_url", "artwork"):
+            if not isinstance(event.get(key), (str, type(None))):
+                msg = f'"{key}" must be a string'
+                raise ValueError(msg)  # noqa: TRY004
+        artists = event.get("artists", [])
+        if not isinstance(artists, list) or not all(
+            isinstance(artist, str) for artist in artists
+        ):
+            msg = '"artists" must be a list of strings'
+            raise ValueError(msg)
+
+        artwork = None
+        if event.get("artwork") is not None:
+            try:
+                artwork = base64.b64decode(event["artwork"], validate=True)
+                # Only reads the header, the image is decoded when it is rendered
+                Image.open(BytesIO(artwork))
+            except (binascii.Error, OSError) as e:
+                msg = '"artwork" must be a base64 encoded image'
+                raise ValueError(msg) from e
+
+        return cls(
+            playing=event["playing"],
+            track_id=event.get("id"),
+            track_name=event.get("track"),
+            album_name=event.get("album"),
+            artist_names=tuple(artists),
+            artwork_url=event.get("artwork_url"),
+            artwork=artwork,
+        )
+
+    @property
+    def artwork_key(self) -> str | None:
+        """
+        Identifies the artwork, a track can be pushed again with new artwork
+        """
+        if self.artwork is not None:
+            return xxhash.xxh64(self.artwork).hexdigest()
+        return self.artwork_url
+
+
+class NowPlayingSource:
+    """
+    Listens on `port` until closed for events with `token`, `on_event` is
+    called on the connection's thread after each event is stored
+    """
+
+    def __init__(self, port: int, token: str, on_event: Callable[[], None]) -> None:
+        self._token = token.encode()
+        self._on_event = on_event
+        self._lock = threading.Lock()
+        self._latest: NowPlaying | None = None
+        self._connections: set[socket.socket] = set()
+        self._closed = False
+
+        # Raises OSError if the port is in use
+        self._server = socket.create_server((HOST, port))
+        threading.Thread(target=self._accept, name="now-playing", daemon=True).start()
+
+    def latest(self) -> NowPlaying | None:
+        """
+        Output: The last event pushed, None if there hasn't been one
+        """
+        with self._lock:
+            return self._latest
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            connections = [self._server, *self._connections]
+        for connection in connections:
+            # Wakes the threads blocked on them, shutting down a listening
+            # socket fails on Windows where closing it is enough
+            with contextlib.suppress(OSError):
+                connection.shutdown(socket.SHUT_RDWR)
+            connection.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection, _address = self._server.accept()
+            except OSError:  # closed
+                return
+            with self._lock:
+                if self._closed:
+                    connection.close()
+                    return
+                self._connections.add(connection)
+            threading.Thread(
+                target=self._serve,
+                args=(connection,),
+                name="now-playing-connection",
+                daemon=True,
+            ).start()
+
+    def _serve(self, connection: socket.socket) -> None:
+        try:
+            with connection, connection.makefile("rwb") as stream:
+                first_line = True
+                while line := stream.readline(MAX_EVENT_BYTES + 1):
+                    if first_line and HTTP_REQUEST_LINE.match(line):
+                        return
+                    first_line = False
+                    if len(line) > MAX_EVENT_BYTES:
+                        self._reply(stream, "event too long")
+                        return
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line)
+                        if not self._authorised(event):
+                            self._reply(stream, "invalid token")
+                            continue
+                        now_playing = NowPlaying.from_event(event)
+                    except ValueError as e:  # JSONDecodeError is a ValueError
+                        self._reply(stream, str(e))
+                        continue
+
+                    with self._lock:
+                        self._latest = now_playing
+                    self._reply(stream)
+                    self._on_event()
+        except OSError:  # disconnected or closed
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+
+    def _authorised(self, event: object) -> bool:
+        token = event.get("token") if isinstance(event, dict) else None
+        return isinstance(token, str) and hmac.compare_digest(
+            token.encode(),
+            self._token,
+        )
+
+    @staticmethod
+    def _reply(stream: BinaryIO, error: str | None = None) -> None:
+        reply = {"ok": True} if error is None else {"ok": False, "error": error}
+        stream.write(json.dumps(reply).encode() + b"\n")
+        stream.flush()
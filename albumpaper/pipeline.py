@@ -0,0 +1,180 @@
+"""
+Sets wallpapers on a thread of their own so polling carries on during a render.
+Only the latest action matters: one that arrives while another is waiting
+replaces it and a render in progress is cancelled, so skipping through tracks
+renders the last one rather than each in turn.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import albumpaper_rs
+from misc import GenerateNew, Unchanged, WallpaperAction
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from wallpaper import GenerateWallpaper, Track
+
+# Seconds without a render before the buffers kept for the next one are freed
+RELEASE_BUFFERS_AFTER = 60
+
+
+class RenderPipeline:
+    def __init__(
+        self,
+        generator: GenerateWallpaper,
+        debounce: float = 0,
+        on_abandoned: Callable[[], None] | None = None,
+    ) -> None:
+        self.generator = generator
+        # Called when a track is added to take_abandoned's list
+        self._on_abandoned = on_abandoned
+        # Seconds a new track waits before it is rendered, in case it is skipped
+        self.debounce = debounce
+
+        self._condition = threading.Condition()
+        # Held while the generator is in use
+        self._generator_lock = threading.Lock()
+        self._pending: WallpaperAction | None = None
+        self._pending_since = 0.0  # time.monotonic()
+        self._cancel: albumpaper_rs.CancelToken | None = None
+        self._stopped = False
+        # Rendered since the render buffers were last released
+        self._holding_buffers = False
+        # Tracks that were never set as the wallpaper, see take_abandoned
+        self._abandoned: list[Track] = []
+
+        # Renders replaced before they started and cancelled part way through
+        self.discarded = 0
+        self.cancelled = 0
+        # ms spent on cancelled renders
+        self.cancelled_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="render", daemon=True)
+        self._thread.start()
+
+    def submit(self, action: WallpaperAction) -> None:
+        if isinstance(action, Unchanged):
+            return
+        with self._condition:
+            self._drop_pending()
+            self._pending = action
+            self._pending_since = time.monotonic()
+            if self._cancel is not None:
+                self._cancel.cancel()
+            self._condition.notify()
+
+    def cancel(self) -> None:
+        """
+        Drop the waiting action and cancel a render in progress
+        """
+        with self._condition:
+            self._drop_pending()
+            if self._cancel is not None:
+                self._cancel.cancel()
+
+    def update_generator(self, update: Callable[[GenerateWallpaper], None]) -> None:
+        """
+        Cancels a render in progress then calls `update` once the generator is
+        no longer in use
+        """
+        self.cancel()
+        with self._generator_lock:
+            update(self.generator)
+
+    def take_abandoned(self) -> list[Track]:
+        """
+        Output: Tracks discarded or cancelled since the last call, they need
+        rendering again if they play again
+        """
+        with self._condition:
+            abandoned, self._abandoned = self._abandoned, []
+        return abandoned
+
+    def stop(self) -> None:
+        """
+        Cancels a render in progress and waits for the thread to exit
+        """
+        with self._condition:
+            self._stopped = True
+            self._drop_pending()
+            if self._cancel is not None:
+                self._cancel.cancel()
+            self._condition.notify()
+        self._thread.join()
+
+    def _drop_pending(self) -> None:
+        if isinstance(self._pending, GenerateNew):
+            self.discarded += 1
+            self._abandoned.append(self._pending.track)
+            if self._on_abandoned is not None:
+                self._on_abandoned()
+            print(
+                f"Discarded render of {self._pending.track.identity}"
+                f" ({self.discarded} discarded, {self.cancelled} cancelled)",
+            )
+        self._pending = None
+
+    def _next_action(self) -> tuple[WallpaperAction, albumpaper_rs.CancelToken] | None:
+        """
+        Output: The latest action once it is due, None when stopped
+        """
+        with self._condition:
+            while True:
+                if self._stopped:
+                    return None
+                if self._pending is None:
+                    if not self._holding_buffers:
+                        self._condition.wait()
+                    elif not self._condition.wait(RELEASE_BUFFERS_AFTER):
+                        albumpaper_rs.release_render_buffers()
+                        self._holding_buffers = False
+                    continue
+
+                if isinstance(self._pending, GenerateNew):
+                    remaining = self._pending_since + self.debounce - time.monotonic()
+                    if remaining > 0:
+                        # Woken early if it is replaced
+                        self._condition.wait(remaining)
+                        continue
+
+                action, self._pending = self._pending, None
+                self._cancel = albumpaper_rs.CancelToken()
+                return action, self._cancel
+
+    def _run(self) -> None:
+        try:
+            while (next_action := self._next_action()) is not None:
+                action, cancel = next_action
+
+                start = time.perf_counter()
+                with self._generator_lock:
+                    completed = self.generator.generate(action, cancel)
+
+                with self._condition:
+                    self._cancel = None
+                    self._holding_buffers = True
+                    # A cancelled SetPrevious or SetDefault was replaced before
+                    # it set the wallpaper, nothing needs rendering again
+                    if not completed and isinstance(action, GenerateNew):
+                        elapsed = (time.perf_counter() - start) * 1000
+                        self.cancelled += 1
+                        self.cancelled_time += elapsed
+                        self._abandoned.append(action.track)
+                        if self._on_abandoned is not None:
+                            self._on_abandoned()
+                        print(
+                            f"Cancelled render of {action.track.identity}"
+                            f" after {elapsed:.4g} ms ({self.discarded} discarded,"
+                            f" {self.cancelled} cancelled, {self.cancelled_time:.4g}"
+                            " ms spent on cancelled renders)",
+                        )
+        except Exception:
+            logging.getLogger("root").exception("Render Error")
+            if __debug__:
+                raise
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import abc
+import contextlib
+import functools
+import glob
+import os
+import socket
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+from configuration import AppPaths
+
+
+class AlreadyRunningError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class PowerStatus:
+    on_battery: bool
+    percent: int | None = None  # None if unknown or there is no battery
+
+
+class Platform:
+    """
+    Operating system services used by the app. This base class is the headless
+    backend, the wallpaper "set" is recorded in a file and everything else is a
+    no-op, so the full pipeline can run and be profiled on any OS.
+    """
+
+    name = "headless"
+
+    def set_wallpaper(self, path: Path) -> None:
+        AppPaths.CURRENT_WALLPAPER.parent.mkdir(parents=True, exist_ok=True)
+        AppPaths.CURRENT_WALLPAPER.write_text(str(Path(path).absolute()))
+
+    def wallpaper_candidates(self) -> list[str]:
+        """
+        Paths that may hold the current desktop wallpaper, most preferred first
+        """
+        return []
+
+    def battery_saver_enabled(self) -> bool:
+        return False
+
+    def power_status(self) -> PowerStatus:
+        return PowerStatus(on_battery=False)
+
+    def single_instance_lock(self, name: str) -> InstanceLock:
+        # fcntl is POSIX only, headless on Windows still uses the named mutex
+        if sys.platform == "win32":
+            return WindowsMutex(name)
+        return FileLock(name)
+
+    def host_name(self) -> str:
+        return socket.gethostname()
+
+    def set_run_at_startup(self, name: str, exe_path: Path, *, enabled: bool) -> None:
+        pass
+
+    def set_app_user_model_id(self, app_id: str) -> None:
+        pass
+
+
+class InstanceLock(abc.ABC):
+    @abc.abstractmethod
+    def release(self) -> None: ...
+
+
+class FileLock(InstanceLock):
+    # https://docs.python.org/3/library/fcntl.html#fcntl.flock
+    def __init__(self, name: str) -> None:
+        import fcntl  # noqa: PLC0415 POSIX only
+
+        self._fcntl = fcntl
+        path = AppPaths.PROJECT_ROOT / "cache" / f"{name}.lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("w")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            self._file.close()
+            raise AlreadyRunningError from e
+
+    def release(self) -> None:
+        self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+        self._file.close()
+
+
+class WindowsMutex(InstanceLock):
+    def __init__(self, name: str) -> None:
+        import winapi  # noqa: PLC0415 loads windll
+
+        try:
+            self._mutex = winapi.NamedMutex(name.encode())
+        except winapi.MutexNotAquiredError as e:
+            raise AlreadyRunningError from e
+
+    def release(self) -> None:
+        self._mutex.release()
+
+
+class WindowsPlatform(Platform):
+    name = "windows"
+
+    SPI_GETDESKWALLPAPER = 0x0073
+    SPI_SETDESKWALLPAPER = 20
+
+    def set_wallpaper(self, path: Path) -> None:
+        import ctypes  # noqa: PLC0415
+
+        abs_path = os.path.abspath(path)  # noqa: PTH100
+        ctypes.windll.user32.SystemParametersInfoW(
+            self.SPI_SETDESKWALLPAPER,
+            0,
+            abs_path,
+            0,
+        )
+
+    def wallpaper_candidates(self) -> list[str]:
+        r"""
+        1. First look in %APPDATA%\Microsoft\Windows\Themes\CachedFiles
+        and use most recent image (this will have the resolution of the desktop)
+        2. If that fails look for %APPDATA%\Microsoft\Windows\Themes\TranscodedWallpaper
+        (this will have the resolution of the original image)
+        3. If that fails find the original path of the wallpaper and save that
+        image instead https://stackoverflow.com/questions/44867820/
+        """
+        import ctypes  # noqa: PLC0415
+
+        cached_folder = os.path.expandvars(
+            r"%APPDATA%\Microsoft\Windows\Themes\CachedFiles\*",
+        )
+        list_of_files = glob.glob(cached_folder)  # noqa: PTH207
+        if list_of_files:
+            current_wallpaper = max(list_of_files, key=os.path.getctime)
+        else:
+            current_wallpaper = os.path.expandvars(
+                r"%APPDATA%\Microsoft\Windows\Themes\TranscodedWallpaper",
+            )
+
+        ubuf = ctypes.create_unicode_buffer(200)
+        ctypes.windll.user32.SystemParametersInfoW(
+            self.SPI_GETDESKWALLPAPER,
+            200,
+            ubuf,
+            0,
+        )
+
+        return [current_wallpaper, ubuf.value]
+
+    def battery_saver_enabled(self) -> bool:
+        import winapi  # noqa: PLC0415
+
+        return winapi.battery_saver_enabled()
+
+    def power_status(self) -> PowerStatus:
+        import winapi  # noqa: PLC0415
+
+        on_battery, percent = winapi.power_status()
+        return PowerStatus(on_battery=on_battery, percent=percent)
+
+    def single_instance_lock(self, name: str) -> InstanceLock:
+        return WindowsMutex(name)
+
+    def host_name(self) -> str:
+        return os.environ["COMPUTERNAME"]
+
+    def set_run_at_startup(self, name: str, exe_path: Path, *, enabled: bool) -> None:
+        import winreg  # noqa: PLC0415
+
+        key = winreg.OpenKey(
+            winreg.HKEY_CURRENT_USER,
+            r"SOFTWARE\Microsoft\Windows\CurrentVersion\Run",
+            0,
+            winreg.KEY_SET_VALUE,
+        )
+
+        if enabled:
+            winreg.SetValueEx(key, name, 0, winreg.REG_SZ, str(exe_path))
+
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                winreg.DeleteValue(key, name)
+
+        winreg.CloseKey(key)
+
+    def set_app_user_model_id(self, app_id: str) -> None:
+        import ctypes  # noqa: PLC0415
+
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(app_id)
+
+
+PLATFORMS: dict[str, type[Platform]] = {
+    Platform.name: Platform,
+    WindowsPlatform.name: WindowsPlatform,
+}
+
+
+@functools.cache
+def current() -> Platform:
+    """
+    The backend for this OS, ALBUMPAPER_PLATFORM=headless forces the headless
+    backend e.g. for profiling on Windows
+    """
+    default = WindowsPlatform.name if sys.platform == "win32" else Platform.name
+    return PLATFORMS[os.environ.get("ALBUMPAPER_PLATFORM", default)]()
@@ -0,0 +1,84 @@
+"""
+Trades render quality and polling frequency for battery life. A policy for
+each power state is read from the [power] settings, the power check thread
+picks the current one and the worker applies it between polls.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from platforms import PowerStatus
+
+
+@dataclass(frozen=True)
+class PowerPolicy:
+    name: str
+    # request_interval is multiplied by this
+    interval_multiplier: float = 1.0
+    # Highest detail level of geometrize backgrounds, None for the configured one
+    max_detail_level: int | None = None
+    blur: bool = True
+    # Prefer backgrounds that render quickly over lowpoly and pointillist
+    cheap_backgrounds: bool = False
+    # Download the palette and Spotify code alongside the artwork
+    prefetch: bool = True
+
+    @classmethod
+    def from_settings(cls, name: str, power_settings: dict) -> PowerPolicy:
+        """
+        Output: The policy from the `{name}_*` keys of the [power] settings
+        """
+        return cls(
+            name=name,
+            interval_multiplier=max(1.0, power_settings[f"{name}_interval_multiplier"]),
+            max_detail_level=max(1, power_settings[f"{name}_max_detail_level"]),
+            blur=power_settings[f"{name}_blur"],
+            cheap_backgrounds=power_settings[f"{name}_cheap_backgrounds"],
+            prefetch=power_settings[f"{name}_prefetch"],
+        )
+
+    @property
+    def full_quality(self) -> bool:
+        return self == FULL_QUALITY
+
+
+FULL_QUALITY = PowerPolicy(name="ac")
+
+
+def policy_for(status: PowerStatus, power_settings: dict) -> PowerPolicy:
+    if not power_settings["adapt_to_battery"] or not status.on_battery:
+        return FULL_QUALITY
+    if (
+        status.percent is not None
+        and status.percent <= power_settings["low_battery_percent"]
+    ):
+        return PowerPolicy.from_settings("low_battery", power_settings)
+    return PowerPolicy.from_settings("battery", power_settings)
+
+
+class PowerGovernor:
+    """
+    The policy for the current power state, shared between threads
+    """
+
+    _lock = threading.Lock()
+    _policy = FULL_QUALITY
+
+    @classmethod
+    def policy(cls) -> PowerPolicy:
+        with cls._lock:
+            return cls._policy
+
+    @classmethod
+    def update(cls, status: PowerStatus, power_settings: dict) -> bool:
+        """
+        Output: Whether the policy changed
+        """
+        policy = policy_for(status, power_settings)
+        with cls._lock:
+            changed, cls._policy = policy != cls._policy, policy
+        return changed
@@ -0,0 +1,188 @@
+"""
+Thumbnails of the backgrounds for the settings window, rendered at a fraction
+of the display resolution so a settings change is previewed in milliseconds.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import shutil
+import threading
+from typing import TYPE_CHECKING
+
+import albumpaper_rs
+from configuration import AppPaths, ConfigSnapshot
+from governor import RenderGovernor
+from PIL import Image
+from rendercache import RenderCache, render_key
+from wallpaper import BackgroundType, GenerateWallpaper, Geometry
+
+if TYPE_CHECKING:
+    from wallpaper import Track
+
+PREVIEW_WIDTH = 120
+PREVIEW_WORKERS = 4
+PREVIEW_CACHE_SIZE = 16  # MB
+# Thumbnails kept in memory, they are also cached on disk
+PREVIEW_MEMORY_LIMIT = 64
+
+
+def scale_geometry(geometry: Geometry, scale: float) -> Geometry:
+    width, height, left, top = geometry
+    return (
+        max(1, round(width * scale)),
+        max(1, round(height * scale)),
+        round(left * scale),
+        round(top * scale),
+    )
+
+
+class PreviewGenerator(GenerateWallpaper):
+    """
+    GenerateWallpaper at thumbnail scale for the given settings. Sizes in
+    pixels are scaled with the display, except the drop shadow and Spotify code
+    which are left out.
+    """
+
+    def __init__(
+        self,
+        display_geometry: Geometry,
+        available_geometry: Geometry,
+        config: ConfigSnapshot,
+    ) -> None:
+        self.scale = PREVIEW_WIDTH / display_geometry[0]
+        super().__init__(
+            scale_geometry(display_geometry, self.scale),
+            scale_geometry(available_geometry, self.scale),
+        )
+        self.project_root = AppPaths.PREVIEW_ROOT
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+        # Always the configured quality, a thumbnail is fast at any setting
+        self.governor = RenderGovernor(
+            geometry=self.display_geometry[:2],
+            deadline=0,
+            path=AppPaths.PREVIEW_ROOT / "render_costs.json",
+        )
+        self.apply_config(config)
+
+    def apply_config(self, config: ConfigSnapshot) -> None:
+        super().apply_config(config)
+        self.artwork_size = max(1, round(self.artwork_size * self.scale))
+        self.drop_shadow = False
+        self.spotify_code = False
+        self.render_cache = RenderCache(
+            AppPaths.PREVIEW_ROOT / "thumbnails",
+            size=PREVIEW_CACHE_SIZE,
+        )
+        self.governor.deadline = 0
+
+    def blur_radius(self, background_type: BackgroundType) -> int | None:
+        blur_radius = super().blur_radius(background_type)
+        if blur_radius is None:
+            return None
+        return max(1, round(blur_radius * self.scale))
+
+    def copy_default_wallpaper(self) -> None:
+        """
+        The renderer replaces the default wallpaper with a copy resized to the
+        display, so previews get their own copy, refreshed when it changes
+        """
+        preview_copy = self.images_dir / "default_wallpaper.jpg"
+        try:
+            source_mtime = AppPaths.DEFAULT_WALLPAPER.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if preview_copy.exists() and preview_copy.stat().st_mtime >= source_mtime:
+            return
+        shutil.copyfile(AppPaths.DEFAULT_WALLPAPER, preview_copy)
+
+    def thumbnail(self, track: Track, background_type: BackgroundType) -> Image.Image:
+        generation_config = self.generation_config(
+            track.artwork_at(self.display_geometry[0]),
+            None,
+            self.background_config(background_type, track),
+        )
+
+        default_wallpaper = None
+        if background_type == BackgroundType.DEFAULT_WALLPAPER:
+            self.copy_default_wallpaper()
+            default_wallpaper = self.images_dir / "default_wallpaper.jpg"
+
+        key = render_key(generation_config, default_wallpaper)
+        cached_thumbnail = self.render_cache.get(key)
+        if cached_thumbnail is not None:
+            with Image.open(cached_thumbnail) as image:
+                return image.convert("RGBA")
+
+        size, pixels = albumpaper_rs.generate_wallpaper_rgba(generation_config)
+        image = Image.frombytes("RGBA", tuple(size), pixels)
+        self.render_cache.put_image(key, image)
+        return image
+
+
+class Previews:
+    """
+    Thumbnails of every enabled background for the track of the current
+    wallpaper, rendered in parallel off the UI thread
+    """
+
+    _executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=PREVIEW_WORKERS,
+        thread_name_prefix="preview",
+    )
+    _lock = threading.Lock()
+    _track: Track | None = None
+    _geometry: tuple[Geometry, Geometry] | None = None
+    # (track identity, background type, settings fingerprint): thumbnail
+    _thumbnails: dict[tuple, concurrent.futures.Future[Image.Image]] = {}  # noqa: RUF012
+
+    @classmethod
+    def set_current(
+        cls,
+        track: Track | None,
+        display_geometry: Geometry,
+        available_geometry: Geometry,
+    ) -> None:
+        """
+        Called by the worker with the track of the current wallpaper
+        """
+        with cls._lock:
+            if track is cls._track:
+                return
+            cls._track = track
+            cls._geometry = (display_geometry, available_geometry)
+            cls._thumbnails.clear()
+
+    @classmethod
+    def render(
+        cls,
+        config: ConfigSnapshot,
+    ) -> dict[BackgroundType, concurrent.futures.Future[Image.Image]]:
+        """
+        Output: A thumbnail for each background enabled in `config`, none if
+        there is no current track
+        """
+        with cls._lock:
+            track, geometry = cls._track, cls._geometry
+            if track is None:
+                return {}
+
+            generator = PreviewGenerator(*geometry, config)
+            fingerprint = generator.fingerprint()
+
+            thumbnails = {}
+            for background_type in generator.enabled_backgrounds():
+                key = (track.identity, background_type, fingerprint)
+                if key not in cls._thumbnails:
+                    cls._thumbnails[key] = cls._executor.submit(
+                        generator.thumbnail,
+                        track,
+                        background_type,
+                    )
+                thumbnails[background_type] = cls._thumbnails[key]
+
+            # Oldest first, those for earlier settings
+            while len(cls._thumbnails) > PREVIEW_MEMORY_LIMIT:
+                del cls._thumbnails[next(iter(cls._thumbnails))]
+
+            return thumbnails
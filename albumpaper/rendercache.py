@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import os
+import shutil
+import threading
+from typing import TYPE_CHECKING
+
+import xxhash
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    import structs
+    from PIL import Image
+
+# Increment when the renderer changes its output for the same config
+RENDER_CACHE_VERSION = 2
+
+
+def render_key(
+    config: structs.GenerationConfig,
+    default_wallpaper: Path | None = None,
+    artwork_id: str | None = None,
+) -> str:
+    """
+    Identifies a render by everything that affects the output: the artwork,
+    spotify code, background and foreground configs and geometry, plus the
+    default wallpaper for backgrounds that use it. The artwork is identified
+    by `artwork_id` in place of its pixels if given, so renders of visually
+    identical artworks are shared
+    """
+    hasher = xxhash.xxh64(str(RENDER_CACHE_VERSION).encode())
+    if artwork_id is None:
+        hasher.update(config.artwork.buffer)
+    else:
+        hasher.update(artwork_id.encode())
+
+    if default_wallpaper is not None:
+        with contextlib.suppress(FileNotFoundError):
+            hasher.update(default_wallpaper.read_bytes())
+
+    foreground = config.foreground
+    if foreground.spotify_code is not None:
+        hasher.update(foreground.spotify_code.buffer)
+
+    hasher.update(
+        repr((
+            config.artwork.size,
+            dataclasses.astuple(config.background),
+            foreground.show_artwork,
+            foreground.artwork_size,
+            foreground.drop_shadow,
+            foreground.rounded_corners,
+            tuple(config.display_geometry),
+            tuple(config.available_geometry),
+        )).encode(),
+    )
+    return hasher.hexdigest()
+
+
+class RenderCache:
+    """
+    Rendered wallpapers stored as png files, evicting the least recently used
+    when the directory grows beyond `size` MB. A size of 0 disables the cache.
+    """
+
+    def __init__(self, directory: Path, size: float) -> None:
+        self.directory = directory
+        self.bytes_limit = size * 1024 * 1024
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.png"
+
+    def get(self, key: str) -> Path | None:
+        if not self.bytes_limit:
+            return None
+
+        path = self._path(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, source: Path) -> None:
+        self._write(key, lambda partial: shutil.copyfile(source, partial))
+
+    def put_image(self, key: str, image: Image.Image) -> None:
+        self._write(key, lambda partial: image.save(partial, "PNG"))
+
+    def _write(self, key: str, write: Callable[[Path], object]) -> None:
+        if not self.bytes_limit:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        # Written then renamed so other processes and threads never see a
+        # partial file
+        partial = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.partial",
+        )
+        write(partial)
+        partial.replace(path)
+
+        self.reduce_size()
+
+    def reduce_size(self) -> None:
+        entries = []
+        for path in self.directory.glob("*.png"):
+            with contextlib.suppress(FileNotFoundError):
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.bytes_limit:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+            total -= size
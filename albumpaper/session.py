@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class Session:
+    """
+    The last wallpaper the worker rendered, saved so that after a restart the
+    same track with the same settings is set straight away instead of rendered
+    again
+    """
+
+    track: str  # Track.identity
+    fingerprint: str  # GenerateWallpaper.fingerprint() when rendered
+    output: str
+    output_mtime_ns: int
+
+    @classmethod
+    def load(cls, path: Path) -> Session | None:
+        try:
+            return cls(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, path: Path) -> None:
+        partial = path.with_suffix(".partial")
+        try:
+            partial.write_text(json.dumps(asdict(self)))
+            partial.replace(path)
+        except OSError:
+            print("[ERROR] Failed to save session")
+
+    def is_current(self, fingerprint: str) -> bool:
+        """
+        True if the settings are unchanged and the output hasn't been replaced
+        since it was rendered
+        """
+        try:
+            mtime_ns = Path(self.output).stat().st_mtime_ns
+        except OSError:
+            return False
+        return fingerprint == self.fingerprint and mtime_ns == self.output_mtime_ns
@@ -0,0 +1,182 @@
+"""
+Recognises the same artwork behind different URLs, deluxe editions, regional
+releases and singles often reuse an album's cover, so its palette and renders
+can be reused instead of matching only identical pixels.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+from configuration import AppPaths
+from PIL import Image
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from misc import Color
+
+# The hash compares HASH_SIZE + 1 columns in each of HASH_SIZE rows, 64 bits
+HASH_SIZE = 8
+# The hash ignores colour, so the mean colours must also be this close per channel
+MAX_COLOR_DIFFERENCE = 8
+# Artworks remembered, least recently used are forgotten first. Searched linearly
+INDEX_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class ArtworkSignature:
+    dhash: int
+    mean_color: Color
+
+    @classmethod
+    def of(cls, image: Image.Image) -> ArtworkSignature:
+        """
+        dHash of `image`, whether each pixel is brighter than the next in a
+        9x8 greyscale thumbnail, which survives resizing and recompression
+        """
+        gray = np.asarray(
+            image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX),
+            dtype=np.int16,
+        )
+        bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+        dhash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+        mean = image.convert("RGB").resize((1, 1), Image.Resampling.BOX)
+        return cls(dhash, tuple(mean.getpixel((0, 0))))
+
+    def distance(self, other: ArtworkSignature) -> int | None:
+        """
+        Output: Number of differing hash bits, None if the colours differ
+        """
+        if any(
+            abs(a - b) > MAX_COLOR_DIFFERENCE
+            for a, b in zip(self.mean_color, other.mean_color, strict=True)
+        ):
+            return None
+        return (self.dhash ^ other.dhash).bit_count()
+
+    @property
+    def key(self) -> str:
+        mean_color = "".join(f"{channel:02x}" for channel in self.mean_color)
+        return f"{self.dhash:016x}-{mean_color}"
+
+
+class ArtworkIndex:
+    """
+    Signatures of artworks seen before with their palettes, saved to
+    AppPaths.ARTWORK_INDEX
+    """
+
+    _lock = threading.Lock()
+    # Least recently used first
+    _entries: dict[ArtworkSignature, list[Color] | None] | None = None
+
+    @classmethod
+    def _load(cls) -> dict[ArtworkSignature, list[Color] | None]:
+        if cls._entries is None:
+            cls._entries = {}
+            try:
+                saved = json.loads(AppPaths.ARTWORK_INDEX.read_text())
+                for dhash, mean_color, palette in saved:
+                    cls._entries[ArtworkSignature(dhash, tuple(mean_color))] = (
+                        None if palette is None else [tuple(color) for color in palette]
+                    )
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, TypeError):
+                print("[ERROR] Failed to load artwork index")
+        return cls._entries
+
+    @classmethod
+    def _save(cls) -> None:
+        saved = [
+            [signature.dhash, signature.mean_color, palette]
+            for signature, palette in cls._entries.items()
+        ]
+        partial = AppPaths.ARTWORK_INDEX.with_suffix(".partial")
+        try:
+            partial.write_text(json.dumps(saved))
+            partial.replace(AppPaths.ARTWORK_INDEX)
+        except OSError:
+            print("[ERROR] Failed to save artwork index")
+
+    @staticmethod
+    def _nearest(
+        signature: ArtworkSignature,
+        candidates: Iterable[ArtworkSignature],
+        max_distance: int,
+    ) -> ArtworkSignature | None:
+        nearest, nearest_distance = None, max_distance + 1
+        for candidate in candidates:
+            distance = signature.distance(candidate)
+            if distance is not None and distance < nearest_distance:
+                nearest, nearest_distance = candidate, distance
+                if distance == 0:
+                    break
+        return nearest
+
+    @classmethod
+    def _touch(cls, signature: ArtworkSignature, palette: list[Color] | None) -> None:
+        entries = cls._load()
+        # Moved to the end as the most recently used
+        previous_palette = entries.pop(signature, None)
+        entries[signature] = previous_palette if palette is None else palette
+        while len(entries) > INDEX_SIZE:
+            del entries[next(iter(entries))]
+
+    @classmethod
+    def canonical(
+        cls,
+        signature: ArtworkSignature,
+        max_distance: int,
+    ) -> ArtworkSignature:
+        """
+        Output: The signature of the artwork seen before within `max_distance`
+        bits of `signature`, `signature` itself if there is none
+        """
+        with cls._lock:
+            nearest = cls._nearest(signature, cls._load(), max_distance)
+            if nearest is None:
+                cls._touch(signature, None)
+                cls._save()
+                return signature
+            cls._touch(nearest, None)
+            return nearest
+
+    @classmethod
+    def palette(
+        cls,
+        signature: ArtworkSignature,
+        max_distance: int,
+    ) -> list[Color] | None:
+        """
+        Output: The palette of a similar artwork, None if there is none
+        """
+        with cls._lock:
+            entries = cls._load()
+            nearest = cls._nearest(
+                signature,
+                (
+                    candidate
+                    for candidate, palette in entries.items()
+                    if palette is not None
+                ),
+                max_distance,
+            )
+            if nearest is None:
+                return None
+            cls._touch(nearest, None)
+            return entries[nearest]
+
+    @classmethod
+    def add_palette(cls, signature: ArtworkSignature, palette: list[Color]) -> None:
+        # Plain ints so they can be saved, palettes are numpy integers
+        palette = [tuple(int(channel) for channel in color) for color in palette]
+        with cls._lock:
+            cls._touch(signature, palette)
+            cls._save()
@@ -0,0 +1,451 @@
+"""
+Soak test for the tray app, which runs for weeks at a time. Drives CurrentArt
+and GenerateWallpaper through many simulated track changes, with artwork
+served from local fixtures in place of Last.fm, sampling RSS, the Python heap
+and CPU time. Then polls an unchanged track to measure the CPU used when idle.
+
+Fails if memory grows steadily after the warm up, or if Track objects or
+decoded images outlive the tracks they belong to.
+
+    python soak.py --tracks 20000
+    python soak.py --tracks 2000 --idle 600 --resolution 1920x1080
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime as dt
+import functools
+import gc
+import http.server
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import imagegen
+import joblib
+import misc
+import numpy as np
+import platforms
+import psutil
+from batch import parse_resolution
+from benchmark import fixture_default_wallpaper
+from configuration import AppPaths, ConfigManager
+from PIL import Image
+from wallpaper import GenerateWallpaper
+
+from albumpaper import LASTFM_IMAGE_SIZES, CurrentArt, LastfmTrack
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+RESULTS_VERSION = 1
+TASKBAR_HEIGHT = 48
+# Seconds between power checks, as PowerCheckThread
+POWER_CHECK_INTERVAL = 1
+# Growth in fewer steps than this isn't steady, caches fill and shrink
+STEADY_GROWTH_FRACTION = 0.8
+# Expected to be alive at the end: the current track, its decoded artwork and
+# the fixture default wallpaper
+LIVE_TRACK_LIMIT = 4
+LIVE_IMAGE_LIMIT = 16
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *_args: object) -> None:
+        pass
+
+
+class FixtureServer:
+    """
+    Serves artwork at the paths Last.fm uses, /i/u/<size>/<id>.jpg
+    """
+
+    def __init__(self, root: Path, fixtures: int) -> None:
+        for index in range(fixtures):
+            artwork = fixture_artwork(index)
+            for width, size in LASTFM_IMAGE_SIZES.items():
+                path = root / "i" / "u" / size / f"{index}.jpg"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                artwork.resize((width, width)).save(path, quality=90)
+
+        handler = functools.partial(QuietHandler, directory=str(root))
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def fixture_artwork(index: int) -> Image.Image:
+    # Distinct blocky artwork for each index, so palettes and renders differ
+    rng = np.random.default_rng(index)
+    blocks = rng.integers(0, 256, size=(6, 6, 3), dtype=np.uint8)
+    return Image.fromarray(blocks, "RGB").resize((600, 600), Image.Resampling.NEAREST)
+
+
+def lastfm_response(base_url: str, index: int, *, playing: bool) -> dict:
+    track = {
+        "name": f"Track {index}",
+        "album": {"#text": f"Album {index}"},
+        "artist": {"#text": "Artist"},
+        "image": [{"#text": f"{base_url}/i/u/34s/{index}.jpg"}],
+    }
+    if playing:
+        track["@attr"] = {"nowplaying": "true"}
+    return {"recenttracks": {"track": [track]}}
+
+
+def track_changes(
+    base_url: str,
+    tracks: int,
+    fixtures: int,
+    pause_every: int,
+    seed: int,
+) -> Iterator[dict]:
+    """
+    Random fixtures so some tracks repeat and are served from the caches,
+    with playback paused every `pause_every` changes
+    """
+    rng = random.Random(seed)
+    index = 0
+    for change in range(tracks):
+        if pause_every and change % pause_every == pause_every - 1:
+            yield lastfm_response(base_url, index, playing=False)
+        else:
+            index = rng.randrange(fixtures)
+            yield lastfm_response(base_url, index, playing=True)
+
+
+class FixtureArt(CurrentArt):
+    """
+    CurrentArt for Last.fm with the responses given instead of requested
+    """
+
+    def __init__(self, responses: Iterator[dict]) -> None:
+        super().__init__(service=1)
+        self.responses = responses
+        self.last_response: dict | None = None
+
+    def lastfm_request(self) -> dict | None:
+        self.last_response = next(self.responses)
+        return self.last_response
+
+
+@dataclass(frozen=True)
+class Sample:
+    track_changes: int
+    elapsed: float  # s
+    cpu: float  # s of CPU time used by the process
+    rss: int  # bytes
+    heap: int  # bytes allocated by Python, 0 if not tracing
+
+
+def sample(changes: int, start: float) -> Sample:
+    heap = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    return Sample(
+        track_changes=changes,
+        elapsed=time.perf_counter() - start,
+        cpu=time.process_time(),
+        rss=psutil.Process().memory_info().rss,
+        heap=heap,
+    )
+
+
+def growth(samples: list[Sample], attribute: str, tolerance: float) -> dict:
+    """
+    Output: The growth of `attribute` in bytes per 1000 track changes, and
+    whether it grows steadily, in most steps and by more than `tolerance`
+    bytes overall
+    """
+    changes = [s.track_changes for s in samples]
+    values = [getattr(s, attribute) for s in samples]
+    if len(values) < 3:  # noqa: PLR2004
+        return {"per_1000_changes": 0, "steady": False}
+
+    slope = statistics.linear_regression(changes, values).slope
+    rising = sum(b > a for a, b in itertools.pairwise(values))
+    steady = (
+        rising >= STEADY_GROWTH_FRACTION * (len(values) - 1)
+        and values[-1] - values[0] > tolerance
+    )
+    return {"per_1000_changes": slope * 1000, "steady": steady}
+
+
+def live_objects(cls: type) -> int:
+    gc.collect()
+    return sum(isinstance(obj, cls) for obj in gc.get_objects())
+
+
+@contextlib.contextmanager
+def quiet(*, verbose: bool) -> Iterator[None]:
+    if verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # noqa: PTH123
+        yield
+
+
+def use_temporary_paths(root: Path) -> None:
+    # The app's session, wallpaper and caches are left as they were
+    images_dir = root / "cache" / "images"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    AppPaths.DEFAULT_WALLPAPER = images_dir / "default_wallpaper.jpg"
+    AppPaths.GENERATED_WALLPAPER = images_dir / "generated_wallpaper.png"
+    AppPaths.DROP_SHADOW = images_dir / "drop_shadow.png"
+    AppPaths.RENDER_COSTS = root / "cache" / "render_costs.json"
+    AppPaths.RENDER_CACHE = root / "cache" / "renders"
+    AppPaths.SESSION = root / "cache" / "session.json"
+    AppPaths.ARTWORK_INDEX = root / "cache" / "artwork_index.json"
+    AppPaths.CURRENT_WALLPAPER = root / "cache" / "current_wallpaper.txt"
+
+    # The joblib caches are bound to their directories when imported
+    imagegen.mem = joblib.Memory(root / "cache" / "dominant_colors", verbose=0)
+    imagegen._dominant_colors_cached = imagegen.mem.cache(ignore=["image"])(  # noqa: SLF001
+        imagegen._dominant_colors_cached.func,  # noqa: SLF001
+    )
+    misc.mem = joblib.Memory(root / "cache" / "jpeg", verbose=0)
+    misc._download_image_cached = misc.mem.cache(misc._download_image_cached.func)  # noqa: SLF001
+
+
+def idle_cpu_per_hour(
+    get_art: CurrentArt,
+    generator: GenerateWallpaper,
+    seconds: float,
+    request_interval: float,
+    *,
+    verbose: bool,
+) -> float:
+    """
+    Output: CPU seconds used per hour polling a track that doesn't change,
+    with the power checks the tray app makes meanwhile
+    """
+    platform_ = platforms.current()
+    start, start_cpu = time.perf_counter(), time.process_time()
+    next_poll = start
+    while (now := time.perf_counter()) - start < seconds:
+        if now >= next_poll:
+            with quiet(verbose=verbose):
+                generator.generate(get_art.current_wallpaper_action())
+            next_poll += request_interval
+        platform_.battery_saver_enabled()
+        platform_.power_status()
+        time.sleep(max(0, min(POWER_CHECK_INTERVAL, next_poll - time.perf_counter())))
+
+    elapsed = time.perf_counter() - start
+    return (time.process_time() - start_cpu) / elapsed * 60 * 60
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Soak test the app for leaks")
+    parser.add_argument("--tracks", type=int, default=10_000, help="Track changes")
+    parser.add_argument("--fixtures", type=int, default=50, help="Distinct artworks")
+    parser.add_argument(
+        "--resolution",
+        type=parse_resolution,
+        default=(640, 360),
+        help="Display size e.g. 1920x1080, small by default to soak quickly",
+    )
+    parser.add_argument("--pause-every", type=int, default=25)
+    parser.add_argument("--sample-every", type=int, default=250)
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=0.2,
+        help="Fraction of the track changes ignored while caches fill",
+    )
+    parser.add_argument(
+        "--rss-tolerance",
+        type=float,
+        default=32,
+        help="MB of steady RSS growth allowed",
+    )
+    parser.add_argument(
+        "--heap-tolerance",
+        type=float,
+        default=4,
+        help="MB of steady Python heap growth allowed",
+    )
+    parser.add_argument(
+        "--idle",
+        type=float,
+        default=60,
+        help="Seconds to measure idle CPU for, 0 to skip",
+    )
+    parser.add_argument(
+        "--no-tracemalloc",
+        action="store_true",
+        help="Don't trace the Python heap, which slows everything down",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=AppPaths.PROJECT_ROOT / "cache" / "soak" / "results.json",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show the app's output")
+    return parser.parse_args()
+
+
+def leaks(
+    rss_growth: dict,
+    heap_growth: dict | None,
+    live_tracks: int,
+    live_images: int,
+) -> list[str]:
+    """
+    Output: A message for each leak found, empty if there are none
+    """
+    failures = []
+    if rss_growth["steady"]:
+        failures.append(
+            f"RSS grows {rss_growth['per_1000_changes'] / 2**20:.2f} MB"
+            " per 1000 changes",
+        )
+    if heap_growth is not None and heap_growth["steady"]:
+        failures.append(
+            f"Python heap grows {heap_growth['per_1000_changes'] / 2**20:.2f} MB"
+            " per 1000 changes",
+        )
+    if live_tracks > LIVE_TRACK_LIMIT:
+        failures.append(f"{live_tracks} Track objects still alive")
+    if live_images > LIVE_IMAGE_LIMIT:
+        failures.append(f"{live_images} PIL images still alive")
+    return failures
+
+
+def main() -> int:
+    args = parse_args()
+    os.environ["ALBUMPAPER_PLATFORM"] = "headless"
+
+    width, height = args.resolution
+    request_interval = ConfigManager.settings["service"]["request_interval"]
+
+    with tempfile.TemporaryDirectory(prefix="albumpaper-soak-") as root:
+        root = Path(root)  # noqa: PLW2901
+        use_temporary_paths(root)
+        fixture_default_wallpaper().save(AppPaths.DEFAULT_WALLPAPER, quality=95)
+        server = FixtureServer(root / "fixtures", args.fixtures)
+
+        generator = GenerateWallpaper(
+            display_geometry=(width, height, 0, 0),
+            available_geometry=(width, height - TASKBAR_HEIGHT, 0, 0),
+        )
+        generator.project_root = root
+        get_art = FixtureArt(
+            track_changes(
+                server.url,
+                args.tracks,
+                args.fixtures,
+                args.pause_every,
+                args.seed,
+            ),
+        )
+        get_art.artwork_size = generator.required_artwork_size()
+
+        if not args.no_tracemalloc:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        samples = [sample(0, start)]
+        for change in range(1, args.tracks + 1):
+            with quiet(verbose=args.verbose):
+                generator.generate(get_art.current_wallpaper_action())
+
+            if change % args.sample_every == 0 or change == args.tracks:
+                samples.append(sample(change, start))
+                latest = samples[-1]
+                print(
+                    f"{change:>7} changes  {latest.elapsed:>7.1f} s"
+                    f"  RSS {latest.rss / 2**20:>7.1f} MB"
+                    f"  heap {latest.heap / 2**20:>7.1f} MB"
+                    f"  CPU {latest.cpu:>7.1f} s",
+                )
+
+        tracemalloc.stop()
+
+        # Repeats the last track, which is playing unless it was a pause
+        get_art.responses = itertools.repeat(get_art.last_response)
+        idle_cpu = None
+        if args.idle > 0:
+            print(f"Measuring idle CPU for {args.idle:g} s")
+            idle_cpu = idle_cpu_per_hour(
+                get_art,
+                generator,
+                args.idle,
+                request_interval,
+                verbose=args.verbose,
+            )
+
+        live_tracks = live_objects(LastfmTrack)
+        live_images = live_objects(Image.Image)
+        server.close()
+
+    steady_samples = [
+        s for s in samples if s.track_changes >= args.warmup * args.tracks
+    ]
+    rss_growth = growth(steady_samples, "rss", args.rss_tolerance * 2**20)
+    heap_growth = (
+        None
+        if args.no_tracemalloc
+        else growth(steady_samples, "heap", args.heap_tolerance * 2**20)
+    )
+
+    failures = leaks(rss_growth, heap_growth, live_tracks, live_images)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": dt.datetime.now(dt.UTC).isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "arguments": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+        },
+        "samples": [asdict(s) for s in samples],
+        "rss_growth": rss_growth,
+        "heap_growth": heap_growth,
+        "live_tracks": live_tracks,
+        "live_images": live_images,
+        "idle_cpu_seconds_per_hour": idle_cpu,
+        "failures": failures,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    print(
+        f"RSS {rss_growth['per_1000_changes'] / 2**20:+.2f} MB per 1000 changes,"
+        f" {live_tracks} tracks and {live_images} images alive",
+    )
+    if idle_cpu is not None:
+        print(f"Idle CPU {idle_cpu:.2f} s per hour")
+
+    for message in failures:
+        print(f"[LEAK] {message}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
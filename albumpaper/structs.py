@@ -22,6 +22,7 @@ class ForegroundConfig:
 class BackgroundConfig:
     background_type: str
     blur_radius: int | None = None
+    blur_quality: str | None = None  # "exact" or "fast", None for exact
     color1: Color | None = None
     color2: Color | None = None
     no_colors: int | None = None
@@ -3,19 +3,27 @@ from __future__ import annotations
 from pathlib import Path
 from typing import TYPE_CHECKING, Self
 
-import requests
+import misc
+import updates
 from configuration import AppPaths, ConfigManager
-from packaging.version import Version
+from packaging.version import InvalidVersion, Version
+from preview import Previews
 from PySide6 import QtCore, QtGui, QtWidgets
-from wallpaper import BackgroundType, WindowsWallpaper
+from wallpaper import BackgroundType, DesktopWallpaper
 
 if TYPE_CHECKING:
     from collections.abc import Callable
+    from concurrent.futures import Future
+
+    from PIL import Image
 
 VERSION = Version("5.0b1")
 
 
 class SystemTrayIcon(QtWidgets.QSystemTrayIcon):
+    # Emitted from the update check's thread with the suggested version
+    update_available = QtCore.Signal(str)
+
     def __init__(
         self,
         icon: QtGui.QIcon,
@@ -57,22 +65,26 @@ class SystemTrayIcon(QtWidgets.QSystemTrayIcon):
             self.open_link("https://github.com/jac0-b/AlbumPaper/releases"),
         )
 
-        suggested_update = self.suggest_update()
-        if suggested_update is not None:
-            self.context_menu.addSeparator()
+        # Shown once the update check finds a release
+        self.release_separator = self.context_menu.addSeparator()
+        self.release_item = self.context_menu.addAction(
+            self.get_icon("update.png"),
+            "Update avaliable",
+        )
+        self.release_item.triggered.connect(
+            self.open_link(
+                "https://www.github.com/jac0-b/AlbumPaper/releases/latest",
+            ),
+        )
+        self.release_separator.setVisible(False)
+        self.release_item.setVisible(False)
+        self.update_available.connect(self.show_update)
 
-            release_item = self.context_menu.addAction(
-                self.get_icon("update.png"),
-                f"Update avaliable (v{suggested_update})",
-            )
-            release_item.triggered.connect(
-                self.open_link(
-                    "https://www.github.com/jac0-b/AlbumPaper/releases/latest",
-                ),
+        if ConfigManager.settings["updates"]["check_for_updates"]:
+            misc.in_background(self.suggest_update).add_done_callback(
+                self.update_checked,
             )
 
-            self.showMessage("New update", f"Update v{suggested_update} available")
-
         self.context_menu.addSeparator()
 
         self.pause_item = self.context_menu.addAction(
@@ -144,7 +156,7 @@ class SystemTrayIcon(QtWidgets.QSystemTrayIcon):
         )
 
     def set_default_wallpaper(self) -> None:
-        WindowsWallpaper.cache_current()
+        DesktopWallpaper.cache_current()
         self.showMessage("Saved", "Wallpaper saved as default")
 
     def open_link(self, link: str) -> Callable:
@@ -153,7 +165,7 @@ class SystemTrayIcon(QtWidgets.QSystemTrayIcon):
     def exit(self, exit_code: int) -> Callable:
         def exit_function() -> None:
             try:
-                WindowsWallpaper.set_default_wallpaper()
+                DesktopWallpaper.set_default_wallpaper()
             except Exception as e:
                 print(f"Error setting default wallpaper: {e}")
             # Use longer delay to ensure context menu closes before app exits
@@ -161,17 +173,15 @@ class SystemTrayIcon(QtWidgets.QSystemTrayIcon):
 
         return exit_function
 
-    def suggest_update(self) -> Version | None:
-        if not ConfigManager.settings["updates"]["check_for_updates"]:
-            return None
-
+    @staticmethod
+    def suggest_update() -> Version | None:
+        """
+        Blocks on the network, run in the background
+        """
+        tag_name = updates.latest_release_tag(AppPaths.RELEASE_CHECK)
         try:
-            response = requests.get(
-                "https://api.github.com/repos/jac0-b/AlbumPaper/releases/latest",
-                timeout=1,
-            )
-            latest_version: Version = Version(response.json()["tag_name"])
-        except:  # noqa: E722
+            latest_version = Version(tag_name)
+        except (InvalidVersion, TypeError):
             return None
 
         # Only suggest updating to a pre-releases if the currently installed
@@ -183,6 +193,18 @@ class SystemTrayIcon(QtWidgets.QSystemTrayIcon):
 
         return None
 
+    def update_checked(self, future: Future[Version | None]) -> None:
+        # Called on the update check's thread
+        if future.exception() is None and future.result() is not None:
+            self.update_available.emit(str(future.result()))
+
+    @QtCore.Slot(str)
+    def show_update(self, version: str) -> None:
+        self.release_item.setText(f"Update avaliable (v{version})")
+        self.release_separator.setVisible(True)
+        self.release_item.setVisible(True)
+        self.showMessage("New update", f"Update v{version} available")
+
 
 class SettingsWindow(QtWidgets.QWidget):
     def __init__(self, tray_icon: QtWidgets.QSystemTrayIcon) -> None:
@@ -240,10 +262,9 @@ class SettingsWindow(QtWidgets.QWidget):
             self.tray_icon.showMessage(err_message, "")
             event.ignore()
         else:
+            # Running threads are notified of the changes, no restart needed
             ConfigManager.save_widget_state()
             event.accept()
-            # Use longer delay to ensure close event completes before app exits
-            QtCore.QTimer.singleShot(100, lambda: QtWidgets.QApplication.exit(1))
 
     def openEvent(self, _event: QtCore.QEvent) -> None:
         if ConfigManager.validate_service():
@@ -296,6 +317,15 @@ class GeneralSettings(QtWidgets.QWidget):
             QtWidgets.QCheckBox(),
         )
 
+        adapt_to_battery_label = QtWidgets.QLabel("Reduce Quality on Battery")
+        adapt_to_battery_label.setToolTip(
+            "Polls less often and renders simpler wallpapers when unplugged",
+        )
+        self.adapt_to_battery_checkbox = ConfigManager.register(
+            ("settings", "power", "adapt_to_battery"),
+            QtWidgets.QCheckBox(),
+        )
+
         self.run_at_startup_checkbox = ConfigManager.register(
             ("settings", "miscellaneous", "run_at_startup"),
             QtWidgets.QCheckBox(),
@@ -315,8 +345,10 @@ class GeneralSettings(QtWidgets.QWidget):
         self.layout().addWidget(self.check_updates_checkbox, 3, 1)
         self.layout().addWidget(QtWidgets.QLabel("Pause on Battery Saver"), 4, 0)
         self.layout().addWidget(self.battery_saver_checkbox, 4, 1)
-        self.layout().addWidget(QtWidgets.QLabel("Run at Startup"), 5, 0)
-        self.layout().addWidget(self.run_at_startup_checkbox, 5, 1)
+        self.layout().addWidget(adapt_to_battery_label, 5, 0)
+        self.layout().addWidget(self.adapt_to_battery_checkbox, 5, 1)
+        self.layout().addWidget(QtWidgets.QLabel("Run at Startup"), 6, 0)
+        self.layout().addWidget(self.run_at_startup_checkbox, 6, 1)
 
 
 class DefaultWallpaperPreview(QtWidgets.QWidget):
@@ -325,6 +357,7 @@ class DefaultWallpaperPreview(QtWidgets.QWidget):
 
         self.label = QtWidgets.QLabel(self)
 
+        self._file_state: tuple[int, int] | None = None
         self.update_pixmap()
         self.setFixedSize(self.pixmap.size())
 
@@ -362,14 +395,28 @@ class DefaultWallpaperPreview(QtWidgets.QWidget):
 
     def update_pixmap(self) -> None:
         w = 320
-        self.pixmap = QtGui.QPixmap(AppPaths.DEFAULT_WALLPAPER).scaledToWidth(
-            w,
-            QtCore.Qt.SmoothTransformation,
-        )
+        try:
+            stat = AppPaths.DEFAULT_WALLPAPER.stat()
+            file_state = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            file_state = None
+        # Only decoded again when the default wallpaper changes
+        if file_state is not None and file_state == self._file_state:
+            return
+        self._file_state = file_state
+
+        # JPEGs are decoded straight to roughly the preview size
+        reader = QtGui.QImageReader(str(AppPaths.DEFAULT_WALLPAPER))
+        size = reader.size()
+        if size.isValid() and size.width() > w:
+            reader.setScaledSize(
+                size.scaled(w, size.height(), QtCore.Qt.KeepAspectRatio),
+            )
+        self.pixmap = QtGui.QPixmap.fromImage(reader.read())
         self.label.setPixmap(self.pixmap)
 
     def set_default_wallpaper(self) -> None:
-        WindowsWallpaper.cache_current()
+        DesktopWallpaper.cache_current()
         self.update_pixmap()
 
 
@@ -406,6 +453,7 @@ class BackgroundTab(QtWidgets.QWidget):
         self.layout.setAlignment(QtCore.Qt.AlignTop)
         # self.layout.setContentsMargins(0, 0, 0, 0)
 
+        self.layout.addWidget(BackgroundPreviews())
         self.layout.addWidget(blur_group)
 
         self.selected_background_section()
@@ -432,10 +480,21 @@ class BackgroundTab(QtWidgets.QWidget):
         blur_group.spin_box.setMinimum(min_blur)
         blur_group.spin_box.setMaximum(max_blur)
 
+        blur_group.quality_combo = ConfigManager.register(
+            ("background", "global", "blur_quality"),
+            QtWidgets.QComboBox(),
+        )
+        blur_group.quality_combo.addItems(["Exact", "Fast"])
+        blur_group.quality_combo.setToolTip(
+            "Fast blurs at a reduced resolution, nearly identical and much quicker",
+        )
+
         layout = QtWidgets.QGridLayout()
         layout.addWidget(label, 1, 0)
         layout.addWidget(blur_group.slider, 1, 1)
         layout.addWidget(blur_group.spin_box, 1, 2)
+        layout.addWidget(QtWidgets.QLabel("Blur Quality"), 2, 0)
+        layout.addWidget(blur_group.quality_combo, 2, 1, 1, 2)
         layout.setAlignment(QtCore.Qt.AlignTop)
 
         blur_group.setLayout(layout)
@@ -597,6 +656,102 @@ class BackgroundTab(QtWidgets.QWidget):
         self.layout.addWidget(self.selected_background_groupbox)
 
 
+class BackgroundPreviews(QtWidgets.QGroupBox):
+    """
+    Thumbnails of the enabled backgrounds for the current track, updated as the
+    settings are edited
+    """
+
+    COLUMNS = 4
+    # Waits for edits e.g. dragging a slider to settle before rendering
+    DEBOUNCE = 150  # ms
+
+    thumbnail_ready = QtCore.Signal(int, str, QtGui.QImage)
+
+    def __init__(self, parent: QtWidgets.QWidget | None = None) -> None:
+        super().__init__("Preview", parent)
+        self.setLayout(QtWidgets.QGridLayout())
+        self.layout().setAlignment(QtCore.Qt.AlignTop | QtCore.Qt.AlignLeft)
+
+        self.message = QtWidgets.QLabel("Previews appear once a track has played")
+        self.layout().addWidget(self.message, 0, 0, 1, self.COLUMNS)
+
+        self.thumbnails: dict[BackgroundType, QtWidgets.QLabel] = {}
+        for i, background_type in enumerate(BackgroundType):
+            label = QtWidgets.QLabel()
+            label.setToolTip(background_type)
+            label.hide()
+            self.layout().addWidget(label, 1 + i // self.COLUMNS, i % self.COLUMNS)
+            self.thumbnails[background_type] = label
+
+        # Incremented by each refresh, so thumbnails for older settings are ignored
+        self.generation = 0
+        self.thumbnail_ready.connect(self.show_thumbnail)
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(self.DEBOUNCE)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.widgets_connected = False
+
+    def showEvent(self, event: QtCore.QEvent) -> None:
+        # Every settings widget is registered by the time the window is shown
+        if not self.widgets_connected:
+            ConfigManager.connect_widgets("background", self.refresh_timer.start)
+            ConfigManager.connect_widgets("settings", self.refresh_timer.start)
+            self.widgets_connected = True
+        self.refresh()
+        super().showEvent(event)
+
+    def refresh(self) -> None:
+        if not self.isVisible():
+            return
+
+        self.generation += 1
+        thumbnails = Previews.render(ConfigManager.widget_snapshot())
+        self.message.setVisible(not thumbnails)
+
+        for background_type, label in self.thumbnails.items():
+            label.setVisible(background_type in thumbnails)
+        for background_type, future in thumbnails.items():
+            future.add_done_callback(
+                self.thumbnail_callback(self.generation, background_type),
+            )
+
+    def thumbnail_callback(
+        self,
+        generation: int,
+        background_type: BackgroundType,
+    ) -> Callable[[Future[Image.Image]], None]:
+        # Called on a preview thread, or straight away if already rendered
+        def done(future: Future[Image.Image]) -> None:
+            if future.exception() is not None:
+                return
+            image = future.result()
+            qimage = QtGui.QImage(
+                image.tobytes(),
+                image.width,
+                image.height,
+                QtGui.QImage.Format_RGBA8888,
+            ).copy()
+            self.thumbnail_ready.emit(generation, background_type, qimage)
+
+        return done
+
+    @QtCore.Slot(int, str, QtGui.QImage)
+    def show_thumbnail(
+        self,
+        generation: int,
+        background_type: str,
+        image: QtGui.QImage,
+    ) -> None:
+        if generation != self.generation:
+            return
+        self.thumbnails[BackgroundType(background_type)].setPixmap(
+            QtGui.QPixmap.fromImage(image),
+        )
+
+
 class ForegroundTab(QtWidgets.QGroupBox):
     def __init__(self, parent: Self | None = None) -> None:
         super().__init__(parent)
@@ -659,7 +814,7 @@ class ForegroundTab(QtWidgets.QGroupBox):
 
 
 class ServiceSettings(QtWidgets.QWidget):
-    def __init__(self, parent: Self | None = None) -> None:
+    def __init__(self, parent: Self | None = None) -> None:  # noqa: PLR0915
         super().__init__(parent)
 
         self.main_layout = QtWidgets.QFormLayout()
@@ -673,7 +828,9 @@ class ServiceSettings(QtWidgets.QWidget):
             QtWidgets.QComboBox(),
         )
 
-        self.service_combo.addItems(["Spotify (recommended)", "Last.fm"])
+        self.service_combo.addItems(
+            ["Spotify (recommended)", "Last.fm", "Local Player (push)"],
+        )
         self.service_combo.currentIndexChanged.connect(
             self.api_keys_stacked.setCurrentIndex,
         )
@@ -756,6 +913,32 @@ class ServiceSettings(QtWidgets.QWidget):
 
         layout.addRow(secrets_group)
 
+        # local player section
+        self.local_port = ConfigManager.register(
+            ("settings", "service", "local_port"),
+            QtWidgets.QSpinBox(),
+        )
+        self.local_port.setRange(1024, 65535)
+        self.local_token = ConfigManager.register(
+            ("settings", "service", "local_token"),
+            QtWidgets.QLineEdit(),
+        )
+        self.local_token.setPlaceholderText("At least 16 characters")
+        self.local_token.setEchoMode(QtWidgets.QLineEdit.EchoMode.Password)
+        local_help = QtWidgets.QLabel(
+            "A player plugin or tool sends the playing track to this port on "
+            "127.0.0.1 as one JSON object per line, including the token",
+        )
+        local_help.setWordWrap(True)
+
+        widget = QtWidgets.QWidget()
+        self.api_keys_stacked.addWidget(widget)
+        layout = QtWidgets.QFormLayout()
+        widget.setLayout(layout)
+        layout.addRow("Port", self.local_port)
+        layout.addRow("Token", self.local_token)
+        layout.addRow(local_help)
+
         self.setLayout(self.main_layout)
 
 
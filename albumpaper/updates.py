@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING
+
+import requests
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+RELEASES_URL = "https://api.github.com/repos/jac0-b/AlbumPaper/releases/latest"
+# Within this many seconds of the last check no request is made at all
+UPDATE_CHECK_TTL = 6 * 60 * 60
+# Off the UI thread, so a slow connection can be waited for
+REQUEST_TIMEOUT = 10
+
+
+@dataclass(frozen=True)
+class ReleaseCheck:
+    """
+    The latest release as of the last check, with the ETag of the response so
+    the next check is a conditional request answered with 304 Not Modified
+    unless there has been a release
+    """
+
+    tag_name: str | None
+    etag: str | None
+    checked: float  # time.time()
+
+    @classmethod
+    def load(cls, path: Path) -> ReleaseCheck | None:
+        try:
+            return cls(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, path: Path) -> None:
+        partial = path.with_suffix(".partial")
+        try:
+            partial.write_text(json.dumps(asdict(self)))
+            partial.replace(path)
+        except OSError:
+            print("[ERROR] Failed to save release check")
+
+
+def latest_release_tag(path: Path) -> str | None:
+    """
+    Output: Tag of the latest GitHub release, from the cache at `path` while it
+    is fresh. Blocks on the network, so call it off the UI thread
+    """
+    cached = ReleaseCheck.load(path)
+    now = time.time()
+    if cached is not None and 0 <= now - cached.checked < UPDATE_CHECK_TTL:
+        return cached.tag_name
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if cached is not None and cached.etag is not None:
+        headers["If-None-Match"] = cached.etag
+
+    previous_tag = None if cached is None else cached.tag_name
+    try:
+        response = requests.get(RELEASES_URL, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == requests.codes.not_modified and cached is not None:
+            check = ReleaseCheck(cached.tag_name, cached.etag, now)
+        else:
+            response.raise_for_status()
+            check = ReleaseCheck(
+                response.json()["tag_name"],
+                response.headers.get("ETag"),
+                now,
+            )
+    except (requests.RequestException, ValueError, KeyError):
+        # Retried at the next start, offline or rate limited
+        return previous_tag
+
+    check.save(path)
+    return check.tag_name
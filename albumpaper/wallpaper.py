@@ -1,20 +1,21 @@
 from __future__ import annotations
 
-import ctypes
 import enum
-import glob
-import os
 import random
 import shutil
 from typing import TYPE_CHECKING
 
 import albumpaper_rs
 import imagegen
+import platforms
 import structs
+import xxhash
 from configuration import (
     AppPaths,
     ConfigManager,
+    ConfigSnapshot,
 )
+from governor import RenderGovernor
 from misc import (
     Color,
     GenerateNew,
@@ -22,12 +23,19 @@ from misc import (
     SetPrevious,
     Unchanged,
     WallpaperAction,
+    format_stages,
     timer,
 )
 from PIL import Image
+from power import FULL_QUALITY, PowerPolicy
+from rendercache import RenderCache, render_key
+from session import Session
+from similarity import ArtworkIndex, ArtworkSignature
 
 if TYPE_CHECKING:
-    from PySide6 import QtWidgets
+    from pathlib import Path
+
+    from PySide6 import QtGui
 
     from albumpaper import LastfmTrack, SpotifyTrack
 
@@ -45,31 +53,119 @@ class BackgroundType(enum.StrEnum):
     DEFAULT_WALLPAPER = "defaultwallpaper"
 
 
-class GenerateWallpaper:
-    def __init__(self, app: QtWidgets.QApplication) -> None:
-        self.artwork_size = ConfigManager.settings["foreground"]["size"]
+GEOMETRIZE_BACKGROUNDS = (BackgroundType.LOWPOLY, BackgroundType.POINTILLIST)
+BLURRABLE_BACKGROUNDS = (
+    BackgroundType.COLORED_NOISE,
+    BackgroundType.ALBUM_ART,
+    BackgroundType.DEFAULT_WALLPAPER,
+)
 
-        self.blur_strength = ConfigManager.background["global"]["blur_strength"]
+# Indexed by the blur_quality setting
+BLUR_QUALITIES = ("exact", "fast")
+
+DETAIL_LEVEL_SAMPLES = {
+    1: 5000,
+    2: 10_000,
+    3: 20_000,
+    4: 40_000,
+    5: 70_000,
+    6: 110_000,
+    7: 150_000,
+    8: 210_000,
+}
+
+
+type Geometry = tuple[int, int, int, int]
+
+
+def configure_render_pool(config: ConfigSnapshot) -> None:
+    performance = config.settings["performance"]
+    threads = albumpaper_rs.configure_render_pool(
+        max_threads=max(0, performance["render_threads"]),
+        low_priority=performance["render_low_priority"],
+        cpu_share=min(max(performance["render_cpu_share"], 0.0), 1.0),
+    )
+    print(f"Rendering on {threads} threads")
+
+
+def screen_geometry(app: QtGui.QGuiApplication) -> tuple[Geometry, Geometry]:
+    """
+    Output: The display and available (excluding the taskbar) geometry of the
+    primary screen as (width, height, left, top)
+    """
+    dw = app.primaryScreen()
+    display_geometry = (
+        dw.size().width(),
+        dw.size().height(),
+        0,
+        0,
+    )
+    available_geometry = (
+        dw.availableGeometry().width(),
+        dw.availableGeometry().height(),
+        dw.availableGeometry().left(),
+        dw.availableGeometry().top(),
+    )
+    return display_geometry, available_geometry
+
+
+def _cancelled(cancel: albumpaper_rs.CancelToken | None) -> bool:
+    return cancel is not None and cancel.cancelled
 
-        self.foreground_enabled = ConfigManager.settings["foreground"]["enabled"]
-        self.spotify_code = ConfigManager.settings["foreground"]["spotify_code"]
 
-        dw = app.primaryScreen()
-        self.display_geometry = (
-            dw.size().width(),
-            dw.size().height(),
-            0,
-            0,
+class GenerateWallpaper:
+    def __init__(
+        self,
+        display_geometry: Geometry,
+        available_geometry: Geometry,
+    ) -> None:
+        self.display_geometry = display_geometry
+        self.available_geometry = available_geometry
+
+        # Where the native renderer reads and writes cache/images
+        self.project_root = AppPaths.PROJECT_ROOT
+
+        self.governor = RenderGovernor(
+            geometry=self.display_geometry[:2],
+            deadline=0,
+            path=AppPaths.RENDER_COSTS,
         )
-        self.available_geometry = (
-            dw.availableGeometry().width(),
-            dw.availableGeometry().height(),
-            dw.availableGeometry().left(),
-            dw.availableGeometry().top(),
+
+        # Set by the worker from PowerGovernor
+        self.power_policy: PowerPolicy = FULL_QUALITY
+
+        self.config: ConfigSnapshot | None = None
+        self.apply_config(ConfigManager.snapshot())
+
+    def apply_config(self, config: ConfigSnapshot) -> None:
+        """
+        Take on new settings without losing the governor's learnt render costs
+        """
+        foreground = config.settings["foreground"]
+        if self.config is not None and foreground != self.config.settings["foreground"]:
+            # The cached drop shadow is only valid for the previous artwork size
+            (self.images_dir / "drop_shadow.png").unlink(missing_ok=True)
+        self.config = config
+
+        self.artwork_size = foreground["size"]
+
+        self.blur_strength = config.background["global"]["blur_strength"]
+        self.blur_quality = BLUR_QUALITIES[config.background["global"]["blur_quality"]]
+
+        self.foreground_enabled = foreground["enabled"]
+        self.spotify_code = foreground["spotify_code"]
+
+        self.drop_shadow = foreground["drop_shadow"]
+        self.rounded_corners = foreground["rounded_corners"]
+
+        self.render_cache = RenderCache(
+            AppPaths.RENDER_CACHE,
+            size=config.settings["cache"]["render_size"],
         )
 
-        self.drop_shadow = ConfigManager.settings["foreground"]["drop_shadow"]
-        self.rounded_corners = ConfigManager.settings["foreground"]["rounded_corners"]
+        performance = config.settings["performance"]
+        self.governor.deadline = performance["render_deadline"]
+        self.favour_fitting_backgrounds = performance["favour_fitting_backgrounds"]
 
     @staticmethod
     def color_difference(c1: Color, c2: Color) -> float:
@@ -116,7 +212,7 @@ class GenerateWallpaper:
 
     def gradient_colors(
         self,
-        image: Image.Image,
+        dominant_colors: list[Color],
     ) -> tuple[Color, Color]:
         """
         Determine best colours for the gradient
@@ -124,8 +220,6 @@ class GenerateWallpaper:
         Pair the most saturated colour with the colour that has the largest
         perceived difference.
         """
-        dominant_colors = imagegen.dominant_colors(image)
-
         saturations = [
             {"color": color, "saturation": self.color_saturation(color)}
             for color in dominant_colors[:7]
@@ -161,46 +255,240 @@ class GenerateWallpaper:
 
         return sorted_color_differences[0]["color pair"]
 
-    def generate_background(self, track: Track) -> None:
-        backgrounds = [
-            (BackgroundType.SOLID_COLOR, self.solidcolor_background),
-            (BackgroundType.LINEAR_GRADIENT, self.lineargradient_background),
-            (BackgroundType.RADIAL_GRADIENT, self.radialgradient_background),
-            (BackgroundType.COLORED_NOISE, self.colorednoise_background),
-            (BackgroundType.LOWPOLY, self.lowpoly_background),
-            (BackgroundType.ALBUM_ART, self.albumart_background),
-            (BackgroundType.DEFAULT_WALLPAPER, self.defaultwallpaper_background),
-            (BackgroundType.POINTILLIST, self.pointillist_background),
+    def work_candidates(self, background_type: BackgroundType) -> list[int]:
+        """
+        Ascending list of the work values (n_samples or blur radius) the
+        governor can choose from, the last being the configured value or the
+        power policy's limit
+        """
+        if background_type in GEOMETRIZE_BACKGROUNDS:
+            detail_level = self.config.background["global"]["detail_level"]
+            if self.power_policy.max_detail_level is not None:
+                detail_level = min(detail_level, self.power_policy.max_detail_level)
+            return [
+                n_samples
+                for level, n_samples in DETAIL_LEVEL_SAMPLES.items()
+                if level <= detail_level
+            ]
+
+        if (
+            background_type in BLURRABLE_BACKGROUNDS
+            and self.config.background[background_type]["blur"]
+            and self.power_policy.blur
+        ):
+            # A smaller radius is no faster, the exact blur's kernel is as
+            # large as the image whatever the radius and the fast blur
+            # downscales more the larger the radius
+            return [self.blur_strength]
+
+        return [0]
+
+    def n_samples(self, background_type: BackgroundType) -> int:
+        return self.governor.fit(background_type, self.work_candidates(background_type))
+
+    def blur_radius(self, background_type: BackgroundType) -> int | None:
+        if not (
+            self.config.background[background_type]["blur"] and self.power_policy.blur
+        ):
+            return None
+        return self.governor.fit(background_type, self.work_candidates(background_type))
+
+    def background_config(
+        self,
+        background_type: BackgroundType,
+        track: Track,
+    ) -> structs.BackgroundConfig:
+        return {
+            BackgroundType.SOLID_COLOR: self.solidcolor_background,
+            BackgroundType.LINEAR_GRADIENT: self.lineargradient_background,
+            BackgroundType.RADIAL_GRADIENT: self.radialgradient_background,
+            BackgroundType.COLORED_NOISE: self.colorednoise_background,
+            BackgroundType.LOWPOLY: self.lowpoly_background,
+            BackgroundType.ALBUM_ART: self.albumart_background,
+            BackgroundType.DEFAULT_WALLPAPER: self.defaultwallpaper_background,
+            BackgroundType.POINTILLIST: self.pointillist_background,
+        }[background_type](track)
+
+    def enabled_backgrounds(self) -> list[BackgroundType]:
+        return [
+            background_type
+            for background_type in BackgroundType
+            if self.config.background[background_type]["enabled"]
         ]
+
+    def generate_background(
+        self,
+        track: Track,
+        cancel: albumpaper_rs.CancelToken | None = None,
+    ) -> bool:
+        enabled_backgrounds = self.enabled_backgrounds()
+        if self.power_policy.cheap_backgrounds:
+            # Unless they are the only ones enabled
+            enabled_backgrounds = [
+                background_type
+                for background_type in enabled_backgrounds
+                if background_type not in GEOMETRIZE_BACKGROUNDS
+            ] or enabled_backgrounds
+
         # Pick a random enabled background
-        background_config: structs.BackgroundConfig = random.choice([
-            bg[1] for bg in backgrounds if ConfigManager.background[bg[0]]["enabled"]
-        ])(track)
-
-        image = track.artwork
-
-        # download spotify code if required
-        spotify_code = None
-        if self.spotify_code and track.spotify_code_image is not None:
-            spotify_code = structs.PythonImageBuffer(track.spotify_code_image)
-
-        with timer(label=background_config.background_type):
-            albumpaper_rs.generate_save_wallpaper(
-                structs.GenerationConfig(
-                    project_root=str(AppPaths.PROJECT_ROOT.absolute()),
-                    artwork=structs.PythonImageBuffer(image),
-                    background=background_config,
-                    foreground=structs.ForegroundConfig(
-                        show_artwork=self.foreground_enabled,
-                        artwork_size=self.artwork_size,
-                        drop_shadow=self.drop_shadow,
-                        rounded_corners=self.rounded_corners,
-                        spotify_code=spotify_code,
-                    ),
-                    display_geometry=self.display_geometry[:2],
-                    available_geometry=self.available_geometry,
-                ),
+        weights = None
+        if self.favour_fitting_backgrounds:
+            weights = self.governor.weights({
+                background_type: self.work_candidates(background_type)[0]
+                for background_type in enabled_backgrounds
+            })
+        background_type = random.choices(enabled_backgrounds, weights=weights)[0]
+
+        background_config = self.background_config(background_type, track)
+        return self.render(track, background_config, cancel)
+
+    def generation_config(
+        self,
+        artwork: Image.Image,
+        spotify_code: Image.Image | None,
+        background_config: structs.BackgroundConfig,
+    ) -> structs.GenerationConfig:
+        return structs.GenerationConfig(
+            project_root=str(self.project_root.absolute()),
+            artwork=structs.PythonImageBuffer(artwork),
+            background=background_config,
+            foreground=structs.ForegroundConfig(
+                show_artwork=self.foreground_enabled,
+                artwork_size=self.artwork_size,
+                drop_shadow=self.drop_shadow,
+                rounded_corners=self.rounded_corners,
+                spotify_code=None
+                if spotify_code is None
+                else structs.PythonImageBuffer(spotify_code),
+            ),
+            display_geometry=self.display_geometry[:2],
+            available_geometry=self.available_geometry,
+        )
+
+    def render(
+        self,
+        track: Track,
+        background_config: structs.BackgroundConfig,
+        cancel: albumpaper_rs.CancelToken | None = None,
+    ) -> bool:
+        """
+        Output: False if the render was cancelled, the generated wallpaper is
+        then unchanged
+        """
+        artwork = track.artwork
+        generation_config = self.generation_config(
+            artwork,
+            track.spotify_code_image if self.spotify_code else None,
+            background_config,
+        )
+
+        default_wallpaper = None
+        if background_config.background_type == BackgroundType.DEFAULT_WALLPAPER:
+            default_wallpaper = self.images_dir / "default_wallpaper.jpg"
+
+        # Artwork drawn as it is must match exactly, a similar cover's banner or
+        # badge would show. Backgrounds that only abstract it can be shared
+        artwork_id = None
+        if (
+            not generation_config.foreground.show_artwork
+            and background_config.background_type != BackgroundType.ALBUM_ART
+        ):
+            artwork_id = self.similar_artwork_id(artwork)
+        key = render_key(generation_config, default_wallpaper, artwork_id)
+        cached_render = self.render_cache.get(key)
+        if cached_render is not None:
+            if _cancelled(cancel):
+                return False
+            print(f"Using cached {background_config.background_type} render")
+            shutil.copyfile(cached_render, self.generated_wallpaper)
+            return True
+
+        label = background_config.background_type
+        if not self.power_policy.full_quality:
+            label = f"{label} ({self.power_policy.name} policy)"
+        with timer(label=label) as render_timer:
+            render_info = albumpaper_rs.generate_save_wallpaper(
+                generation_config,
+                cancel=cancel,
             )
+        if render_info is None:
+            return False
+        print(f"    {format_stages(render_info.stages)}")
+        pool = albumpaper_rs.buffer_pool_stats()
+        print(
+            f"    Buffer pool: {pool.hit_rate:.0%} reused,"
+            f" {pool.pooled_bytes / 1024**2:.0f} MB held",
+        )
+
+        # A cached background says nothing about how long it takes to make
+        if not render_info.background_cached:
+            self.governor.record(background_config, render_timer.elapsed)
+        self.render_cache.put(key, self.generated_wallpaper)
+        return True
+
+    def similar_artwork_id(self, artwork: Image.Image) -> str | None:
+        """
+        Output: Identifies `artwork` and any visually identical artwork seen
+        before, None if similar artworks aren't matched
+        """
+        max_distance = self.config.settings["cache"]["similar_artwork_distance"]
+        if max_distance < 0:
+            return None
+        return ArtworkIndex.canonical(ArtworkSignature.of(artwork), max_distance).key
+
+    def required_artwork_size(self) -> int | None:
+        """
+        Output: Smallest artwork width that is drawn without upscaling, None
+        for the largest available
+        """
+        if any(
+            self.config.background[background_type]["enabled"]
+            for background_type in (BackgroundType.ALBUM_ART, *GEOMETRIZE_BACKGROUNDS)
+        ):
+            # Stretched to the display, every available size is upscaled
+            return None
+        if self.foreground_enabled:
+            return self.artwork_size
+        # Only the palette is taken from the artwork
+        return imagegen.PALETTE_SIZE
+
+    def fingerprint(self) -> str:
+        """
+        Identifies the settings that affect how a track is rendered
+        """
+        render_settings = sorted(
+            (key, value)
+            for key, value in self.config.items().items()
+            if key[0] == "background" or key[:2] == ("settings", "foreground")
+        )
+        geometry = (self.display_geometry, self.available_geometry)
+        return xxhash.xxh64(repr((render_settings, *geometry)).encode()).hexdigest()
+
+    def save_session(self, track: Track) -> None:
+        Session(
+            track=track.identity,
+            fingerprint=self.fingerprint(),
+            output=str(self.generated_wallpaper.absolute()),
+            output_mtime_ns=self.generated_wallpaper.stat().st_mtime_ns,
+        ).save(AppPaths.SESSION)
+
+    def restored_track(self) -> str | None:
+        """
+        Output: Identity of the track the generated wallpaper was rendered for
+        before the last restart, None if it is out of date
+        """
+        session = Session.load(AppPaths.SESSION)
+        if session is None or not session.is_current(self.fingerprint()):
+            return None
+        return session.track
+
+    @property
+    def images_dir(self) -> Path:
+        return self.project_root / "cache" / "images"
+
+    @property
+    def generated_wallpaper(self) -> Path:
+        return self.images_dir / "generated_wallpaper.png"
 
     def solidcolor_background(self, track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.SOLID_COLOR
@@ -213,7 +501,7 @@ class GenerateWallpaper:
     def lineargradient_background(self, track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.LINEAR_GRADIENT
 
-        from_color, to_color = self.gradient_colors(track.artwork)
+        from_color, to_color = self.gradient_colors(track.dominant_colors)
         return structs.BackgroundConfig(
             background_type=background_type,
             color1=from_color,
@@ -223,7 +511,7 @@ class GenerateWallpaper:
     def radialgradient_background(self, track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.RADIAL_GRADIENT
 
-        from_color, to_color = self.gradient_colors(track.artwork)
+        from_color, to_color = self.gradient_colors(track.dominant_colors)
         return structs.BackgroundConfig(
             background_type=background_type,
             color1=from_color,
@@ -233,15 +521,14 @@ class GenerateWallpaper:
     def colorednoise_background(self, track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.COLORED_NOISE
 
-        blur_radius = None
-        if ConfigManager.background[background_type]["blur"]:
-            blur_radius = self.blur_strength
-        no_colors = ConfigManager.background[background_type]["no_colors"]
-        color1, color2 = self.gradient_colors(track.artwork)
+        blur_radius = self.blur_radius(background_type)
+        no_colors = self.config.background[background_type]["no_colors"]
+        color1, color2 = self.gradient_colors(track.dominant_colors)
 
         return structs.BackgroundConfig(
             background_type=background_type,
             blur_radius=blur_radius,
+            blur_quality=self.blur_quality,
             color1=color1,
             color2=color2,
             no_colors=no_colors,
@@ -250,16 +537,7 @@ class GenerateWallpaper:
     def lowpoly_background(self, _track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.LOWPOLY
 
-        n_samples = {
-            1: 5000,
-            2: 10_000,
-            3: 20_000,
-            4: 40_000,
-            5: 70_000,
-            6: 110_000,
-            7: 150_000,
-            8: 210_000,
-        }[ConfigManager.background["global"]["detail_level"]]
+        n_samples = self.n_samples(background_type)
 
         return structs.BackgroundConfig(
             background_type=background_type,
@@ -269,16 +547,7 @@ class GenerateWallpaper:
     def pointillist_background(self, _track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.POINTILLIST
 
-        n_samples = {
-            1: 5000,
-            2: 10_000,
-            3: 20_000,
-            4: 40_000,
-            5: 70_000,
-            6: 110_000,
-            7: 150_000,
-            8: 210_000,
-        }[ConfigManager.background["global"]["detail_level"]]
+        n_samples = self.n_samples(background_type)
 
         return structs.BackgroundConfig(
             background_type=background_type,
@@ -288,87 +557,83 @@ class GenerateWallpaper:
     def albumart_background(self, _track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.ALBUM_ART
 
-        blur_radius = None
-        if ConfigManager.background[background_type]["blur"]:
-            blur_radius = self.blur_strength
+        blur_radius = self.blur_radius(background_type)
 
         return structs.BackgroundConfig(
             background_type=background_type,
             blur_radius=blur_radius,
+            blur_quality=self.blur_quality,
         )
 
     def defaultwallpaper_background(self, _track: Track) -> structs.BackgroundConfig:
         background_type = BackgroundType.DEFAULT_WALLPAPER
 
-        blur_radius = None
-        if ConfigManager.background[background_type]["blur"]:
-            blur_radius = self.blur_strength
+        blur_radius = self.blur_radius(background_type)
 
         return structs.BackgroundConfig(
             background_type=background_type,
             blur_radius=blur_radius,
+            blur_quality=self.blur_quality,
         )
 
-    def generate(self, wallaper_action: WallpaperAction) -> None:
+    def generate(
+        self,
+        wallaper_action: WallpaperAction,
+        cancel: albumpaper_rs.CancelToken | None = None,
+    ) -> bool:
+        """
+        Output: False if the action was cancelled before the wallpaper was set
+        """
         match wallaper_action:
             case GenerateNew(track):
                 print("========== Generating new image ==========")
-                self.generate_background(track)
-                WindowsWallpaper.set_generated_wallpaper()
+                if not self.generate_background(track, cancel) or _cancelled(cancel):
+                    return False
+                DesktopWallpaper.set_generated_wallpaper()
+                self.save_session(track)
             case SetPrevious():
-                WindowsWallpaper.set_generated_wallpaper()
+                if _cancelled(cancel):
+                    return False
+                DesktopWallpaper.set_generated_wallpaper()
             case SetDefault():
-                WindowsWallpaper.set_default_wallpaper()
+                if _cancelled(cancel):
+                    return False
+                DesktopWallpaper.set_default_wallpaper()
             case Unchanged():
-                return
+                pass
+        return True
 
 
-class WindowsWallpaper:
+class DesktopWallpaper:
     @staticmethod
     def _set(*, is_default: bool) -> None:
         file_name = (
             AppPaths.DEFAULT_WALLPAPER if is_default else AppPaths.GENERATED_WALLPAPER
         )
-        abs_path = os.path.abspath(file_name)  # noqa: PTH100
-        ctypes.windll.user32.SystemParametersInfoW(20, 0, abs_path, 0)
+        platforms.current().set_wallpaper(file_name)
         print("WALLPAPER SET: " + ("Default" if is_default else "Generated"))
 
     @staticmethod
     def set_default_wallpaper() -> None:
-        WindowsWallpaper._set(is_default=True)
+        DesktopWallpaper._set(is_default=True)
 
     @staticmethod
     def set_generated_wallpaper() -> None:
-        WindowsWallpaper._set(is_default=False)
+        DesktopWallpaper._set(is_default=False)
 
     @staticmethod
     def cache_current() -> None:
-        r"""
-        1. First look in %APPDATA%\Microsoft\Windows\Themes\CachedFiles
-        and use most recent image (this will have the resolution of the desktop)
-        2. If that fails look for %APPDATA%\Microsoft\Windows\Themes\TranscodedWallpaper
-        (this will have the resolution of the original image)
-        3. If that fails find the original path of the wallpaper and save that
-        image instead https://stackoverflow.com/questions/44867820/
-        4. Finally if all fail just save use a blank image as the dafault wallpaper
         """
-        cached_folder = os.path.expandvars(
-            r"%APPDATA%\Microsoft\Windows\Themes\CachedFiles\*",
-        )
-        list_of_files = glob.glob(cached_folder)  # noqa: PTH207
-        if list_of_files:
-            current_wallpaper = max(list_of_files, key=os.path.getctime)
-        else:
-            current_wallpaper = os.path.expandvars(
-                r"%APPDATA%\Microsoft\Windows\Themes\TranscodedWallpaper",
-            )
-        try:
-            shutil.copy(current_wallpaper, AppPaths.DEFAULT_WALLPAPER)
-        except FileNotFoundError:
-            ubuf = ctypes.create_unicode_buffer(200)
-            ctypes.windll.user32.SystemParametersInfoW(0x0073, 200, ubuf, 0)
+        Save the current desktop wallpaper as the default wallpaper, if it can't
+        be found just use a blank image
+        """
+        for current_wallpaper in platforms.current().wallpaper_candidates():
             try:
-                shutil.copy(ubuf.value, AppPaths.DEFAULT_WALLPAPER)
-            except FileNotFoundError:
-                image = Image.new("RGB", (1, 1))
-                image.save(AppPaths.DEFAULT_WALLPAPER, "JPEG", quality=100)
+                shutil.copy(current_wallpaper, AppPaths.DEFAULT_WALLPAPER)
+            except OSError:
+                continue
+            else:
+                return
+
+        image = Image.new("RGB", (1, 1))
+        image.save(AppPaths.DEFAULT_WALLPAPER, "JPEG", quality=100)
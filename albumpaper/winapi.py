@@ -48,7 +48,7 @@ class SYSTEM_POWER_STATUS(ctypes.Structure):
     ]
 
 
-def battery_saver_enabled() -> bool:
+def system_power_status() -> SYSTEM_POWER_STATUS | None:
     SYSTEM_POWER_STATUS_P = ctypes.POINTER(SYSTEM_POWER_STATUS)
 
     GetSystemPowerStatus = ctypes.windll.kernel32.GetSystemPowerStatus
@@ -58,5 +58,26 @@ def battery_saver_enabled() -> bool:
     status = SYSTEM_POWER_STATUS()
 
     if not GetSystemPowerStatus(ctypes.pointer(status)):
+        return None
+    return status
+
+
+def battery_saver_enabled() -> bool:
+    status = system_power_status()
+    if status is None:
         return False
     return bool(status.SystemStatusFlag)
+
+
+def power_status() -> tuple[bool, int | None]:
+    """
+    Output: (on battery, battery percentage or None if unknown)
+    """
+    status = system_power_status()
+    if status is None:
+        return False, None
+
+    # BYTE is signed, the "unknown" value 255 reads as -1
+    ac_line_status = status.ACLineStatus & 0xFF
+    percent = status.BatteryLifePercent & 0xFF
+    return ac_line_status == 0, None if percent == 255 else percent  # noqa: PLR2004
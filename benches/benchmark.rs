@@ -0,0 +1,358 @@
+use std::hint::black_box;
+use std::path::PathBuf;
+
+use albumpaper_rs::{
+    AppPaths, BackgroundConfig, ForegroundConfig, GenerationConfig, PythonImageBuffer,
+    buffers, clear_layer_caches, field, generate_wallpaper, gradient, misc, noise,
+};
+use criterion::{BatchSize, BenchmarkId, Criterion, criterion_group, criterion_main};
+use image::{DynamicImage, Rgb, RgbImage};
+
+const RESOLUTIONS: [(&str, [u32; 2]); 3] = [
+    ("1080p", [1920, 1080]),
+    ("1440p", [2560, 1440]),
+    ("4k", [3840, 2160]),
+];
+
+const DETAIL_LEVEL_SAMPLES: [u32; 8] =
+    [5000, 10_000, 20_000, 40_000, 70_000, 110_000, 150_000, 210_000];
+
+const ARTWORK_SIZE: u32 = 400;
+const BLUR_STRENGTH: u32 = 46;
+const TASKBAR_HEIGHT: u32 = 48;
+
+// Deterministic stand-in for album art with a few distinct colour regions
+fn fixture_artwork() -> RgbImage {
+    RgbImage::from_fn(640, 640, |x, y| {
+        let band = ((x / 80) + (y / 160)) % 4;
+        let shade = ((x + y) / 5 % 64) as u8;
+        match band {
+            0 => Rgb([200 + shade / 2, 40, 60]),
+            1 => Rgb([30, 90 + shade, 160]),
+            2 => Rgb([240, 200, 80 + shade]),
+            _ => Rgb([20 + shade, 20, 30]),
+        }
+    })
+}
+
+fn fixture_root() -> (String, AppPaths) {
+    let root = std::env::temp_dir().join("albumpaper-bench");
+    std::fs::create_dir_all(root.join("cache").join("images")).unwrap();
+    let root = root.to_string_lossy().into_owned();
+    let app_paths = AppPaths::from(root.clone());
+    (root, app_paths)
+}
+
+// generate_wallpaper may replace the default wallpaper with a resized copy and caches
+// the drop shadow for the previous geometry, so reset both before each benchmark
+fn reset_fixture_files(root: &str) {
+    let images_dir = PathBuf::from(root).join("cache").join("images");
+    let default_wallpaper = RgbImage::from_fn(3840, 2160, |x, y| {
+        Rgb([(x / 15) as u8, (y / 9) as u8, ((x + y) / 24) as u8])
+    });
+    default_wallpaper
+        .save(images_dir.join("default_wallpaper.jpg"))
+        .unwrap();
+    let _ = std::fs::remove_file(images_dir.join("drop_shadow.png"));
+}
+
+fn background_variants() -> Vec<(String, BackgroundConfig)> {
+    let colors = (Some([200, 40, 60]), Some([30, 90, 160]));
+    let config = |background_type: &str| BackgroundConfig {
+        background_type: background_type.to_string(),
+        blur_radius: None,
+        blur_quality: None,
+        color1: colors.0,
+        color2: colors.1,
+        no_colors: None,
+        n_samples: None,
+    };
+
+    let mut variants = vec![
+        ("solidcolor".to_string(), config("solidcolor")),
+        ("lineargradient".to_string(), config("lineargradient")),
+        ("radialgradient".to_string(), config("radialgradient")),
+    ];
+
+    for (suffix, blur_radius, blur_quality) in [
+        ("noblur", None, None),
+        ("blur", Some(BLUR_STRENGTH), None),
+        ("blur-fast", Some(BLUR_STRENGTH), Some("fast".to_string())),
+    ] {
+        variants.push((
+            format!("colorednoise/{suffix}"),
+            BackgroundConfig {
+                blur_radius,
+                blur_quality: blur_quality.clone(),
+                no_colors: Some(9),
+                ..config("colorednoise")
+            },
+        ));
+        for background_type in ["albumart", "defaultwallpaper"] {
+            variants.push((
+                format!("{background_type}/{suffix}"),
+                BackgroundConfig {
+                    blur_radius,
+                    blur_quality: blur_quality.clone(),
+                    ..config(background_type)
+                },
+            ));
+        }
+    }
+
+    for background_type in ["lowpoly", "pointillist"] {
+        for (level, n_samples) in DETAIL_LEVEL_SAMPLES.iter().enumerate() {
+            variants.push((
+                format!("{background_type}/detail-{}", level + 1),
+                BackgroundConfig {
+                    n_samples: Some(*n_samples),
+                    ..config(background_type)
+                },
+            ));
+        }
+    }
+
+    variants
+}
+
+fn foreground_variants() -> Vec<(&'static str, ForegroundConfig)> {
+    let code = RgbImage::from_pixel(ARTWORK_SIZE, ARTWORK_SIZE / 4, Rgb([255, 255, 255]));
+    let spotify_code = PythonImageBuffer {
+        size: [code.width(), code.height()],
+        buffer: code.into_raw(),
+    };
+    let config = |show_artwork, drop_shadow, rounded_corners| ForegroundConfig {
+        show_artwork,
+        artwork_size: ARTWORK_SIZE,
+        drop_shadow,
+        rounded_corners,
+        spotify_code: None,
+    };
+
+    vec![
+        ("none", config(false, false, false)),
+        ("plain", config(true, false, false)),
+        ("rounded", config(true, false, true)),
+        ("shadow", config(true, true, false)),
+        ("rounded-shadow", config(true, true, true)),
+        (
+            "rounded-shadow-code",
+            ForegroundConfig {
+                spotify_code: Some(spotify_code),
+                ..config(true, true, true)
+            },
+        ),
+    ]
+}
+
+fn generation_config(
+    root: &str,
+    background: BackgroundConfig,
+    foreground: ForegroundConfig,
+    geometry: [u32; 2],
+) -> GenerationConfig {
+    let artwork = fixture_artwork();
+    GenerationConfig {
+        project_root: root.to_string(),
+        artwork: PythonImageBuffer {
+            size: [artwork.width(), artwork.height()],
+            buffer: artwork.into_raw(),
+        },
+        background,
+        foreground,
+        display_geometry: geometry,
+        available_geometry: [geometry[0], geometry[1] - TASKBAR_HEIGHT, 0, 0],
+    }
+}
+
+// Layer caches are cleared before every iteration, so this is the cost of a track
+// that hasn't been rendered before
+fn bench_backgrounds(c: &mut Criterion) {
+    let (root, app_paths) = fixture_root();
+    let mut group = c.benchmark_group("background");
+    group.sample_size(10);
+
+    for (resolution, geometry) in RESOLUTIONS {
+        for (name, background) in background_variants() {
+            let foreground = foreground_variants().remove(0).1;
+            let config = generation_config(&root, background, foreground, geometry);
+            reset_fixture_files(&root);
+            group.bench_with_input(BenchmarkId::new(name, resolution), &config, |b, config| {
+                b.iter_batched(
+                    || {
+                        clear_layer_caches(root.clone());
+                        config.clone()
+                    },
+                    |config| generate_wallpaper(black_box(config), &app_paths),
+                    BatchSize::PerIteration,
+                )
+            });
+        }
+    }
+    group.finish();
+}
+
+// The same backgrounds rendered again, served from the layer caches where possible and
+// with the output's buffer returned to the pool as the app does
+fn bench_backgrounds_cached(c: &mut Criterion) {
+    let (root, app_paths) = fixture_root();
+    let mut group = c.benchmark_group("background_cached");
+    group.sample_size(10);
+
+    for (resolution, geometry) in RESOLUTIONS {
+        for (name, background) in background_variants() {
+            let foreground = foreground_variants().remove(0).1;
+            let config = generation_config(&root, background, foreground, geometry);
+            reset_fixture_files(&root);
+            clear_layer_caches(root.clone());
+            buffers::recycle(generate_wallpaper(config.clone(), &app_paths));
+            group.bench_with_input(BenchmarkId::new(name, resolution), &config, |b, config| {
+                b.iter(|| {
+                    buffers::recycle(generate_wallpaper(black_box(config.clone()), &app_paths))
+                })
+            });
+        }
+    }
+    group.finish();
+}
+
+fn bench_foregrounds(c: &mut Criterion) {
+    let (root, app_paths) = fixture_root();
+    let mut group = c.benchmark_group("foreground");
+    group.sample_size(10);
+
+    for (resolution, geometry) in RESOLUTIONS {
+        for (name, foreground) in foreground_variants() {
+            let background = background_variants().remove(0).1;
+            let config = generation_config(&root, background, foreground, geometry);
+            reset_fixture_files(&root);
+            group.bench_with_input(BenchmarkId::new(name, resolution), &config, |b, config| {
+                b.iter(|| {
+                    buffers::recycle(generate_wallpaper(black_box(config.clone()), &app_paths))
+                })
+            });
+        }
+    }
+    group.finish();
+}
+
+fn bench_stages(c: &mut Criterion) {
+    let mut group = c.benchmark_group("stage");
+    group.sample_size(10);
+
+    let artwork = DynamicImage::from(fixture_artwork()).to_rgba8();
+    let (color1, color2) = ([200, 40, 60], [30, 90, 160]);
+
+    for (resolution, geometry) in RESOLUTIONS {
+        let [width, height] = geometry;
+
+        group.bench_function(BenchmarkId::new("fast_resize", resolution), |b| {
+            b.iter(|| misc::fast_resize(black_box(&artwork), width, height))
+        });
+
+        group.bench_function(BenchmarkId::new("gradient_linear", resolution), |b| {
+            b.iter(|| gradient::linear(black_box(geometry), color1, color2))
+        });
+
+        group.bench_function(BenchmarkId::new("gradient_radial", resolution), |b| {
+            b.iter(|| {
+                gradient::radial(black_box(geometry), color1, color2, ARTWORK_SIZE)
+            })
+        });
+
+        group.bench_function(BenchmarkId::new("noise_colored", resolution), |b| {
+            b.iter(|| noise::colored(black_box(geometry), color1, color2, 9, 0))
+        });
+
+        // The above recolour a cached field, these include computing it
+        group.bench_function(BenchmarkId::new("gradient_linear_field", resolution), |b| {
+            b.iter_batched(
+                field::clear,
+                |_| gradient::linear(black_box(geometry), color1, color2),
+                BatchSize::PerIteration,
+            )
+        });
+
+        group.bench_function(BenchmarkId::new("gradient_radial_field", resolution), |b| {
+            b.iter_batched(
+                field::clear,
+                |_| gradient::radial(black_box(geometry), color1, color2, ARTWORK_SIZE),
+                BatchSize::PerIteration,
+            )
+        });
+
+        group.bench_function(BenchmarkId::new("noise_colored_field", resolution), |b| {
+            b.iter_batched(
+                field::clear,
+                |_| noise::colored(black_box(geometry), color1, color2, 9, 0),
+                BatchSize::PerIteration,
+            )
+        });
+
+        let resized = DynamicImage::from(misc::fast_resize(&artwork, width, height));
+        group.bench_function(BenchmarkId::new("add_blur", resolution), |b| {
+            b.iter(|| misc::add_blur(black_box(resized.clone()), BLUR_STRENGTH))
+        });
+
+        group.bench_function(BenchmarkId::new("blur_fast", resolution), |b| {
+            b.iter(|| misc::blur_fast(black_box(&artwork), BLUR_STRENGTH, geometry))
+        });
+    }
+
+    let mut rounded = misc::fast_resize(&artwork, ARTWORK_SIZE, ARTWORK_SIZE);
+    group.bench_function("round_corners", |b| {
+        b.iter(|| misc::round_corners(black_box(&mut rounded), 20.0 / 600.0))
+    });
+
+    group.finish();
+}
+
+// Mean absolute difference (0-255) per channel between two images of the same size
+fn mean_difference(a: &RgbaImage, b: &RgbaImage) -> f64 {
+    let total: u64 = a
+        .as_raw()
+        .iter()
+        .zip(b.as_raw())
+        .map(|(x, y)| u64::from(x.abs_diff(*y)))
+        .sum();
+    total as f64 / a.as_raw().len() as f64
+}
+
+// Times each blur quality on the album art background and reports how far its
+// output is from the exact blur
+fn bench_blur_quality(c: &mut Criterion) {
+    let mut group = c.benchmark_group("blur_quality");
+    group.sample_size(10);
+
+    let artwork = DynamicImage::from(fixture_artwork()).to_rgba8();
+
+    for (resolution, geometry) in RESOLUTIONS {
+        let [width, height] = geometry;
+        let resized = misc::fast_resize(&artwork, width, height);
+        let exact = misc::blur(resized.clone(), BLUR_STRENGTH, misc::BlurQuality::Exact);
+
+        for quality in [misc::BlurQuality::Exact, misc::BlurQuality::Fast] {
+            let output = misc::blur(resized.clone(), BLUR_STRENGTH, quality);
+            println!(
+                "blur_quality/{}/{resolution}: mean difference from exact {:.3}",
+                quality.name(),
+                mean_difference(&output, &exact),
+            );
+
+            group.bench_function(BenchmarkId::new(quality.name(), resolution), |b| {
+                b.iter(|| misc::blur(black_box(resized.clone()), BLUR_STRENGTH, quality))
+            });
+        }
+    }
+    group.finish();
+}
+
+criterion_group!(
+    benches,
+    bench_backgrounds,
+    bench_backgrounds_cached,
+    bench_foregrounds,
+    bench_stages,
+    bench_blur_quality
+);
+criterion_main!(benches);
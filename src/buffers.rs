@@ -0,0 +1,119 @@
+//! Image buffers and resizers kept between renders. A 4K RGBA image is about 33 MB,
+//! so rendering the same geometry again reuses the previous render's buffers rather
+//! than allocating and faulting in new ones for every track
+
+use std::cell::RefCell;
+use std::sync::Mutex;
+
+use fast_image_resize::Resizer;
+use image::RgbaImage;
+
+// Free buffers kept, enough for the few display sized images of a 4K render
+const POOL_BYTES: usize = 192 * 1024 * 1024;
+// Smaller buffers are cheap to allocate and aren't pooled
+const MIN_POOLED_BYTES: usize = 1024 * 1024;
+
+struct BufferPool {
+    // Most recently returned last
+    free: Vec<Vec<u8>>,
+    hits: u64,
+    misses: u64,
+    peak_bytes: usize,
+}
+
+impl BufferPool {
+    fn bytes(&self) -> usize {
+        self.free.iter().map(Vec::capacity).sum()
+    }
+}
+
+static POOL: Mutex<BufferPool> = Mutex::new(BufferPool {
+    free: Vec::new(),
+    hits: 0,
+    misses: 0,
+    peak_bytes: 0,
+});
+
+#[derive(Clone, Copy, Debug)]
+pub struct PoolStats {
+    pub hits: u64,
+    pub misses: u64,
+    // Held by free buffers now and the most held at once
+    pub pooled_bytes: usize,
+    pub peak_bytes: usize,
+}
+
+fn take(len: usize) -> Option<Vec<u8>> {
+    if len < MIN_POOLED_BYTES {
+        return None;
+    }
+    let mut pool = POOL.lock().unwrap();
+    match pool.free.iter().rposition(|buffer| buffer.len() == len) {
+        Some(index) => {
+            pool.hits += 1;
+            Some(pool.free.remove(index))
+        }
+        None => {
+            pool.misses += 1;
+            None
+        }
+    }
+}
+
+// A transparent image
+pub fn image(width: u32, height: u32) -> RgbaImage {
+    let mut image = image_for_overwrite(width, height);
+    image.fill(0);
+    image
+}
+
+// An image with undefined pixels, for when every pixel is written anyway
+pub fn image_for_overwrite(width: u32, height: u32) -> RgbaImage {
+    let len = width as usize * height as usize * 4;
+    match take(len) {
+        Some(buffer) => RgbaImage::from_raw(width, height, buffer).unwrap(),
+        None => RgbaImage::new(width, height),
+    }
+}
+
+// Keeps the buffer of an image that is no longer needed for the next render
+pub fn recycle(image: RgbaImage) {
+    let buffer = image.into_raw();
+    if buffer.len() < MIN_POOLED_BYTES {
+        return;
+    }
+    let mut pool = POOL.lock().unwrap();
+    pool.free.push(buffer);
+    while pool.bytes() > POOL_BYTES {
+        pool.free.remove(0);
+    }
+    pool.peak_bytes = pool.peak_bytes.max(pool.bytes());
+}
+
+pub fn stats() -> PoolStats {
+    let pool = POOL.lock().unwrap();
+    PoolStats {
+        hits: pool.hits,
+        misses: pool.misses,
+        pooled_bytes: pool.bytes(),
+        peak_bytes: pool.peak_bytes,
+    }
+}
+
+// Frees the pooled buffers, e.g. once renders have stopped for a while. The
+// statistics are kept
+pub fn release() {
+    let mut pool = POOL.lock().unwrap();
+    pool.free.clear();
+    pool.free.shrink_to_fit();
+}
+
+thread_local! {
+    // Keeps its intermediate buffers between resizes, renders run on the same pool
+    // threads each time
+    static RESIZER: RefCell<Resizer> = RefCell::new(Resizer::new());
+}
+
+pub fn with_resizer<T>(f: impl FnOnce(&mut Resizer) -> T) -> T {
+    RESIZER.with_borrow_mut(f)
+}
@@ -0,0 +1,164 @@
+//! Scalar fields for the gradient and noise backgrounds. A field only depends on the
+//! geometry and foreground size or seed, not the colours, so it is computed once and
+//! cached, each track then recolours it through a 256 entry lookup table
+
+use std::sync::{Arc, LazyLock, Mutex};
+
+use colorgrad::Gradient;
+use image::RgbaImage;
+use rayon::prelude::*;
+
+use crate::buffers;
+
+// Memory for cached fields, a 4K field is about 16 MB and a thumbnail's a few KB
+const FIELD_CACHE_BYTES: usize = 64 * 1024 * 1024;
+const LUT_SIZE: usize = 256;
+// Side of the square dither texture tiled over the image
+const DITHER_TILE: usize = 256;
+
+#[derive(Clone, Copy, PartialEq, Eq, Debug)]
+pub enum FieldKind {
+    LinearGradient,
+    RadialGradient { foreground_size: u32 },
+    Noise { seed: u32 },
+}
+
+pub struct ScalarField {
+    width: u32,
+    // Position in the lookup table as 8.8 fixed point
+    values: Vec<u16>,
+}
+
+impl ScalarField {
+    // `f` returns the position of the pixel in the gradient, from 0 to 1
+    pub fn from_fn(geometry: [u32; 2], f: impl Fn(u32, u32) -> f32 + Sync) -> Self {
+        let [width, height] = geometry;
+        let max_value = ((LUT_SIZE - 1) * 256) as f32;
+
+        let mut values = vec![0; width as usize * height as usize];
+        values
+            .par_chunks_exact_mut(width as usize)
+            .enumerate()
+            .for_each(|(y, row)| {
+                for (x, value) in row.iter_mut().enumerate() {
+                    let t = f(x as u32, y as u32).clamp(0.0, 1.0);
+                    *value = (t * max_value).round() as u16;
+                }
+            });
+        ScalarField { width, values }
+    }
+}
+
+// Most recently used last
+static FIELDS: Mutex<Vec<(FieldKind, [u32; 2], Arc<ScalarField>)>> = Mutex::new(Vec::new());
+
+pub fn cached(
+    kind: FieldKind,
+    geometry: [u32; 2],
+    compute: impl FnOnce() -> ScalarField,
+) -> Arc<ScalarField> {
+    {
+        let mut fields = FIELDS.lock().unwrap();
+        if let Some(index) = fields
+            .iter()
+            .position(|(k, g, _)| *k == kind && *g == geometry)
+        {
+            let entry = fields.remove(index);
+            let field = Arc::clone(&entry.2);
+            fields.push(entry);
+            return field;
+        }
+    }
+
+    // Computed without holding the lock, a concurrent miss just computes it twice
+    let field = Arc::new(compute());
+    let mut fields = FIELDS.lock().unwrap();
+    fields.push((kind, geometry, Arc::clone(&field)));
+    while fields.len() > 1 && cached_bytes(&fields) > FIELD_CACHE_BYTES {
+        fields.remove(0);
+    }
+    field
+}
+
+fn cached_bytes(fields: &[(FieldKind, [u32; 2], Arc<ScalarField>)]) -> usize {
+    fields
+        .iter()
+        .map(|(_, _, field)| field.values.len() * size_of::<u16>())
+        .sum()
+}
+
+pub fn clear() {
+    FIELDS.lock().unwrap().clear();
+}
+
+// Colours of the gradient at LUT_SIZE evenly spaced points over its domain, 0 to 255
+pub struct Lut([[f32; 3]; LUT_SIZE]);
+
+impl Lut {
+    pub fn new(gradient: &impl Gradient) -> Self {
+        let (start, end) = gradient.domain();
+        let mut lut = [[0.0; 3]; LUT_SIZE];
+        for (i, entry) in lut.iter_mut().enumerate() {
+            let t = start + (end - start) * i as f32 / (LUT_SIZE - 1) as f32;
+            let [r, g, b, _] = gradient.at(t).to_array();
+            *entry = [r * 255.0, g * 255.0, b * 255.0];
+        }
+        Lut(lut)
+    }
+}
+
+// Triangular noise between -1 and 1, the same distribution the gradients used to
+// draw per pixel, from a fixed hash so every render of a geometry dithers alike
+static DITHER: LazyLock<Vec<f32>> = LazyLock::new(|| {
+    (0..(DITHER_TILE * DITHER_TILE) as u32)
+        .map(|i| unit_hash(i * 2) + unit_hash(i * 2 + 1) - 1.0)
+        .collect()
+});
+
+// https://nullprogram.com/blog/2018/07/31/ (lowbias32), mapped to [0, 1)
+fn unit_hash(mut x: u32) -> f32 {
+    x ^= x >> 16;
+    x = x.wrapping_mul(0x7feb_352d);
+    x ^= x >> 15;
+    x = x.wrapping_mul(0x846c_a68b);
+    x ^= x >> 16;
+    (x >> 8) as f32 / (1 << 24) as f32
+}
+
+#[inline]
+fn quantize_color_channel(c: f32) -> u8 {
+    c.round().clamp(0.0, 255.0) as u8
+}
+
+// Linearly interpolates between neighbouring lookup table entries, so the table size
+// doesn't band the gradient. Opaque, written straight into a pooled RGBA buffer
+pub fn colorize(field: &ScalarField, lut: &Lut, dither: bool) -> RgbaImage {
+    let width = field.width as usize;
+    let height = (field.values.len() / width.max(1)) as u32;
+    let mut image = buffers::image_for_overwrite(field.width, height);
+
+    image
+        .par_chunks_exact_mut(4 * width)
+        .zip(field.values.par_chunks_exact(width))
+        .enumerate()
+        .for_each(|(y, (row, values))| {
+            let tile_start = (y % DITHER_TILE) * DITHER_TILE;
+            let dither_row = &DITHER[tile_start..tile_start + DITHER_TILE];
+
+            for (x, (pixel, &value)) in row.chunks_exact_mut(4).zip(values).enumerate() {
+                let index = (value >> 8) as usize;
+                let fraction = (value & 0xff) as f32 / 256.0;
+                let low = lut.0[index];
+                let high = lut.0[(index + 1).min(LUT_SIZE - 1)];
+                let offset = if dither { dither_row[x % DITHER_TILE] } else { 0.0 };
+
+                for c in 0..3 {
+                    pixel[c] = quantize_color_channel(
+                        low[c] + (high[c] - low[c]) * fraction + offset,
+                    );
+                }
+                pixel[3] = 255;
+            }
+        });
+    image
+}
@@ -0,0 +1,295 @@
+//! Background layers that are expensive to make but often reused, cached in memory
+//! and on disk: the default wallpaper, which doesn't depend on the artwork, and
+//! geometrize backgrounds, which only depend on the artwork and sample count. The
+//! geometrize crate only returns rasterised layers, so they are kept per geometry and
+//! a larger layer of the same aspect ratio is downscaled instead of fitted again
+
+use std::hash::Hasher;
+use std::path::{Path, PathBuf};
+use std::sync::Mutex;
+use std::thread::JoinHandle;
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use geometrize::{SamplingParams, geometrize};
+use image::{DynamicImage, ImageFormat, ImageReader, RgbaImage};
+use rustc_hash::FxHasher;
+
+use crate::misc::{self, BlurQuality};
+use crate::{AppPaths, Size};
+
+// Geometrize layers kept on disk, the least recently used are removed beyond this
+const GEOMETRIZE_LAYER_LIMIT: usize = 20;
+
+// The most recently used layer of each directory is kept in memory, all of them on
+// disk. Previews have their own project root, so rendering them doesn't evict the
+// wallpaper's layer
+struct LayerCache {
+    latest: Mutex<Vec<(PathBuf, RgbaImage)>>,
+}
+
+impl LayerCache {
+    const fn new() -> Self {
+        LayerCache {
+            latest: Mutex::new(Vec::new()),
+        }
+    }
+
+    fn load(&self, path: &Path) -> Option<RgbaImage> {
+        if let Some((_, layer)) = self
+            .latest
+            .lock()
+            .unwrap()
+            .iter()
+            .find(|(cached_path, _)| cached_path == path)
+        {
+            return Some(layer.clone());
+        }
+
+        let layer = ImageReader::open(path).ok()?.decode().ok()?.to_rgba8();
+        self.remember(path.to_path_buf(), &layer);
+        Some(layer)
+    }
+
+    fn remember(&self, path: PathBuf, layer: &RgbaImage) {
+        let mut latest = self.latest.lock().unwrap();
+        latest.retain(|(cached_path, _)| cached_path.parent() != path.parent());
+        latest.push((path, layer.clone()));
+    }
+
+    fn clear(&self) {
+        self.latest.lock().unwrap().clear();
+    }
+}
+
+static DEFAULT_WALLPAPER_LAYERS: LayerCache = LayerCache::new();
+static GEOMETRIZE_LAYERS: LayerCache = LayerCache::new();
+
+// Geometrize layers still being written to disk, see save_in_background
+static PENDING_SAVES: Mutex<Vec<JoinHandle<()>>> = Mutex::new(Vec::new());
+
+// Removes every cached layer, e.g. so benchmarks measure the uncached cost
+pub fn clear(app_paths: &AppPaths) {
+    // A layer saved after the directory is removed would be loaded next time
+    let pending = std::mem::take(&mut *PENDING_SAVES.lock().unwrap());
+    for handle in pending {
+        let _ = handle.join();
+    }
+    DEFAULT_WALLPAPER_LAYERS.clear();
+    GEOMETRIZE_LAYERS.clear();
+    let _ = std::fs::remove_dir_all(&app_paths.background_layers);
+    let _ = std::fs::remove_dir_all(&app_paths.geometrize_layers);
+}
+
+// Identifies the contents of a file by its length and modification time
+fn file_fingerprint(path: &Path) -> Option<u64> {
+    let metadata = std::fs::metadata(path).ok()?;
+    let modified = metadata.modified().ok()?.duration_since(UNIX_EPOCH).ok()?;
+
+    let mut hasher = FxHasher::default();
+    hasher.write_u64(metadata.len());
+    hasher.write_u128(modified.as_nanos());
+    Some(hasher.finish())
+}
+
+fn default_wallpaper_path(
+    app_paths: &AppPaths,
+    source_fingerprint: u64,
+    display_geometry: Size,
+    blur: Option<(u32, BlurQuality)>,
+) -> PathBuf {
+    let [width, height] = display_geometry;
+    let blur = match blur {
+        Some((radius, quality)) => format!("blur{radius}-{}", quality.name()),
+        None => "noblur".to_string(),
+    };
+    app_paths
+        .background_layers
+        .join(format!("{source_fingerprint:016x}-{width}x{height}-{blur}.png"))
+}
+
+// Output: the layer and whether it came from the cache
+pub fn default_wallpaper(
+    display_geometry: Size,
+    blur: Option<(u32, BlurQuality)>,
+    app_paths: &AppPaths,
+) -> (RgbaImage, bool) {
+    let cached_path = file_fingerprint(&app_paths.default_wallpaper).map(|fingerprint| {
+        default_wallpaper_path(app_paths, fingerprint, display_geometry, blur)
+    });
+    if let Some(layer) = cached_path
+        .as_deref()
+        .and_then(|path| DEFAULT_WALLPAPER_LAYERS.load(path))
+    {
+        return (layer, true);
+    }
+
+    let default_wallpaper = ImageReader::open(&app_paths.default_wallpaper)
+        .unwrap()
+        .decode()
+        .unwrap()
+        .to_rgba8();
+    let resized = misc::resize_default_wallpaper(default_wallpaper, display_geometry, app_paths);
+    let layer = match blur {
+        Some((radius, quality)) => misc::blur(resized, radius, quality),
+        None => resized,
+    };
+
+    // Resizing replaces the file, so fingerprint it again
+    if let Some(fingerprint) = file_fingerprint(&app_paths.default_wallpaper) {
+        let path = default_wallpaper_path(app_paths, fingerprint, display_geometry, blur);
+        // An unblurred layer is just the wallpaper, decoding the jpeg is no slower
+        // than decoding a png of it so it is only kept in memory
+        if blur.is_some() {
+            // Layers made from a previous default wallpaper are never used again
+            let prefix = format!("{fingerprint:016x}-");
+            remove_files(&app_paths.background_layers, |name| {
+                !name.starts_with(&prefix)
+            });
+            save(&path, &layer);
+        }
+        DEFAULT_WALLPAPER_LAYERS.remember(path, &layer);
+    }
+
+    (layer, false)
+}
+
+// Output: the layer and whether it came from the cache
+pub fn geometrize_background(
+    artwork: &RgbaImage,
+    background_type: &str,
+    n_samples: u32,
+    display_geometry: Size,
+    app_paths: &AppPaths,
+) -> (RgbaImage, bool) {
+    let [width, height] = display_geometry;
+    let artwork_hash = misc::seed_from_image(artwork);
+    let prefix = format!("{artwork_hash:016x}-{background_type}-{n_samples}-");
+    let path = app_paths
+        .geometrize_layers
+        .join(format!("{prefix}{width}x{height}.png"));
+
+    if let Some(layer) = GEOMETRIZE_LAYERS.load(&path) {
+        touch(&path);
+        return (layer, true);
+    }
+
+    // The same number of shapes fitted for a larger display with the same aspect ratio
+    // looks the same downscaled, e.g. after switching to a lower resolution
+    let larger = larger_layer(&app_paths.geometrize_layers, &prefix, display_geometry)
+        .and_then(|larger_path| {
+            let larger = ImageReader::open(&larger_path).ok()?.decode().ok()?;
+            touch(&larger_path);
+            Some(larger.into_rgba8())
+        });
+    if let Some(larger) = larger {
+        let layer = misc::fast_resize(&larger, width, height);
+        crate::buffers::recycle(larger);
+        GEOMETRIZE_LAYERS.remember(path, &layer);
+        return (layer, true);
+    }
+
+    let style = match background_type {
+        "lowpoly" => geometrize::Style::Lowpoly,
+        "pointillist" => geometrize::Style::Pointillist { noise: 0.3 },
+        unknown => panic!("Unknown geometrize background '{unknown}'"),
+    };
+    let layer = geometrize(
+        DynamicImage::from(misc::fast_resize(artwork, width, height)),
+        style,
+        n_samples,
+        SamplingParams::default(),
+    )
+    .unwrap();
+
+    save_in_background(path.clone(), layer.clone(), app_paths.geometrize_layers.clone());
+    GEOMETRIZE_LAYERS.remember(path, &layer);
+
+    (layer, false)
+}
+
+// Output: the smallest cached layer with `prefix` for a larger display with the same
+// aspect ratio
+fn larger_layer(directory: &Path, prefix: &str, display_geometry: Size) -> Option<PathBuf> {
+    let [width, height] = display_geometry.map(u64::from);
+    std::fs::read_dir(directory)
+        .ok()?
+        .flatten()
+        .filter_map(|entry| {
+            let name = entry.file_name().to_string_lossy().into_owned();
+            let (layer_width, layer_height) = name
+                .strip_prefix(prefix)?
+                .strip_suffix(".png")?
+                .split_once('x')?;
+            let layer_width: u64 = layer_width.parse().ok()?;
+            let layer_height: u64 = layer_height.parse().ok()?;
+
+            // Equal to within a pixel of rounding
+            let same_aspect = (layer_width * height).abs_diff(layer_height * width)
+                <= layer_width.max(width);
+            (layer_width > width && same_aspect).then(|| (layer_width, entry.path()))
+        })
+        .min_by_key(|(layer_width, _)| *layer_width)
+        .map(|(_, path)| path)
+}
+
+// Encoding a display sized png takes longer than most renders, so it is done on
+// another thread
+fn save_in_background(path: PathBuf, layer: RgbaImage, directory: PathBuf) {
+    let handle = std::thread::spawn(move || {
+        save(&path, &layer);
+        evict_least_recent(&directory, GEOMETRIZE_LAYER_LIMIT);
+    });
+    let mut pending = PENDING_SAVES.lock().unwrap();
+    pending.retain(|handle| !handle.is_finished());
+    pending.push(handle);
+}
+
+// Marks a cached layer as recently used
+fn touch(path: &Path) {
+    if let Ok(file) = std::fs::File::options().write(true).open(path) {
+        let _ = file.set_modified(SystemTime::now());
+    }
+}
+
+fn remove_files(directory: &Path, should_remove: impl Fn(&str) -> bool) {
+    if let Ok(entries) = std::fs::read_dir(directory) {
+        for entry in entries.flatten() {
+            if should_remove(&entry.file_name().to_string_lossy()) {
+                let _ = std::fs::remove_file(entry.path());
+            }
+        }
+    }
+}
+
+fn evict_least_recent(directory: &Path, limit: usize) {
+    let Ok(entries) = std::fs::read_dir(directory) else {
+        return;
+    };
+    let mut files: Vec<(SystemTime, PathBuf)> = entries
+        .flatten()
+        .filter_map(|entry| Some((entry.metadata().ok()?.modified().ok()?, entry.path())))
+        .collect();
+    if files.len() <= limit {
+        return;
+    }
+
+    files.sort();
+    for (_, path) in &files[..files.len() - limit] {
+        let _ = std::fs::remove_file(path);
+    }
+}
+
+fn save(path: &Path, layer: &RgbaImage) {
+    let Some(directory) = path.parent() else {
+        return;
+    };
+    if std::fs::create_dir_all(directory).is_err() {
+        return;
+    }
+
+    // Write then rename so a partial file is never loaded
+    let partial = path.with_extension("partial");
+    if layer.save_with_format(&partial, ImageFormat::Png).is_ok() {
+        let _ = std::fs::rename(&partial, path);
+    }
+}
@@ -1,17 +1,23 @@
-use geometrize::{SamplingParams, geometrize};
 use image::{
-    DynamicImage, GrayAlphaImage, ImageBuffer, ImageReader, LumaA, RgbImage, Rgba, RgbaImage,
-    imageops,
+    DynamicImage, GrayAlphaImage, ImageBuffer, ImageReader, LumaA, Rgba, RgbaImage, imageops,
 };
 use pyo3::prelude::*;
+use pyo3::types::PyBytes;
 use rand::{RngExt, SeedableRng, rngs::SmallRng};
 use std::path::PathBuf;
+use std::sync::atomic::{AtomicBool, Ordering};
 
 use crate::misc::seed_from_image;
+use crate::profile::Stages;
 
+pub mod buffers;
+pub mod field;
 pub mod gradient;
+mod layers;
 pub mod misc;
 pub mod noise;
+pub mod pool;
+pub mod profile;
 
 type Color = [u8; 3];
 type Size = [u32; 2];
@@ -20,6 +26,8 @@ type Rect = [u32; 4];
 const CORNER_RADIUS_FRACTION: f32 = 20.0 / 600.0;
 const SPACING_DIVISOR: u32 = 100;
 const DROP_SHADOW_BLUR_RADIUS: u32 = 120;
+// The shadow extends this far past the foreground, 4 sigma of add_blur's gaussian
+const DROP_SHADOW_PADDING: u32 = DROP_SHADOW_BLUR_RADIUS * 2;
 
 #[derive(FromPyObject, Hash, PartialEq, Eq, Clone)]
 pub struct PythonImageBuffer {
@@ -28,19 +36,34 @@ pub struct PythonImageBuffer {
 }
 
 impl PythonImageBuffer {
+    // The buffer is RGB, converted straight into a pooled RGBA image
     fn to_image(&self) -> RgbaImage {
-        DynamicImage::from(
-            RgbImage::from_raw(self.size[0], self.size[1], self.buffer.clone()).unwrap(),
-        )
-        .to_rgba8()
+        let [width, height] = self.size;
+        assert_eq!(self.buffer.len(), width as usize * height as usize * 3);
+
+        let mut image = buffers::image_for_overwrite(width, height);
+        for (rgba, rgb) in image.chunks_exact_mut(4).zip(self.buffer.chunks_exact(3)) {
+            rgba[..3].copy_from_slice(rgb);
+            rgba[3] = 255;
+        }
+        image
     }
 }
 
+// An image placed at (x, y) on the display, compositing only touches this rectangle
+struct Layer {
+    image: RgbaImage,
+    x: i64,
+    y: i64,
+}
+
 #[derive(Debug)]
 pub struct AppPaths {
     default_wallpaper: PathBuf,
     generated_wallpaper: PathBuf,
     drop_shadow: PathBuf,
+    background_layers: PathBuf,
+    geometrize_layers: PathBuf,
 }
 
 impl From<String> for AppPaths {
@@ -51,6 +74,8 @@ impl From<String> for AppPaths {
             default_wallpaper: images_cache_dir.join("default_wallpaper.jpg"),
             generated_wallpaper: images_cache_dir.join("generated_wallpaper.png"),
             drop_shadow: images_cache_dir.join("drop_shadow.png"),
+            background_layers: images_cache_dir.join("background_layers"),
+            geometrize_layers: images_cache_dir.join("geometrize"),
         }
     }
 }
@@ -78,89 +103,301 @@ pub struct ForegroundConfig {
 pub struct BackgroundConfig {
     pub background_type: String,
     pub blur_radius: Option<u32>,
+    pub blur_quality: Option<String>,
     pub color1: Option<Color>,
     pub color2: Option<Color>,
     pub no_colors: Option<u16>,
     pub n_samples: Option<u32>,
 }
 
+// Details of a render that aren't in the image
+#[pyclass(frozen, get_all)]
+#[derive(Debug, Default, Clone)]
+pub struct RenderInfo {
+    // The background came from a layer cache, so the render time says nothing about
+    // the cost of fitting or blurring it
+    pub background_cached: bool,
+    // Stages may appear more than once, e.g. composite for each layer
+    pub stages: Stages,
+}
+
+// Reuse of the pooled render buffers since the module was loaded
+#[pyclass(frozen, get_all)]
+#[derive(Debug, Clone)]
+pub struct BufferPoolStats {
+    pub hits: u64,
+    pub misses: u64,
+    // Bytes held by free buffers now, and the most held at once
+    pub pooled_bytes: usize,
+    pub peak_bytes: usize,
+}
+
+#[pymethods]
+impl BufferPoolStats {
+    #[getter]
+    fn hit_rate(&self) -> f64 {
+        let requests = self.hits + self.misses;
+        if requests == 0 { 0.0 } else { self.hits as f64 / requests as f64 }
+    }
+}
+
+// Set from another thread to stop a render, it is checked between stages so a
+// stage in progress runs to completion
+#[pyclass(frozen)]
+#[derive(Debug, Default)]
+pub struct CancelToken {
+    cancelled: AtomicBool,
+}
+
+#[pymethods]
+impl CancelToken {
+    #[new]
+    fn new() -> Self {
+        Self::default()
+    }
+
+    pub fn cancel(&self) {
+        self.cancelled.store(true, Ordering::Relaxed);
+    }
+
+    #[getter]
+    pub fn cancelled(&self) -> bool {
+        self.cancelled.load(Ordering::Relaxed)
+    }
+}
+
+// Returns None from the enclosing function once the render is cancelled
+macro_rules! check_cancelled {
+    ($cancel:expr) => {
+        if $cancel.cancelled() {
+            return None;
+        }
+    };
+}
+
 #[pymodule]
 fn albumpaper_rs(module: &Bound<'_, PyModule>) -> PyResult<()> {
+    module.add_class::<RenderInfo>()?;
+    module.add_class::<CancelToken>()?;
+    module.add_class::<BufferPoolStats>()?;
     module.add_function(wrap_pyfunction!(generate_save_wallpaper, module)?)?;
+    module.add_function(wrap_pyfunction!(generate_wallpaper_rgba, module)?)?;
+    module.add_function(wrap_pyfunction!(clear_layer_caches, module)?)?;
+    module.add_function(wrap_pyfunction!(configure_render_pool, module)?)?;
+    module.add_function(wrap_pyfunction!(buffer_pool_stats, module)?)?;
+    module.add_function(wrap_pyfunction!(release_render_buffers, module)?)?;
     Ok(())
 }
 
+// Output: None if `cancel` was cancelled before the wallpaper was saved, the
+// previously generated wallpaper is then left as it was
+#[pyfunction]
+#[pyo3(signature = (config, cancel=None))]
+pub fn generate_save_wallpaper(
+    py: Python<'_>,
+    config: GenerationConfig,
+    cancel: Option<Py<CancelToken>>,
+) -> Option<RenderInfo> {
+    let app_paths = AppPaths::from(config.project_root.clone());
+    py.detach(|| {
+        let never = CancelToken::default();
+        let cancel = cancel.as_ref().map_or(&never, |token| token.get());
+
+        let (image, mut info) = generate_wallpaper_cancellable(config, &app_paths, cancel)?;
+        check_cancelled!(cancel);
+        profile::stage(&mut info.stages, "encode", || {
+            image.save(&app_paths.generated_wallpaper).unwrap();
+        });
+        buffers::recycle(image);
+        Some(info)
+    })
+}
+
+// Output: the size and RGBA pixels of the wallpaper, which isn't saved. Renders
+// without holding the GIL so several can run at once from Python threads
 #[pyfunction]
-pub fn generate_save_wallpaper(config: GenerationConfig) {
+pub fn generate_wallpaper_rgba(
+    py: Python<'_>,
+    config: GenerationConfig,
+) -> (Size, Bound<'_, PyBytes>) {
     let app_paths = AppPaths::from(config.project_root.clone());
-    let image = generate_wallpaper(config, &app_paths);
-    image.save(app_paths.generated_wallpaper).unwrap();
+    let image = py.detach(|| generate_wallpaper(config, &app_paths));
+    let pixels = PyBytes::new(py, image.as_raw());
+    let size = image.dimensions().into();
+    buffers::recycle(image);
+    (size, pixels)
+}
+
+#[pyfunction]
+pub fn clear_layer_caches(project_root: String) {
+    layers::clear(&AppPaths::from(project_root));
+    field::clear();
+    buffers::release();
+}
+
+// Frees the display sized buffers kept for the next render
+#[pyfunction]
+pub fn release_render_buffers() {
+    buffers::release();
+}
+
+#[pyfunction]
+pub fn buffer_pool_stats() -> BufferPoolStats {
+    let stats = buffers::stats();
+    BufferPoolStats {
+        hits: stats.hits,
+        misses: stats.misses,
+        pooled_bytes: stats.pooled_bytes,
+        peak_bytes: stats.peak_bytes,
+    }
+}
+
+// Output: the number of threads renders will use
+#[pyfunction]
+#[pyo3(signature = (max_threads=0, low_priority=true, cpu_share=1.0))]
+pub fn configure_render_pool(max_threads: usize, low_priority: bool, cpu_share: f32) -> usize {
+    pool::configure(pool::PoolSettings {
+        max_threads,
+        low_priority,
+        cpu_share,
+    });
+    pool::num_threads()
 }
 
 pub fn generate_wallpaper(config: GenerationConfig, app_paths: &AppPaths) -> RgbaImage {
-    let artwork = config.artwork.to_image();
+    generate_wallpaper_with_info(config, app_paths).0
+}
+
+pub fn generate_wallpaper_with_info(
+    config: GenerationConfig,
+    app_paths: &AppPaths,
+) -> (RgbaImage, RenderInfo) {
+    generate_wallpaper_cancellable(config, app_paths, &CancelToken::default()).unwrap()
+}
+
+// Output: None if `cancel` was cancelled during the render
+pub fn generate_wallpaper_cancellable(
+    config: GenerationConfig,
+    app_paths: &AppPaths,
+    cancel: &CancelToken,
+) -> Option<(RgbaImage, RenderInfo)> {
+    pool::install(|| render(config, app_paths, cancel))
+}
+
+fn render(
+    config: GenerationConfig,
+    app_paths: &AppPaths,
+    cancel: &CancelToken,
+) -> Option<(RgbaImage, RenderInfo)> {
+    let mut stages = Stages::new();
+    let artwork = profile::stage(&mut stages, "convert", || config.artwork.to_image());
+    check_cancelled!(cancel);
 
     // for reproducability
     let mut rng = SmallRng::seed_from_u64(seed_from_image(&artwork));
 
-    let mut base = RgbaImage::new(config.display_geometry[0], config.display_geometry[1]);
-
-    let background = generate_background(
+    let (background, background_cached) = generate_background(
         &artwork,
         config.background,
         config.display_geometry,
         config.foreground.artwork_size,
         &mut rng,
         app_paths,
-    );
+        &mut stages,
+        cancel,
+    )?;
+    check_cancelled!(cancel);
 
     let drop_shadow = config.foreground.drop_shadow;
-
-    // Background Paste
-    let [x, y] = center_position(
-        config.display_geometry,
-        background.dimensions().into(),
-        [0, 0],
-    );
-    imageops::overlay(&mut base, &background, x, y);
+    let display_geometry = config.display_geometry;
+
+    // Background Paste, a background that fills the display is used as the output as is
+    let mut base = profile::stage(&mut stages, "composite", || {
+        if background.dimensions() == display_geometry.into() {
+            background
+        } else {
+            let mut base = buffers::image(display_geometry[0], display_geometry[1]);
+            let [x, y] =
+                center_position(display_geometry, background.dimensions().into(), [0, 0]);
+            imageops::overlay(&mut base, &background, x, y);
+            buffers::recycle(background);
+            base
+        }
+    });
 
     if !config.foreground.show_artwork {
-        return base;
+        buffers::recycle(artwork);
+        return Some((base, RenderInfo { background_cached, stages }));
     }
+    check_cancelled!(cancel);
 
-    let foreground = generate_foreground(
-        artwork,
-        config.foreground,
-        config.display_geometry,
-        config.available_geometry,
-    );
+    let foreground = profile::stage(&mut stages, "foreground", || {
+        generate_foreground(
+            artwork,
+            config.foreground,
+            display_geometry,
+            config.available_geometry,
+        )
+    });
+
+    check_cancelled!(cancel);
 
     if drop_shadow {
-        let drop_shadow_path = &app_paths.drop_shadow;
-        let drop_shadow_image = ImageReader::open(drop_shadow_path)
-            .ok()
-            .and_then(|r| r.decode().ok())
-            .map(|img| img.to_rgba8())
-            .unwrap_or_else(|| {
-                let shadow = generate_drop_shadow(&foreground, &mut rng);
-                shadow.save(drop_shadow_path).unwrap();
-                shadow
-            });
-        imageops::overlay(&mut base, &drop_shadow_image, 0, 0);
+        let shadow = profile::stage(&mut stages, "drop_shadow", || {
+            drop_shadow_layer(&foreground, &mut rng, app_paths)
+        });
+        profile::stage(&mut stages, "composite", || {
+            imageops::overlay(&mut base, &shadow.image, shadow.x, shadow.y);
+        });
+        buffers::recycle(shadow.image);
     }
 
-    imageops::overlay(&mut base, &foreground, 0, 0);
+    profile::stage(&mut stages, "composite", || {
+        imageops::overlay(&mut base, &foreground.image, foreground.x, foreground.y);
+    });
+    buffers::recycle(foreground.image);
 
-    base
+    Some((base, RenderInfo { background_cached, stages }))
 }
 
-fn generate_drop_shadow(foreground: &RgbaImage, rng: &mut SmallRng) -> RgbaImage {
-    let (width, height) = foreground.dimensions();
+fn drop_shadow_layer(foreground: &Layer, rng: &mut SmallRng, app_paths: &AppPaths) -> Layer {
+    let (width, height) = foreground.image.dimensions();
+    let size = (width + 2 * DROP_SHADOW_PADDING, height + 2 * DROP_SHADOW_PADDING);
+
+    let drop_shadow_path = &app_paths.drop_shadow;
+    let image = ImageReader::open(drop_shadow_path)
+        .ok()
+        .and_then(|r| r.decode().ok())
+        .map(|img| img.to_rgba8())
+        // A cached shadow for a different foreground size
+        .filter(|img| img.dimensions() == size)
+        .unwrap_or_else(|| {
+            let shadow = generate_drop_shadow(&foreground.image, rng);
+            shadow.save(drop_shadow_path).unwrap();
+            shadow
+        });
 
-    let mask = GrayAlphaImage::from_fn(width, height, |x, y| {
-        let rgba_pixel = foreground.get_pixel(x, y);
+    Layer {
+        image,
+        x: foreground.x - i64::from(DROP_SHADOW_PADDING),
+        y: foreground.y - i64::from(DROP_SHADOW_PADDING),
+    }
+}
 
-        LumaA([0u8, rgba_pixel[3]])
+fn generate_drop_shadow(foreground: &RgbaImage, rng: &mut SmallRng) -> RgbaImage {
+    let (width, height) = foreground.dimensions();
+    let padding = DROP_SHADOW_PADDING;
+
+    let mask = GrayAlphaImage::from_fn(width + 2 * padding, height + 2 * padding, |x, y| {
+        let inside = (padding..padding + width).contains(&x)
+            && (padding..padding + height).contains(&y);
+        let alpha = if inside {
+            foreground.get_pixel(x - padding, y - padding)[3]
+        } else {
+            0
+        };
+
+        LumaA([0u8, alpha])
     });
 
     let drop_shadow =
@@ -170,6 +407,11 @@ fn generate_drop_shadow(foreground: &RgbaImage, rng: &mut SmallRng) -> RgbaImage
         ImageBuffer::from_fn(drop_shadow.width(), drop_shadow.height(), |x: u32, y| {
             let pixel = drop_shadow.get_pixel(x, y);
 
+            // Fully transparent pixels are left alone so the layer has no visible edge
+            if pixel[1] == 0 {
+                return LumaA([0u8, 0]);
+            }
+
             let alpha_8_floor = pixel[1] as i32;
             let noise = rng.random_range(-3..=3);
             let dithered = (alpha_8_floor + noise).clamp(0, 255);
@@ -180,6 +422,8 @@ fn generate_drop_shadow(foreground: &RgbaImage, rng: &mut SmallRng) -> RgbaImage
     DynamicImage::from(dithered_drop_shadow).to_rgba8()
 }
 
+// Output: the background and whether it came from a layer cache, None if cancelled
+#[allow(clippy::too_many_arguments)]
 fn generate_background(
     artwork: &RgbaImage,
     background_config: BackgroundConfig,
@@ -187,70 +431,96 @@ fn generate_background(
     artwork_size: u32,
     rng: &mut SmallRng,
     app_paths: &AppPaths,
-) -> RgbaImage {
+    stages: &mut Stages,
+    cancel: &CancelToken,
+) -> Option<(RgbaImage, bool)> {
+    let blur_quality = misc::BlurQuality::from_name(background_config.blur_quality.as_deref());
+
+    if background_config.background_type == "defaultwallpaper" {
+        // Resized and blurred inside the layer cache
+        return Some(profile::stage(stages, "background", || {
+            layers::default_wallpaper(
+                display_geometry,
+                background_config.blur_radius.map(|radius| (radius, blur_quality)),
+                app_paths,
+            )
+        }));
+    }
+
+    if let (Some(radius), misc::BlurQuality::Fast, "albumart") = (
+        background_config.blur_radius,
+        blur_quality,
+        background_config.background_type.as_str(),
+    ) {
+        // Straight from the artwork, skipping the upscale to the display
+        let background = profile::stage(stages, "blur", || {
+            misc::blur_fast(artwork, radius, display_geometry)
+        });
+        return Some((background, false));
+    }
+
     let [width, height] = display_geometry;
     let resized_artwork = || misc::fast_resize(artwork, width, height);
 
-    let background = match background_config.background_type.as_ref() {
-        "solidcolor" => {
-            let [r, g, b] = background_config.color1.unwrap();
-            RgbaImage::from_pixel(width, height, Rgba([r, g, b, 255]))
-        }
-        "lineargradient" => DynamicImage::from(gradient::linear(
-            display_geometry,
-            background_config.color1.unwrap(),
-            background_config.color2.unwrap(),
-        ))
-        .to_rgba8(),
-        "radialgradient" => DynamicImage::from(gradient::radial(
-            display_geometry,
-            background_config.color1.unwrap(),
-            background_config.color2.unwrap(),
-            artwork_size,
-        ))
-        .to_rgba8(),
-        "colorednoise" => {
-            let seed: u32 = rng.random();
-            DynamicImage::from(noise::colored(
+    let mut cached = false;
+    let stage = match background_config.background_type.as_ref() {
+        "albumart" => "resize",
+        _ => "background",
+    };
+    let background = profile::stage(stages, stage, || {
+        match background_config.background_type.as_ref() {
+            "solidcolor" => {
+                let [r, g, b] = background_config.color1.unwrap();
+                let mut image = buffers::image_for_overwrite(width, height);
+                for pixel in image.pixels_mut() {
+                    *pixel = Rgba([r, g, b, 255]);
+                }
+                image
+            }
+            "lineargradient" => gradient::linear(
                 display_geometry,
                 background_config.color1.unwrap(),
                 background_config.color2.unwrap(),
-                background_config.no_colors.unwrap(),
-                seed,
-            ))
-            .to_rgba8()
-        }
-        "lowpoly" => geometrize(
-            DynamicImage::from(resized_artwork()),
-            geometrize::Style::Lowpoly,
-            background_config.n_samples.unwrap(),
-            SamplingParams::default(),
-        )
-        .unwrap(),
-        "pointillist" => geometrize(
-            DynamicImage::from(resized_artwork()),
-            geometrize::Style::Pointillist { noise: 0.3 },
-            background_config.n_samples.unwrap(),
-            SamplingParams::default(),
-        )
-        .unwrap(),
-        "albumart" => resized_artwork(),
-        "defaultwallpaper" => {
-            let default_wallpaper = ImageReader::open(&app_paths.default_wallpaper)
-                .unwrap()
-                .decode()
-                .unwrap()
-                .to_rgba8();
-            misc::resize_default_wallpaper(default_wallpaper, display_geometry, app_paths)
+            ),
+            "radialgradient" => gradient::radial(
+                display_geometry,
+                background_config.color1.unwrap(),
+                background_config.color2.unwrap(),
+                artwork_size,
+            ),
+            "colorednoise" => {
+                let seed: u32 = rng.random_range(0..noise::SEEDS);
+                noise::colored(
+                    display_geometry,
+                    background_config.color1.unwrap(),
+                    background_config.color2.unwrap(),
+                    background_config.no_colors.unwrap(),
+                    seed,
+                )
+            }
+            background_type @ ("lowpoly" | "pointillist") => {
+                let (layer, hit) = layers::geometrize_background(
+                    artwork,
+                    background_type,
+                    background_config.n_samples.unwrap(),
+                    display_geometry,
+                    app_paths,
+                );
+                cached = hit;
+                layer
+            }
+            "albumart" => resized_artwork(),
+            unknown => panic!("Unknown background type '{unknown}'"),
         }
-        unknown => panic!("Unknown background type '{unknown}'"),
-    };
+    });
 
-    if let Some(radius) = background_config.blur_radius {
-        misc::add_blur(DynamicImage::from(background), radius).to_rgba8()
+    let background = if let Some(radius) = background_config.blur_radius {
+        check_cancelled!(cancel);
+        profile::stage(stages, "blur", || misc::blur(background, radius, blur_quality))
     } else {
         background
-    }
+    };
+    Some((background, cached))
 }
 
 fn generate_foreground(
@@ -258,7 +528,7 @@ fn generate_foreground(
     foreground_config: ForegroundConfig,
     display_geometry: Size,
     available_geometry: Rect,
-) -> RgbaImage {
+) -> Layer {
     let ForegroundConfig {
         artwork_size,
         rounded_corners,
@@ -272,11 +542,8 @@ fn generate_foreground(
         }
     };
 
-    // create transparent base
-    let mut base =
-        RgbaImage::from_pixel(display_geometry[0], display_geometry[1], Rgba([0, 0, 0, 0]));
-
     let mut artwork_resized = misc::fast_resize(&artwork, artwork_size, artwork_size);
+    buffers::recycle(artwork);
 
     apply_rounded_corners(&mut artwork_resized);
 
@@ -294,16 +561,24 @@ fn generate_foreground(
         [off_x as i64, off_y as i64],
     );
 
-    imageops::overlay(&mut base, &artwork_resized, x, y);
-
-    if let Some(buffer) = spotify_code {
-        let y_code = y + i64::from(artwork_size + spacing);
-        let mut code_image = buffer.to_image();
-        apply_rounded_corners(&mut code_image);
-        imageops::overlay(&mut base, &code_image, x, y_code)
-    }
+    let image = match spotify_code {
+        None => artwork_resized,
+        Some(buffer) => {
+            let mut code_image = buffer.to_image();
+            apply_rounded_corners(&mut code_image);
+
+            // Transparent base just big enough for the artwork and code, the two don't
+            // overlap so they are copied rather than blended
+            let width = artwork_size.max(code_image.width());
+            let mut base = RgbaImage::new(width, foreground_height);
+            imageops::replace(&mut base, &artwork_resized, 0, 0);
+            imageops::replace(&mut base, &code_image, 0, i64::from(artwork_size + spacing));
+            buffers::recycle(artwork_resized);
+            base
+        }
+    };
 
-    base
+    Layer { image, x, y }
 }
 
 fn center_position(container: Size, content: [u32; 2], offset: [i64; 2]) -> [i64; 2] {
@@ -1,28 +1,111 @@
-use fast_image_resize::{ResizeOptions, Resizer};
+use fast_image_resize::ResizeOptions;
 use image::{DynamicImage, RgbaImage};
 use libblur::{
     ConvolutionMode, EdgeMode, EdgeMode2D, GaussianBlurParams, ThreadingPolicy, gaussian_blur_image,
 };
 
 pub fn fast_resize(src_image: &RgbaImage, nwidth: u32, nheight: u32) -> RgbaImage {
-    let mut dst_image = RgbaImage::new(nwidth, nheight);
-
-    let mut resizer = Resizer::new();
-    resizer
-        .resize(
-            src_image,
-            &mut dst_image,
-            &ResizeOptions::new()
-                .resize_alg(fast_image_resize::ResizeAlg::Convolution(
-                    fast_image_resize::FilterType::Lanczos3,
-                ))
-                .fit_into_destination(None)
-                .use_alpha(true),
-        )
-        .unwrap();
+    // Every pixel is written by the resize
+    let mut dst_image = crate::buffers::image_for_overwrite(nwidth, nheight);
+
+    crate::buffers::with_resizer(|resizer| {
+        resizer
+            .resize(
+                src_image,
+                &mut dst_image,
+                &ResizeOptions::new()
+                    .resize_alg(fast_image_resize::ResizeAlg::Convolution(
+                        fast_image_resize::FilterType::Lanczos3,
+                    ))
+                    .fit_into_destination(None)
+                    .use_alpha(true),
+            )
+            .unwrap();
+    });
     dst_image
 }
 
+// The fast blur downscales until sigma is this many pixels, enough for the
+// gaussian to stay smooth once upscaled again
+const FAST_BLUR_SIGMA: f64 = 3.0;
+
+#[derive(Clone, Copy, PartialEq, Eq, Hash, Debug, Default)]
+pub enum BlurQuality {
+    // Full resolution with a kernel as large as the image
+    #[default]
+    Exact,
+    // Reduced resolution scaled to the sigma, with a kernel bounded to 3 sigma
+    Fast,
+}
+
+impl BlurQuality {
+    pub fn from_name(name: Option<&str>) -> Self {
+        match name {
+            None | Some("exact") => Self::Exact,
+            Some("fast") => Self::Fast,
+            Some(unknown) => panic!("Unknown blur quality '{unknown}'"),
+        }
+    }
+
+    pub fn name(self) -> &'static str {
+        match self {
+            Self::Exact => "exact",
+            Self::Fast => "fast",
+        }
+    }
+}
+
+// As many threads as the pool the render runs on, libblur's Adaptive policy would use
+// every core
+fn blur_threading() -> ThreadingPolicy {
+    ThreadingPolicy::Fixed(rayon::current_num_threads())
+}
+
+pub fn blur(image: RgbaImage, blur_radius: u32, quality: BlurQuality) -> RgbaImage {
+    match quality {
+        BlurQuality::Exact => add_blur(DynamicImage::from(image), blur_radius).into_rgba8(),
+        BlurQuality::Fast => {
+            let size = image.dimensions().into();
+            let blurred = blur_fast(&image, blur_radius, size);
+            crate::buffers::recycle(image);
+            blurred
+        }
+    }
+}
+
+// Blurs `image` as if it were first resized to `size`, by resizing it to a fraction
+// of `size`, blurring that with a proportionally smaller sigma and upscaling
+pub fn blur_fast(image: &RgbaImage, blur_radius: u32, size: [u32; 2]) -> RgbaImage {
+    let [width, height] = size;
+    let sigma = blur_radius as f64 / 2.0;
+    let scale = (sigma / FAST_BLUR_SIGMA).floor().max(1.0);
+
+    let small_width = ((width as f64 / scale).round() as u32).max(1);
+    let small_height = ((height as f64 / scale).round() as u32).max(1);
+    let small = fast_resize(image, small_width, small_height);
+
+    let small_sigma = sigma * small_width as f64 / width as f64;
+    let kernel_size = 2 * (3.0 * small_sigma).ceil() as u32 + 1;
+
+    let blurred = gaussian_blur_image(
+        DynamicImage::from(small),
+        GaussianBlurParams::new(kernel_size, small_sigma),
+        EdgeMode2D::new(EdgeMode::Clamp),
+        ConvolutionMode::Exact,
+        blur_threading(),
+    )
+    .unwrap()
+    .into_rgba8();
+
+    if blurred.dimensions() == (width, height) {
+        blurred
+    } else {
+        let resized = fast_resize(&blurred, width, height);
+        crate::buffers::recycle(blurred);
+        resized
+    }
+}
+
 pub fn add_blur(image: DynamicImage, blur_radius: u32) -> DynamicImage {
     let sigma = blur_radius as f64 / 2.0;
 
@@ -35,7 +118,7 @@ pub fn add_blur(image: DynamicImage, blur_radius: u32) -> DynamicImage {
         GaussianBlurParams::new(kernel_size, sigma),
         EdgeMode2D::new(EdgeMode::Clamp),
         ConvolutionMode::Exact,
-        ThreadingPolicy::Adaptive,
+        blur_threading(),
     )
     .unwrap()
 }
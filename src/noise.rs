@@ -1,16 +1,27 @@
-use colorgrad::{Color, Gradient, LinearGradient};
-use image::RgbImage;
+use colorgrad::{Color, LinearGradient};
+use image::RgbaImage;
 use noise::NoiseFn;
-use rayon::prelude::*;
+
+use crate::field::{self, FieldKind, Lut, ScalarField};
+
+// Noise patterns to pick from, each one's field is cached so only a few are in use
+pub const SEEDS: u32 = 4;
 
 // taken from https://github.com/mazznoer/colorgrad-rs#colored-noise
-pub fn colored(geometry: [u32; 2], color1: [u8; 3], color2: [u8; 3], no_colors:u16, seed: u32) -> RgbImage {
-    // Map t which is in range [a, b] to range [c, d]
-    let remap = |t: f32, a: f32, b: f32, c: f32, d: f32| (t - a) * ((d - c) / (b - a)) + c;
+pub fn colored(geometry: [u32; 2], color1: [u8; 3], color2: [u8; 3], no_colors:u16, seed: u32) -> RgbaImage {
+    let field = field::cached(FieldKind::Noise { seed }, geometry, || {
+        // Map t which is in range [a, b] to range [c, d]
+        let remap = |t: f32, a: f32, b: f32, c: f32, d: f32| (t - a) * ((d - c) / (b - a)) + c;
 
-    let [width, height] = geometry;
+        let [width, height] = geometry;
+        let scale = 7.5 / width.min(height) as f64;
+        let ns = noise::OpenSimplex::new(seed);
 
-    let scale = 7.5 / width.min(height) as f64;
+        ScalarField::from_fn(geometry, |x, y| {
+            let t = ns.get([x as f64 * scale, y as f64 * scale]) as f32;
+            remap(t, -0.5, 0.5, 0.0, 1.0)
+        })
+    });
 
     let grad = colorgrad::GradientBuilder::new()
         .colors(&[
@@ -21,24 +32,5 @@ pub fn colored(geometry: [u32; 2], color1: [u8; 3], color2: [u8; 3], no_colors:u
         .unwrap()
         .sharp(no_colors, 0.1);
 
-    let ns = noise::OpenSimplex::new(seed);
-    let mut imgbuf = RgbImage::new(width, height);
-
-    imgbuf
-        .par_chunks_exact_mut(3 * width as usize)
-        .enumerate()
-        .for_each(|(y, row)| {
-            for x in 0..geometry[0] {
-                let pixel_pos = (x * 3) as usize;
-                let pixel = &mut row[pixel_pos..(pixel_pos + 3)];
-
-                let t = ns.get([x as f64 * scale, y as f64 * scale]) as f32;
-                let rgba = grad.at(remap(t, -0.5, 0.5, 0.0, 1.0)).to_rgba8();
-                pixel[0] = rgba[0];
-                pixel[1] = rgba[1];
-                pixel[2] = rgba[2];
-            }
-        });
-
-    imgbuf
+    field::colorize(&field, &Lut::new(&grad), false)
 }
@@ -0,0 +1,81 @@
+//! The thread pool renders run on, instead of rayon's global pool which uses every
+//! core at normal priority. Bounded so a render doesn't starve games and calls
+
+use std::sync::{Arc, Mutex};
+
+use rayon::{ThreadPool, ThreadPoolBuilder};
+use thread_priority::{ThreadPriority, set_current_thread_priority};
+
+#[derive(Clone, Copy, PartialEq, Debug)]
+pub struct PoolSettings {
+    // 0 for one per core
+    pub max_threads: usize,
+    pub low_priority: bool,
+    // Fraction of the cores renders may use, from 0 to 1
+    pub cpu_share: f32,
+}
+
+impl Default for PoolSettings {
+    fn default() -> Self {
+        PoolSettings {
+            max_threads: 0,
+            low_priority: true,
+            cpu_share: 1.0,
+        }
+    }
+}
+
+impl PoolSettings {
+    // The CPU share is capped by the thread count, a thread can use at most one core
+    pub fn num_threads(self) -> usize {
+        let cores = std::thread::available_parallelism().map_or(1, |n| n.get());
+        let share = (cores as f32 * self.cpu_share.clamp(0.0, 1.0)).ceil() as usize;
+        let max_threads = if self.max_threads == 0 { cores } else { self.max_threads };
+        share.min(max_threads).max(1)
+    }
+
+    fn build(self) -> ThreadPool {
+        let low_priority = self.low_priority;
+        ThreadPoolBuilder::new()
+            .num_threads(self.num_threads())
+            .thread_name(|i| format!("albumpaper-render-{i}"))
+            .start_handler(move |_| {
+                if low_priority {
+                    // Best effort, renders still run at normal priority if it isn't allowed
+                    let _ = set_current_thread_priority(ThreadPriority::Min);
+                }
+            })
+            .build()
+            .unwrap()
+    }
+}
+
+// Built on first use, replaced when the settings change. A render in progress keeps
+// the pool it started on
+static POOL: Mutex<Option<(PoolSettings, Arc<ThreadPool>)>> = Mutex::new(None);
+
+pub fn configure(settings: PoolSettings) {
+    let mut pool = POOL.lock().unwrap();
+    if pool.as_ref().is_some_and(|(current, _)| *current == settings) {
+        return;
+    }
+    *pool = Some((settings, Arc::new(settings.build())));
+}
+
+fn current() -> Arc<ThreadPool> {
+    let mut pool = POOL.lock().unwrap();
+    let (_, pool) = pool.get_or_insert_with(|| {
+        let settings = PoolSettings::default();
+        (settings, Arc::new(settings.build()))
+    });
+    Arc::clone(pool)
+}
+
+pub fn num_threads() -> usize {
+    current().current_num_threads()
+}
+
+// Runs `f` on the render pool, rayon's parallel iterators in `f` use its threads
+pub fn install<T: Send>(f: impl FnOnce() -> T + Send) -> T {
+    current().install(f)
+}
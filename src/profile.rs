@@ -0,0 +1,52 @@
+//! Per stage timings and allocations of a render, so they can be reported without
+//! a native profiler
+
+use std::alloc::{GlobalAlloc, Layout, System};
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::Instant;
+
+// Bytes allocated by the library since it was loaded, on any thread
+static ALLOCATED: AtomicU64 = AtomicU64::new(0);
+
+pub struct CountingAllocator;
+
+unsafe impl GlobalAlloc for CountingAllocator {
+    unsafe fn alloc(&self, layout: Layout) -> *mut u8 {
+        ALLOCATED.fetch_add(layout.size() as u64, Ordering::Relaxed);
+        unsafe { System.alloc(layout) }
+    }
+
+    unsafe fn alloc_zeroed(&self, layout: Layout) -> *mut u8 {
+        ALLOCATED.fetch_add(layout.size() as u64, Ordering::Relaxed);
+        unsafe { System.alloc_zeroed(layout) }
+    }
+
+    unsafe fn realloc(&self, ptr: *mut u8, layout: Layout, new_size: usize) -> *mut u8 {
+        let grown = new_size.saturating_sub(layout.size());
+        ALLOCATED.fetch_add(grown as u64, Ordering::Relaxed);
+        unsafe { System.realloc(ptr, layout, new_size) }
+    }
+
+    unsafe fn dealloc(&self, ptr: *mut u8, layout: Layout) {
+        unsafe { System.dealloc(ptr, layout) }
+    }
+}
+
+#[global_allocator]
+static GLOBAL: CountingAllocator = CountingAllocator;
+
+// (stage, milliseconds, bytes allocated) in the order the stages ran
+pub type Stages = Vec<(String, f64, u64)>;
+
+// Times `f` as `name`, allocations on rayon threads during the stage are included
+pub fn stage<T>(stages: &mut Stages, name: &str, f: impl FnOnce() -> T) -> T {
+    let allocated = ALLOCATED.load(Ordering::Relaxed);
+    let start = Instant::now();
+    let output = f();
+    stages.push((
+        name.to_owned(),
+        start.elapsed().as_secs_f64() * 1000.0,
+        ALLOCATED.load(Ordering::Relaxed) - allocated,
+    ));
+    output
+}